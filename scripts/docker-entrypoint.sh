@@ -21,6 +21,11 @@ fi
 echo "Starting collectstatic"
 python manage.py collectstatic --noinput
 
+if [ "x$DJANGO_IMPORT_WORKER" = 'xon' ]; then
+    echo "Starting import worker"
+    python manage.py imovel_import_worker &
+fi
+
 echo "Starting uwsgi"
 uwsgi --socket :8000 --master --enable-threads --processes 5 --module eventtracker.wsgi
 
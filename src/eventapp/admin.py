@@ -1,9 +1,10 @@
 from django.contrib import admin
 
-from eventapp.models import (Activity, Imovel, ImovelUpdateLog, Notice,
-                             NoticeAppeal, NoticeColor, NoticeEvent,
-                             NoticeEventType, NoticeEventTypeFile, NoticeFine,
-                             Profile, ReportEvent, ReportEventType,
+from eventapp.models import (Activity, CepCache, Imovel, ImovelChange,
+                             ImovelConflict, ImovelUpdateJob, ImovelUpdateLog,
+                             ImovelUpload, Notice, NoticeAppeal, NoticeColor,
+                             NoticeEvent, NoticeEventType, NoticeEventTypeFile,
+                             NoticeFine, Profile, ReportEvent, ReportEventType,
                              SurveyEvent, SurveyEventType)
 
 admin.site.register(Profile)
@@ -16,6 +17,39 @@ class ImovelAdmin(admin.ModelAdmin):
 
 admin.site.register(Imovel, ImovelAdmin)
 admin.site.register(ImovelUpdateLog)
+admin.site.register(ImovelUpdateJob)
+
+
+class ImovelUploadAdmin(admin.ModelAdmin):
+    list_display = ("filename", "state", "received", "size", "owner", "created")
+    list_filter = ("state",)
+
+
+admin.site.register(ImovelUpload, ImovelUploadAdmin)
+
+
+class ImovelConflictAdmin(admin.ModelAdmin):
+    list_display = ("log", "resolucao", "perdedor_id", "vencedor_id", "campo")
+    list_filter = ("resolucao",)
+
+
+admin.site.register(ImovelConflict, ImovelConflictAdmin)
+
+
+class ImovelChangeAdmin(admin.ModelAdmin):
+    list_display = ("imovel", "log", "created")
+    raw_id_fields = ("imovel", "log")
+
+
+admin.site.register(ImovelChange, ImovelChangeAdmin)
+
+
+class CepCacheAdmin(admin.ModelAdmin):
+    list_display = ("logradouro", "numero", "bairro", "cep", "hits", "misses", "expires")
+    search_fields = ["logradouro", "cep"]
+
+
+admin.site.register(CepCache, CepCacheAdmin)
 
 
 class NoticeAdmin(admin.ModelAdmin):
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class EventappConfig(AppConfig):
     name = "eventapp"
+
+    def ready(self):
+        from django.db.models import CharField, TextField
+
+        from eventapp.lookups import ImmutableUnaccent
+
+        CharField.register_lookup(ImmutableUnaccent)
+        TextField.register_lookup(ImmutableUnaccent)
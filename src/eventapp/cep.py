@@ -0,0 +1,430 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.functions import Length
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+from eventapp.models import CepCache, Imovel
+from eventapp.utils import text_to_id
+
+logger = logging.getLogger(__name__)
+
+CORREIOS_URL = (
+    "https://buscacepinter.correios.com.br"
+    "/app"
+    "/localidade_logradouro"
+    "/carrega-localidade-logradouro.php"
+)
+
+BATCH_SIZE = 500
+CEP_MIN_LENGTH = 8
+
+
+def clean_logradouro(logradouro) -> str:
+    if not logradouro:
+        return ""
+    logradouro = logradouro.lower().strip()
+    if logradouro.startswith("r."):
+        logradouro = logradouro.replace("r.", "", 1).strip()
+    if logradouro.startswith("av."):
+        logradouro = logradouro.replace("av.", "", 1).strip()
+    if logradouro.endswith("bc."):
+        logradouro = "".join(logradouro.rsplit("bc.", 1)).strip()
+    if logradouro.endswith("jr"):
+        logradouro = "".join(logradouro.rsplit("jr", 1)).strip()
+    if logradouro.startswith("trav."):
+        logradouro = logradouro.replace("trav.", "", 1).strip()
+    if logradouro.endswith("rod."):
+        logradouro = "".join(logradouro.rsplit("rod.", 1)).strip()
+    if logradouro.endswith("bc"):
+        logradouro = "".join(logradouro.rsplit("bc", 1)).strip()
+    return logradouro
+
+
+def clean_numero(numero) -> str:
+    if not numero:
+        return ""
+    numero = numero.lower().strip()
+    if numero.startswith("n"):
+        numero = numero.replace("n", "", 1).strip()
+    if numero == "s/n":
+        numero = ""
+    return numero
+
+
+def normalize_address(logradouro, numero, bairro) -> tuple:
+    """
+    Chave do CepCache para um endereço
+    :returns: (logradouro, numero, bairro) normalizados
+    """
+    return (
+        clean_logradouro(logradouro),
+        clean_numero(numero),
+        text_to_id(bairro or ""),
+    )
+
+
+def choose_cep(dados: list, bairro):
+    """
+    Escolhe o CEP entre os resultados da busca, como era feito na importação
+    :param dados: lista de resultados, cada um com "cep" e "bairro"
+    :param bairro: bairro do imóvel
+    :returns: o CEP, ou None se a busca for ambígua ou vazia
+    """
+    if len(dados) == 1:
+        return dados[0]["cep"]
+    ceps = [
+        cep_data["cep"]
+        for cep_data in dados
+        if text_to_id(bairro) == text_to_id(cep_data["bairro"])
+    ]
+    if len(ceps) == 1:
+        return ceps[0]
+    return None
+
+
+class CepBackend:
+    """
+    Fonte de CEPs usada pelo CepEnricher.
+    lookup() recebe o endereço já limpo e retorna a lista de resultados,
+    cada um um dict com "cep" e "bairro".
+    """
+
+    def lookup(self, logradouro: str, numero: str) -> list:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CorreiosBackend(CepBackend):
+    def __init__(self, timeout=None, pool_size=None):
+        self.timeout = timeout or settings.CEP_TIMEOUT
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size or settings.CEP_WORKERS,
+        )
+        self.session.mount("https://", adapter)
+
+    def lookup(self, logradouro: str, numero: str) -> list:
+        data = {
+            "uf": "SC",
+            "localidade": "Itajai",
+            "logradouro": logradouro,
+            "numeroLogradouro": numero,
+            "tipologradouro": "",
+        }
+        r = self.session.post(CORREIOS_URL, data=data, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()["dados"]
+
+    def close(self):
+        self.session.close()
+
+
+class StubBackend(CepBackend):
+    """
+    Backend local, para testes e execuções sem acesso aos Correios.
+    Os dados vêm do parâmetro data ou do JSON em settings.CEP_STUB_FILE,
+    uma lista de {"logradouro", "numero", "bairro", "cep"}.
+    """
+
+    def __init__(self, data=None, **kwargs):
+        if data is None:
+            data = []
+            if settings.CEP_STUB_FILE:
+                with open(settings.CEP_STUB_FILE, encoding="utf8") as f:
+                    data = json.load(f)
+        self.data = {}
+        for entry in data:
+            key = (
+                clean_logradouro(entry.get("logradouro")),
+                clean_numero(entry.get("numero")),
+            )
+            self.data.setdefault(key, []).append(
+                {"cep": entry["cep"], "bairro": entry.get("bairro") or ""}
+            )
+
+    def lookup(self, logradouro: str, numero: str) -> list:
+        return self.data.get((logradouro, numero), [])
+
+
+def get_backend(**kwargs) -> CepBackend:
+    return import_string(settings.CEP_BACKEND)(**kwargs)
+
+
+class RateLimiter:
+    """Limita as requisições a rate por segundo, entre todas as threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate and rate > 0 else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CepCacheStore:
+    """
+    Cache persistente dos CEPs já buscados, na tabela CepCache.
+    Guarda também as buscas sem CEP único (cache negativo), que expiram antes.
+    hits e misses contam as consultas desta instância, os campos de mesmo
+    nome no CepCache acumulam os totais de cada endereço.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self, keys, **filters) -> dict:
+        entries = CepCache.objects.filter(
+            logradouro__in={key[0] for key in keys}, **filters
+        )
+        return {
+            (entry.logradouro, entry.numero, entry.bairro): entry
+            for entry in entries
+            if (entry.logradouro, entry.numero, entry.bairro) in keys
+        }
+
+    def get_many(self, keys) -> dict:
+        """
+        :param keys: endereços normalizados, ver normalize_address
+        :returns: dict endereço => CepCache, só com as entradas válidas
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+        found = self._entries(keys, expires__gt=timezone.now())
+        if found:
+            CepCache.objects.filter(
+                id__in=[entry.id for entry in found.values()]
+            ).update(hits=F("hits") + 1)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, results: dict):
+        """
+        :param results: dict endereço normalizado => (cep, dados)
+        """
+        if not results:
+            return
+        now = timezone.now()
+        existing = self._entries(set(results))
+        changed = []
+        new = []
+        for key, (cep, dados) in results.items():
+            if cep:
+                expires = now + timedelta(days=settings.CEP_CACHE_TTL)
+            else:
+                expires = now + timedelta(days=settings.CEP_CACHE_NEGATIVE_TTL)
+            entry = existing.get(key)
+            if entry:
+                entry.cep = cep or ""
+                entry.dados = dados
+                entry.expires = expires
+                entry.misses += 1
+                entry.updated = now
+                changed.append(entry)
+            else:
+                new.append(
+                    CepCache(
+                        logradouro=key[0],
+                        numero=key[1],
+                        bairro=key[2],
+                        cep=cep or "",
+                        dados=dados,
+                        misses=1,
+                        expires=expires,
+                    )
+                )
+        if changed:
+            CepCache.objects.bulk_update(
+                changed, ["cep", "dados", "expires", "misses", "updated"]
+            )
+        if new:
+            CepCache.objects.bulk_create(new, ignore_conflicts=True)
+
+    def set(self, key, cep, dados):
+        self.set_many({key: (cep, dados)})
+
+
+def missing_cep_queryset():
+    # os inativos saíram do cadastro, não adianta buscar
+    return Imovel.objects.annotate(cep_length=Length("cep")).filter(
+        Q(cep__isnull=True) | Q(cep_length__lt=CEP_MIN_LENGTH), ativo=True
+    )
+
+
+class CepEnricher:
+    """
+    Preenche o CEP dos imóveis que não têm, depois da importação.
+    Os imóveis são lidos em lotes e agrupados por endereço normalizado: primeiro
+    consulta o CepCache, depois o CEP de outro imóvel no mesmo endereço, e o
+    restante é buscado no backend por um pool de threads, com limite de
+    requisições por segundo e novas tentativas. As respostas vão para o cache.
+    """
+
+    def __init__(
+        self,
+        backend: CepBackend = None,
+        workers=None,
+        rate=None,
+        retries=None,
+        batch_size=BATCH_SIZE,
+    ):
+        self.workers = workers or settings.CEP_WORKERS
+        self.backend = backend or get_backend(pool_size=self.workers)
+        self.limiter = RateLimiter(
+            settings.CEP_RATE_LIMIT if rate is None else rate
+        )
+        self.retries = settings.CEP_RETRIES if retries is None else retries
+        self.batch_size = batch_size
+        self.cache = CepCacheStore()
+
+        self.total = 0
+        self.copiados = 0
+        self.encontrados = 0
+        self.sem_resultado = 0
+        self.falhas = 0
+
+    def lookup(self, logradouro, numero):
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                return self.backend.lookup(logradouro, numero)
+            except (requests.RequestException, ValueError, KeyError) as ex:
+                if attempt == self.retries:
+                    raise
+                logger.warning(ex)
+                time.sleep(0.5 * 2 ** attempt)
+
+    def resolve(self, key, bairro):
+        try:
+            dados = self.lookup(key[0], key[1])
+        except Exception as ex:
+            logger.error(f"CEP: falha ao buscar {key}: {ex}")
+            return key, None, None, False
+        return key, choose_cep(dados, bairro), dados, True
+
+    def known_ceps(self, addresses) -> dict:
+        known = {}
+        rows = (
+            Imovel.objects.annotate(cep_length=Length("cep"))
+            .filter(
+                cep_length__gte=CEP_MIN_LENGTH,
+                logradouro__in={address[0] for address in addresses},
+            )
+            .values_list("logradouro", "numero", "bairro", "cep")
+        )
+        for logradouro, numero, bairro, cep in rows:
+            address = (logradouro, numero, bairro)
+            if address in addresses:
+                known.setdefault(address, cep)
+        return known
+
+    def enrich_batch(self, rows):
+        by_key = {}
+        addresses = {}
+        for imovel_id, logradouro, numero, bairro in rows:
+            key = normalize_address(logradouro, numero, bairro)
+            by_key.setdefault(key, []).append(imovel_id)
+            addresses.setdefault(key, (logradouro, numero, bairro))
+        self.total += len(rows)
+
+        ceps = {}
+        cached = self.cache.get_many(by_key)
+        for key, entry in cached.items():
+            if entry.cep:
+                ceps[key] = entry.cep
+                self.encontrados += len(by_key[key])
+            else:
+                self.sem_resultado += len(by_key[key])
+
+        pending = {
+            addresses[key]: key for key in by_key if key not in cached
+        }
+        results = {}
+        for address, cep in self.known_ceps(set(pending)).items():
+            key = pending.pop(address)
+            ceps[key] = cep
+            results[key] = (cep, [])
+            self.copiados += len(by_key[key])
+        pending = [key for key in pending.values() if key[0]]
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                lookups = executor.map(
+                    self.resolve, pending, [addresses[key][2] for key in pending]
+                )
+                for key, cep, dados, ok in lookups:
+                    if not ok:
+                        self.falhas += len(by_key[key])
+                        continue
+                    results[key] = (cep, dados)
+                    if cep:
+                        ceps[key] = cep
+                        self.encontrados += len(by_key[key])
+                    else:
+                        self.sem_resultado += len(by_key[key])
+        self.cache.set_many(results)
+
+        objects = [
+            Imovel(id=imovel_id, cep=cep)
+            for key, cep in ceps.items()
+            for imovel_id in by_key[key]
+        ]
+        if objects:
+            Imovel.objects.bulk_update(objects, ["cep"])
+
+    def run(self, queryset=None):
+        queryset = missing_cep_queryset() if queryset is None else queryset
+        last_id = 0
+        try:
+            while True:
+                rows = list(
+                    queryset.filter(id__gt=last_id)
+                    .order_by("id")
+                    .values_list("id", "logradouro", "numero", "bairro")[
+                        : self.batch_size
+                    ]
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                self.enrich_batch(rows)
+                print(f'''Buscando CEP:
+                Total= {str(self.total)}
+                Copiados= {str(self.copiados)}
+                Encontrados= {str(self.encontrados)}
+                Sem resultado= {str(self.sem_resultado)}
+                Falhas= {str(self.falhas)}
+                Cache= {str(self.cache.hits)} hits, {str(self.cache.misses)} misses''')
+        finally:
+            self.backend.close()
+        return self.total
+
+
+def enrich_missing_ceps(**kwargs):
+    return CepEnricher(**kwargs).run()
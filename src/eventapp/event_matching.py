@@ -0,0 +1,202 @@
+from django.db import NotSupportedError, connection, transaction
+
+from eventapp.imovel_import import DEFAULT_CODIGOS
+from eventapp.models import Imovel, Notice, ReportEvent, SurveyEvent
+
+# eventos que podem ficar sem imóvel, ver o filtro incompatible dos viewsets
+EVENT_MODELS = {
+    "notice": Notice,
+    "survey": SurveyEvent,
+    "report": ReportEvent,
+}
+
+# similaridade mínima para atribuir o imóvel sem revisão
+THRESHOLD = 0.6
+# folga mínima sobre o segundo candidato, abaixo disso vai para revisão
+MARGIN = 0.1
+# similaridade mínima para um imóvel ser candidato (operador % do pg_trgm)
+CANDIDATE_THRESHOLD = 0.3
+CANDIDATES = 3
+
+CANDIDATES_TABLE = "evento_candidatos"
+
+# endereço do imóvel comparado com o address do evento, a expressão do
+# índice imovel_endereco_gist_idx (o pg_trgm já ignora maiúsculas)
+IMOVEL_ADDRESS = (
+    "immutable_unaccent(coalesce(i.logradouro, '') || ' ' ||"
+    " coalesce(i.numero, '') || ' ' || coalesce(i.bairro, ''))"
+)
+
+
+def incompatible_condition(alias: str) -> str:
+    return f"({alias}.imovel_id IS NULL OR {alias}.imovel_id = %s)"
+
+
+def load_candidates(cursor, tipo: str, model, default_id, candidates: int):
+    """
+    Os imóveis mais parecidos com o endereço de cada evento sem imóvel (ou
+    com o imóvel padrão "000000"), num LATERAL limitado a candidates e
+    ordenado pela distância (<->), lida em ordem do índice GiST.
+    """
+    defaults = ", ".join(["%s"] * len(DEFAULT_CODIGOS))
+    cursor.execute(
+        f"""
+        INSERT INTO {CANDIDATES_TABLE}
+            (tipo, evento_id, imovel_id, similaridade, posicao)
+        SELECT %s, e.id, c.imovel_id, c.similaridade,
+            row_number() OVER (
+                PARTITION BY e.id ORDER BY c.similaridade DESC, c.imovel_id
+            )
+        FROM (
+            SELECT id, immutable_unaccent(address) AS endereco
+            FROM {model._meta.db_table} e
+            WHERE {incompatible_condition("e")}
+                AND trim(coalesce(address, '')) <> ''
+        ) e
+        CROSS JOIN LATERAL (
+            SELECT i.id AS imovel_id,
+                similarity({IMOVEL_ADDRESS}, e.endereco) AS similaridade
+            FROM {Imovel._meta.db_table} i
+            WHERE i.ativo AND i.codigo NOT IN ({defaults})
+                AND {IMOVEL_ADDRESS} %% e.endereco
+            ORDER BY {IMOVEL_ADDRESS} <-> e.endereco, i.id
+            LIMIT %s
+        ) c
+        """,
+        [tipo, default_id, *DEFAULT_CODIGOS, candidates],
+    )
+
+
+def mark_matches(cursor, threshold: float, margin: float):
+    """
+    Marca o melhor candidato dos eventos em que ele passa de threshold com
+    folga de margin sobre o segundo.
+    """
+    cursor.execute(
+        f"""
+        UPDATE {CANDIDATES_TABLE} c1 SET atribuir = true
+        WHERE c1.posicao = 1 AND c1.similaridade >= %s
+            AND NOT EXISTS (
+                SELECT 1 FROM {CANDIDATES_TABLE} c2
+                WHERE c2.tipo = c1.tipo AND c2.evento_id = c1.evento_id
+                    AND c2.posicao = 2 AND c1.similaridade - c2.similaridade < %s
+            )
+        """,
+        [threshold, margin],
+    )
+
+
+def assign_matches(cursor, tipo: str, model, default_id) -> int:
+    cursor.execute(
+        f"""
+        UPDATE {model._meta.db_table} e
+        SET imovel_id = c.imovel_id, updated = now()
+        FROM {CANDIDATES_TABLE} c
+        WHERE c.tipo = %s AND c.atribuir AND e.id = c.evento_id
+            AND {incompatible_condition("e")}
+        """,
+        [tipo, default_id],
+    )
+    return cursor.rowcount
+
+
+def count_matches(cursor) -> dict:
+    cursor.execute(
+        f"SELECT tipo, count(*) FROM {CANDIDATES_TABLE} WHERE atribuir GROUP BY tipo"
+    )
+    return dict(cursor.fetchall())
+
+
+def review_list(cursor) -> list:
+    """
+    Eventos com candidatos mas sem atribuição, por ambiguidade ou
+    similaridade abaixo do threshold, com os candidatos em ordem.
+    """
+    cursor.execute(
+        f"""
+        SELECT c.tipo, c.evento_id, c.imovel_id, c.similaridade,
+            concat_ws(' ', i.logradouro, i.numero, i.bairro)
+        FROM {CANDIDATES_TABLE} c
+        JOIN {Imovel._meta.db_table} i ON i.id = c.imovel_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {CANDIDATES_TABLE} a
+            WHERE a.tipo = c.tipo AND a.evento_id = c.evento_id AND a.atribuir
+        )
+        ORDER BY c.tipo, c.evento_id, c.posicao
+        """
+    )
+    review = []
+    for tipo, evento_id, imovel_id, similaridade, endereco in cursor.fetchall():
+        if not review or (review[-1]["tipo"], review[-1]["evento"]) != (tipo, evento_id):
+            review.append({"tipo": tipo, "evento": evento_id, "candidatos": []})
+        review[-1]["candidatos"].append(
+            {
+                "imovel": imovel_id,
+                "endereco": endereco,
+                "similaridade": round(similaridade, 3),
+            }
+        )
+
+    for tipo, model in EVENT_MODELS.items():
+        items = [item for item in review if item["tipo"] == tipo]
+        addresses = dict(
+            model.objects.filter(id__in=[item["evento"] for item in items])
+            .values_list("id", "address")
+        ) if items else {}
+        for item in items:
+            item["address"] = addresses.get(item["evento"])
+    return review
+
+
+def match_incompatible_events(
+    threshold=THRESHOLD,
+    margin=MARGIN,
+    candidate_threshold=CANDIDATE_THRESHOLD,
+    candidates=CANDIDATES,
+    apply=True,
+) -> dict:
+    """
+    Liga ao imóvel os avisos, vistorias e relatórios sem imóvel, pela
+    similaridade de trigramas (pg_trgm) entre o address e o endereço do
+    imóvel. Os candidatos de todos os eventos vão para uma tabela temporária
+    e cada tipo de evento é atribuído com um UPDATE só.
+    :param apply: falso só simula, sem gravar
+    :returns: {"atribuidos": {tipo: eventos}, "revisao": [eventos ambíguos]}
+    """
+    if connection.vendor != "postgresql":
+        raise NotSupportedError("A busca por trigramas requer o PostgreSQL")
+
+    default_id = (
+        Imovel.objects.filter(codigo=DEFAULT_CODIGOS[0])
+        .values_list("id", flat=True)
+        .first()
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+            [str(candidate_threshold)],
+        )
+        cursor.execute(f"DROP TABLE IF EXISTS {CANDIDATES_TABLE}")
+        cursor.execute(
+            f"""
+            CREATE TEMPORARY TABLE {CANDIDATES_TABLE} (
+                tipo text, evento_id integer, imovel_id integer,
+                similaridade real, posicao integer,
+                atribuir boolean NOT NULL DEFAULT false
+            ) ON COMMIT DROP
+            """
+        )
+        for tipo, model in EVENT_MODELS.items():
+            load_candidates(cursor, tipo, model, default_id, candidates)
+        cursor.execute(f"ANALYZE {CANDIDATES_TABLE}")
+        mark_matches(cursor, threshold, margin)
+        if apply:
+            assigned = {
+                tipo: assign_matches(cursor, tipo, model, default_id)
+                for tipo, model in EVENT_MODELS.items()
+            }
+        else:
+            matches = count_matches(cursor)
+            assigned = {tipo: matches.get(tipo, 0) for tipo in EVENT_MODELS}
+        review = review_list(cursor)
+    return {"atribuidos": assigned, "revisao": review}
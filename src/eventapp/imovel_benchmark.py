@@ -0,0 +1,262 @@
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from eventapp.imovel_import import (COLUMNS_DICT, IMPORT_FIELDS,
+                                    ImovelImporter, StagingImporter,
+                                    update_from_dataframe, update_from_file)
+from eventapp.models import ImovelUpdateLog
+
+# códigos e inscrições fora da faixa do cadastro da prefeitura
+CODIGO_START = 10000000
+INSCRICAO_SETOR = 9
+
+# unidades por lote (apartamentos, salas), dividem o codigo_lote
+UNIDADES = 4
+
+LOGRADOUROS = [
+    "Rua Hercílio Luz",
+    "Rua Lauro Müller",
+    "Rua Brusque",
+    "Rua Uruguai",
+    "Rua Blumenau",
+    "Rua Samuel Heusi",
+    "Rua José Bonifácio Malburg",
+    "Avenida Joca Brandão",
+    "Avenida Sete de Setembro",
+    "Avenida Osvaldo Reis",
+    "Avenida Marcos Konder",
+    "Rua Estefano José Vanolli",
+    "Rua Alberto Werner",
+    "Rua Pedro Ferreira",
+    "Rua Felipe Schmidt",
+]
+
+BAIRROS = [
+    "Centro",
+    "Fazenda",
+    "Vila Operária",
+    "São João",
+    "São Vicente",
+    "Cordeiros",
+    "Cidade Nova",
+    "Dom Bosco",
+    "Ressacada",
+    "Praia Brava",
+    "Cabeçudas",
+    "Barra do Rio",
+]
+
+NOMES = ["Ana", "João", "Maria", "José", "Carla", "Pedro", "Luiza", "Paulo"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Pereira", "Costa", "Schmitt", "Moser"]
+
+# campos sorteados para as linhas alteradas
+CHANGE_FIELDS = ["razao_social", "cnpj_cpf", "logradouro", "numero", "area_lote"]
+
+
+def random_names(rng, size):
+    first = rng.choice(NOMES, size)
+    last = rng.choice(SOBRENOMES, size)
+    return [f"{a} {b}" for a, b in zip(first, last)]
+
+
+def random_documents(rng, size):
+    # 90% CPF, o restante CNPJ, formatados como no cadastro
+    digits = rng.integers(0, 10, (size, 14))
+    documents = []
+    for row, is_cpf in zip(digits, rng.random(size) < 0.9):
+        d = "".join(map(str, row))
+        if is_cpf:
+            documents.append(f"{d[:3]}.{d[3:6]}.{d[6:9]}-{d[9:11]}")
+        else:
+            documents.append(f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}")
+    return documents
+
+
+def random_numbers(rng, size):
+    numbers = rng.integers(1, 3000, size).astype(str).astype(object)
+    numbers[rng.random(size) < 0.05] = "S/N"
+    return numbers
+
+
+def random_areas(rng, size):
+    return [f"{area:.2f}" for area in rng.uniform(150, 2000, size)]
+
+
+def generate_cadastre(rows, changes=0.0, conflicts=0.0, seed=0) -> pd.DataFrame:
+    """
+    Gera um cadastro sintético com as colunas da planilha da prefeitura.
+
+    O mesmo seed gera sempre o mesmo cadastro base; changes e conflicts
+    são as frações de linhas alteradas e em conflito em relação a ele, para
+    simular a planilha seguinte. Num conflito a linha recebe a inscrição do
+    lote vizinho, que sai do arquivo, e metade delas também o endereço.
+    :param rows: linhas do cadastro base
+    :returns: DataFrame com os cabeçalhos de COLUMNS_DICT
+    """
+    rng = np.random.default_rng(seed)
+    index = np.arange(rows)
+    lote = index // UNIDADES
+    unidade = index % UNIDADES
+    lotes = lote[-1] + 1 if rows else 0
+
+    lote_logradouro = rng.choice(LOGRADOUROS, lotes)
+    lote_numero = random_numbers(rng, lotes)
+    lote_bairro = rng.choice(BAIRROS, lotes)
+    lote_area = np.array(random_areas(rng, lotes), dtype=object)
+
+    df = pd.DataFrame(
+        {
+            "codigo": [str(CODIGO_START + i) for i in index],
+            "inscricao_imobiliaria": [
+                f"{INSCRICAO_SETOR}{n // 10 ** 7 % 10}.{n // 10 ** 4 % 1000:03d}."
+                f"{n % 10 ** 4:04d}.{u:03d}"
+                for n, u in zip(lote, unidade)
+            ],
+            "numero_contribuinte": rng.integers(1, 10 ** 6, rows).astype(str),
+            "logradouro": lote_logradouro[lote],
+            "numero": lote_numero[lote],
+            "bairro": lote_bairro[lote],
+            "complemento": [f"APTO {u}01" if u else None for u in unidade],
+            "area_lote": lote_area[lote],
+            "razao_social": random_names(rng, rows),
+            "cnpj_cpf": random_documents(rng, rows),
+        },
+        columns=IMPORT_FIELDS,
+    ).astype(object)
+
+    # alterações e conflitos usam outro gerador, o cadastro base não muda
+    rng = np.random.default_rng(seed + 1)
+    changed = rng.choice(rows, int(rows * changes), replace=False)
+    fields = rng.choice(CHANGE_FIELDS, len(changed))
+    for name in CHANGE_FIELDS:
+        positions = changed[fields == name]
+        size = len(positions)
+        if name == "razao_social":
+            values = random_names(rng, size)
+        elif name == "cnpj_cpf":
+            values = random_documents(rng, size)
+        elif name == "logradouro":
+            values = rng.choice(LOGRADOUROS, size)
+        elif name == "numero":
+            values = random_numbers(rng, size)
+        else:
+            values = random_areas(rng, size)
+        df.iloc[positions, df.columns.get_loc(name)] = values
+
+    pairs = rng.choice(rows // 2, min(int(rows * conflicts), rows // 2), replace=False) * 2
+    if len(pairs):
+        moved = pairs[: len(pairs) // 2]
+        address = ["logradouro", "numero", "bairro", "complemento"]
+        df.iloc[pairs, df.columns.get_loc("inscricao_imobiliaria")] = (
+            df["inscricao_imobiliaria"].values[pairs + 1]
+        )
+        df.iloc[moved, [df.columns.get_loc(name) for name in address]] = (
+            df[address].values[moved + 1]
+        )
+        df = df.drop(df.index[pairs + 1]).reset_index(drop=True)
+
+    return df.rename(columns={value: key for key, value in COLUMNS_DICT.items()})
+
+
+def write_cadastre(df: pd.DataFrame, path: str):
+    """
+    Grava em xlsx, csv (; como separador), csv.gz ou parquet, pela extensão
+    do arquivo.
+    """
+    if path.endswith((".csv", ".csv.gz")):
+        df.to_csv(path, index=False, sep=";")
+    elif path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+
+
+def reset_peak_rss() -> bool:
+    """
+    Zera o pico de memória do processo (VmHWM), para medir cada importação
+    separadamente. Só no Linux; nos outros sistemas o ru_maxrss é o pico
+    desde o início do processo.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss() -> float:
+    """Pico de memória do processo desde o último reset_peak_rss, em MB."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB no Linux, bytes no macOS
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+class QueryCounter:
+    """execute_wrapper que só conta as consultas, sem precisar de DEBUG."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_benchmark(df: pd.DataFrame = None, copy=False, path=None) -> dict:
+    """
+    Importa df por update_from_dataframe, ou o arquivo path por
+    update_from_file (com a leitura do SpreadsheetReader, como na
+    importação), e mede o tempo, as consultas e a memória. Com copy usa o
+    StagingImporter (só no Postgres).
+    :param df: DataFrame com as colunas de IMPORT_FIELDS
+    :returns: relatório, com os contadores do log e as medidas de cada etapa
+    """
+    log = ImovelUpdateLog.objects.create(
+        state=0, status="inicio", response="Benchmark da importação"
+    )
+    importer = (StagingImporter if copy else ImovelImporter)(log)
+    queries = QueryCounter()
+    # sem o reset, o pico seria o da importação anterior
+    peak_measured = reset_peak_rss()
+    start = time.perf_counter()
+    with connection.execute_wrapper(queries):
+        if path:
+            with open(path, "rb") as file:
+                # sem partições: os processos não veriam a transação do benchmark
+                update_from_file(file, log, workers=1, importer=importer)
+        else:
+            update_from_dataframe(df, log, importer)
+    elapsed = time.perf_counter() - start
+    log.refresh_from_db()
+
+    return {
+        "linhas": importer.total,
+        "segundos": round(elapsed, 3),
+        "linhas_por_segundo": round(importer.total / elapsed, 1) if elapsed else 0,
+        "consultas": queries.count,
+        "pico_rss_mb": round(peak_rss(), 1) if peak_measured else None,
+        "novos": log.novos,
+        "alterados": log.alterados,
+        "inalterados": log.inalterados,
+        "falhas": log.falhas,
+        "rejeitados": log.rejeitados,
+        "conflitos": log.conflitos,
+        "etapas": importer.meter.report(importer.total),
+        "log": log.id,
+    }
+
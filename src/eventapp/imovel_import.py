@@ -0,0 +1,1988 @@
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+import tracemalloc
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+
+import django
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+
+from eventapp.models import (Imovel, ImovelChange, ImovelConflict,
+                             ImovelUpdateJob, ImovelUpdateLog)
+from eventapp.utils import fingerprint
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+COLUMNS_DICT = {
+    'Código imóvel': 'codigo',
+    'Inscrição': 'inscricao_imobiliaria',
+    'Cód. contribuinte': 'numero_contribuinte',
+    'Logradouro': 'logradouro',
+    'Nº imóvel': 'numero',
+    'Nome do bairro': 'bairro',
+    'Complemento': 'complemento',
+    'Área do terreno m2': 'area_lote',
+    'Razão Social': 'razao_social',
+    'CNPJ CPF': 'cnpj_cpf',
+}
+
+DTYPE = {
+    'Código imóvel': str,
+    'Inscrição': str,
+    'Cód. contribuinte': str,
+    'Logradouro': str,
+    'Nº imóvel': str,
+    'Nome do bairro': str,
+    'Complemento': str,
+    'Área do terreno m2': str,
+    'Razão Social': str,
+    'CNPJ CPF': str,
+}
+
+# colunas com poucos valores distintos, lidas como category do csv e parquet
+CATEGORY_COLUMNS = ['Logradouro', 'Nome do bairro']
+COLUMNAR_DTYPE = {
+    **DTYPE,
+    **{name: 'category' for name in CATEGORY_COLUMNS},
+}
+
+# assinatura no início do arquivo, o que não reconhece é lido como csv
+FILE_SIGNATURES = [
+    (b'PK\x03\x04', 'xlsx'),
+    (b'\xd0\xcf\x11\xe0', 'xls'),
+    (b'PAR1', 'parquet'),
+    (b'\x1f\x8b', 'csv.gz'),
+]
+CSV_SEPARATORS = [';', ',', '\t']
+
+# a mesma lista do fingerprint do modelo, na ordem das colunas da planilha
+IMPORT_FIELDS = Imovel.IMPORTED_FIELDS
+COMPARE_FIELDS = IMPORT_FIELDS + ["codigo_lote"]
+UPDATE_FIELDS = COMPARE_FIELDS + ["fingerprint", "imported", "updated"]
+RENAME_FIELDS = [
+    "codigo",
+    "inscricao_imobiliaria",
+    "codigo_lote",
+    "fingerprint",
+    "imported",
+    "updated",
+]
+ADDRESS_FIELDS = ["logradouro", "numero", "bairro", "complemento"]
+# chave provisória, seguida do id, dos imóveis que trocam de código ou
+# inscrição durante a gravação, ver ImovelImporter._park_keys
+PARKED_PREFIX = "IMPORTANDO_"
+
+# o codigo_lote são os 10 primeiros dígitos da inscrição
+INSCRICAO_MIN_DIGITS = 10
+INSCRICAO_PATTERN = r"[\d.\-/ ]+"
+# area_lote: max_digits=10, decimal_places=2
+AREA_LOTE_MAX = 10 ** 8
+
+# gravados junto com cada chunk, ver ImovelImporter.save_progress
+PROGRESS_FIELDS = [
+    "state",
+    "total",
+    "inalterados",
+    "alterados",
+    "novos",
+    "falhas",
+    "rejeitados",
+    "conflitos",
+    "progresso",
+    "checkpoint",
+    "datetime",
+]
+
+# imóveis criados por update_default_imovel, fora do cadastro importado
+DEFAULT_CODIGOS = ["000000", "000001", "000002"]
+
+# contadores somados das partições do modo paralelo
+PARTITION_COUNTERS = [
+    "total",
+    "inalterados",
+    "alterados",
+    "novos",
+    "falhas",
+    "conflitos",
+]
+
+# chave do pg_advisory_lock que impede duas importações simultâneas
+IMPORT_LOCK_ID = 7031
+# vezes que um job interrompido é retomado antes de ser marcado como falho
+MAX_ATTEMPTS = 3
+
+# tabela temporária do StagingImporter, existe só na conexão da importação
+STAGING_TABLE = "imovel_staging"
+STAGING_FIELDS = ["linha"] + COMPARE_FIELDS + ["fingerprint"]
+# códigos e inscrições do arquivo, para achar os imóveis que saíram dele
+CODIGOS_TABLE = "imovel_codigos"
+INSCRICOES_TABLE = "imovel_inscricoes"
+
+
+def set_preparing(log: ImovelUpdateLog):
+    print("Preparando arquivo")
+    # a simulação (dry_run) lê o arquivo sem log
+    if log is None:
+        return
+    log.state = 10
+    log.status = "Preparando"
+    log.response = "Preparando arquivo"
+    log.save()
+
+
+def detect_format(file) -> str:
+    """
+    Formato do arquivo pelo conteúdo: xlsx, xls, parquet, csv.gz ou csv
+    """
+    start = file.read(8)
+    file.seek(0)
+    for signature, file_format in FILE_SIGNATURES:
+        if start.startswith(signature):
+            return file_format
+    return 'csv'
+
+
+def read_csv_file(file, compression=None) -> pd.DataFrame:
+    # o separador e a codificação saem do cabeçalho
+    stream = gzip.GzipFile(fileobj=file) if compression else file
+    header = stream.readline()
+    file.seek(0)
+    try:
+        header = header.decode('utf-8-sig')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        header = header.decode('latin-1')
+        encoding = 'latin-1'
+
+    return pd.read_csv(
+        file,
+        sep=max(CSV_SEPARATORS, key=header.count),
+        compression=compression,
+        encoding=encoding,
+        engine='c',
+        dtype=COLUMNAR_DTYPE,
+        usecols=COLUMNS_DICT.keys(),
+        keep_default_na=False,
+        na_values=[''],
+    )
+
+
+def read_parquet_file(file) -> pd.DataFrame:
+    try:
+        df = pd.read_parquet(file, engine='pyarrow')
+    except ImportError:
+        raise ParseError('Leitura de arquivos parquet requer o pyarrow')
+    missing = [name for name in COLUMNS_DICT if name not in df.columns]
+    if missing:
+        raise ParseError(
+            f'Colunas não encontradas no arquivo: {", ".join(missing)}'
+        )
+    df = df[list(COLUMNS_DICT)]
+    for name in COLUMNS_DICT:
+        # números gravados como tal no parquet viram texto como no excel
+        if pd.api.types.is_numeric_dtype(df[name]):
+            df[name] = df[name].map(cell_to_str, na_action='ignore').astype(object)
+        if name in CATEGORY_COLUMNS:
+            df[name] = df[name].astype('category')
+    return df
+
+
+def get_dataframe_from_file(file, log: ImovelUpdateLog, file_format=None) -> pd.DataFrame:
+
+    set_preparing(log)
+
+    file_format = file_format or detect_format(file)
+    try:
+        if file_format == 'parquet':
+            df = read_parquet_file(file)
+        elif file_format == 'csv.gz':
+            df = read_csv_file(file, compression='gzip')
+        elif file_format == 'csv':
+            df = read_csv_file(file)
+        else:
+            excel = pd.read_excel(
+                file,
+                dtype=DTYPE,
+                usecols=COLUMNS_DICT.keys()
+            )
+            df = pd.DataFrame(excel)
+            df = df.where(df.notnull(), None)
+        df = df.dropna(how='all')
+        df = df.rename(columns=COLUMNS_DICT)
+
+        return df
+
+    except (ValueError, UnicodeDecodeError, OSError) as e:
+        raise ParseError(e)
+
+
+def cell_to_str(value):
+    # mesma conversão do pd.read_excel com dtype=str
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def dataframe_chunks(df: pd.DataFrame, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(df.index), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+class SpreadsheetReader:
+    """
+    Lê a planilha do cadastro em DataFrames de chunk_size linhas. O xlsx é
+    lido aos poucos pelo openpyxl (read_only), com a memória constante
+    qualquer que seja o tamanho do arquivo; os outros formatos (xls, csv,
+    csv.gz e parquet, ver detect_format) são lidos de uma vez pelo
+    get_dataframe_from_file.
+    """
+
+    def __init__(self, file, log: ImovelUpdateLog, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.log = log
+        self.chunk_size = chunk_size
+        self.total_rows = 0
+        self.workbook = None
+        self.dataframe = None
+
+        file_format = detect_format(file)
+        if file_format == 'xlsx':
+            try:
+                self.workbook = openpyxl.load_workbook(
+                    file, read_only=True, data_only=True
+                )
+            except (zipfile.BadZipFile, KeyError):
+                file.seek(0)
+        if self.workbook is None:
+            self.dataframe = get_dataframe_from_file(file, log, file_format)
+            self.total_rows = len(self.dataframe.index)
+            return
+
+        set_preparing(log)
+
+        self.worksheet = self.workbook.worksheets[0]
+        self.rows = self.worksheet.iter_rows(values_only=True)
+        header = [cell_to_str(value) for value in next(self.rows, ())]
+        missing = [name for name in COLUMNS_DICT if name not in header]
+        if missing:
+            self.close()
+            raise ParseError(
+                f'Colunas não encontradas no arquivo: {", ".join(missing)}'
+            )
+        self.indexes = [header.index(name) for name in COLUMNS_DICT]
+        if self.worksheet.max_row:
+            self.total_rows = self.worksheet.max_row - 1
+
+    def __iter__(self):
+        if self.dataframe is not None:
+            yield from dataframe_chunks(self.dataframe, self.chunk_size)
+            return
+
+        try:
+            chunk = []
+            index = []
+            # o índice é a posição da linha de dados, como no pd.read_excel
+            for position, row in enumerate(self.rows):
+                values = [
+                    cell_to_str(row[column]) if column < len(row) else None
+                    for column in self.indexes
+                ]
+                if all(value is None for value in values):
+                    continue
+                chunk.append(values)
+                index.append(position)
+                if len(chunk) >= self.chunk_size:
+                    yield pd.DataFrame(
+                        chunk, index=index, columns=IMPORT_FIELDS, dtype=object
+                    )
+                    chunk = []
+                    index = []
+            if chunk:
+                yield pd.DataFrame(
+                    chunk, index=index, columns=IMPORT_FIELDS, dtype=object
+                )
+        finally:
+            self.close()
+
+    def close(self):
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
+
+
+def update_default_imovel(log: ImovelUpdateLog):
+    imovel_base = [
+        {
+            "name": "Sem imóvel",
+            "code": "000000",
+        },
+        {
+            "name": "Pessoa Física",
+            "code": "000001",
+        },
+        {
+            "name": "Pessoa Jurídica",
+            "code": "000002",
+        },
+    ]
+    for instance in imovel_base:
+        imovel_data = {
+            # common
+            "codigo_lote": instance["code"],
+            "logradouro": instance["name"],
+            "numero": "S/N",
+            # properties
+            "inscricao_imobiliaria": instance["code"],
+            "codigo": instance["code"],
+            "numero_contribuinte": instance["code"],
+        }
+        imovel = Imovel.objects.filter(inscricao_imobiliaria=instance["code"]).first()
+        if not imovel:
+            imovel = Imovel(**imovel_data)
+            imovel.save()
+    return True
+
+
+def validate_chunk(df: pd.DataFrame, seen_codigos: set, seen_inscricoes: set):
+    """
+    Normaliza o chunk por coluna e separa as linhas que não podem ser
+    importadas. O cnpj_cpf fica só com os dígitos, com zeros como no
+    Imovel.clean_cnpj_cpf, e o codigo_lote sai da inscrição. São rejeitadas
+    as linhas sem código ou inscrição, com a inscrição inválida, valores
+    maiores que as colunas ou código/inscrição repetidos no arquivo.
+
+    :param df: chunk com as colunas IMPORT_FIELDS
+    :param seen_codigos: códigos aceitos nos chunks anteriores (atualizado)
+    :param seen_inscricoes: inscrições aceitas nos chunks anteriores (idem)
+    :returns: (linhas válidas, rejeitadas com linha, codigo,
+        inscricao_imobiliaria e motivo)
+    """
+    df = df.astype(object).where(df.notna(), None)
+    motivo = pd.Series(None, index=df.index, dtype=object)
+
+    cnpj_cpf = df["cnpj_cpf"].str.replace(r"\D", "", regex=True)
+    length = cnpj_cpf.str.len()
+    df["cnpj_cpf"] = cnpj_cpf.str.zfill(14).where(
+        length > 11, cnpj_cpf.str.zfill(11).where(length > 9)
+    )
+    df = df.astype(object).where(df.notna(), None)
+
+    def reject(mask, reason):
+        return motivo.mask(mask.fillna(False).astype(bool) & motivo.isna(), reason)
+
+    codigo = df["codigo"]
+    inscricao = df["inscricao_imobiliaria"]
+    motivo = reject(
+        codigo.isna() | inscricao.isna() | (codigo == "") | (inscricao == ""),
+        "Código e inscrição imobiliária são obrigatórios",
+    )
+
+    digits = inscricao.str.replace(r"\D", "", regex=True)
+    malformed = (
+        ~inscricao.str.fullmatch(INSCRICAO_PATTERN).fillna(False).astype(bool)
+        | (digits.str.len().fillna(0) < INSCRICAO_MIN_DIGITS)
+    )
+    motivo = reject(inscricao.notna() & malformed, "Inscrição imobiliária inválida")
+
+    for name in IMPORT_FIELDS:
+        max_length = Imovel._meta.get_field(name).max_length
+        if max_length:
+            motivo = reject(
+                df[name].str.len() > max_length,
+                f"{name}: valor maior que {max_length} caracteres",
+            )
+
+    area_lote = pd.to_numeric(df["area_lote"], errors="coerce")
+    motivo = reject(
+        df["area_lote"].notna() & (area_lote.isna() | (area_lote.abs() >= AREA_LOTE_MAX)),
+        "Área do terreno inválida",
+    )
+
+    accepted = motivo.isna()
+    motivo = reject(
+        accepted & (codigo.where(accepted).duplicated() | codigo.isin(seen_codigos)),
+        "Código duplicado no arquivo",
+    )
+    motivo = reject(
+        accepted & (inscricao.where(accepted).duplicated() | inscricao.isin(seen_inscricoes)),
+        "Inscrição imobiliária duplicada no arquivo",
+    )
+
+    rejected = df.loc[motivo.notna(), ["codigo", "inscricao_imobiliaria"]]
+    rejected.insert(0, "linha", rejected.index + 2)
+    rejected["motivo"] = motivo[motivo.notna()]
+
+    clean = df[motivo.isna()].copy()
+    clean["codigo_lote"] = digits[clean.index].str.slice(0, 10)
+
+    seen_codigos.update(clean["codigo"])
+    seen_inscricoes.update(clean["inscricao_imobiliaria"])
+    return clean, rejected
+
+
+def clean_imovel_data(row) -> dict:
+    """
+    Valores de uma linha já validada como o Imovel os grava.
+
+    :param row: dicionário com os COMPARE_FIELDS, como sai do validate_chunk
+    :returns: {campo: valor}
+    """
+    data = {}
+    for name in COMPARE_FIELDS:
+        value = row.get(name)
+        if value is not None and pd.isna(value):
+            value = None
+        field = Imovel._meta.get_field(name)
+        value = field.to_python(value)
+        if value is not None and field.max_length and len(value) > field.max_length:
+            raise ValidationError(
+                f'{name}: valor maior que {field.max_length} caracteres ({value})'
+            )
+        data[name] = value
+    if not data["codigo"] or not data["inscricao_imobiliaria"]:
+        raise ValidationError("Código e inscrição imobiliária são obrigatórios")
+    return data
+
+
+def get_fingerprint(data: dict) -> str:
+    return fingerprint(data[name] for name in IMPORT_FIELDS)
+
+
+def same_address(imovel: Imovel, data: dict) -> bool:
+    for name in ADDRESS_FIELDS:
+        if getattr(imovel, name) != data[name]:
+            return False
+    return True
+
+
+class StageMeter:
+    """
+    Tempo, consultas SQL e pico de memória alocada (tracemalloc) de cada
+    etapa. Nas etapas aninhadas o tempo, as consultas e a memória das
+    internas não entram na externa. As consultas só são contadas dentro de
+    measure, e a memória só com IMPORT_TRACE_MEMORY.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.traced = False
+        self._stage = None
+        self._stage_start = 0
+
+    @contextmanager
+    def stage(self, name):
+        outer = self._stage
+        self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch(outer)
+
+    def _switch(self, name):
+        now = time.perf_counter()
+        if self._stage:
+            stats = self._stats(self._stage)
+            stats["segundos"] += now - self._stage_start
+            if tracemalloc.is_tracing():
+                stats["memoria"] = max(stats["memoria"], tracemalloc.get_traced_memory()[1])
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._stage = name
+        self._stage_start = now
+
+    def _stats(self, name) -> dict:
+        if name not in self.stages:
+            self.stages[name] = {"segundos": 0, "consultas": 0, "memoria": 0}
+        return self.stages[name]
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper da conexão, conta a consulta na etapa atual
+        if self._stage:
+            self._stats(self._stage)["consultas"] += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def measure(self):
+        tracing = settings.IMPORT_TRACE_MEMORY and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        self.traced = tracemalloc.is_tracing()
+        try:
+            with connection.execute_wrapper(self):
+                yield
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+    def report(self, rows) -> dict:
+        """Etapas para o ImovelUpdateLog.etapas, rows são as linhas do arquivo."""
+        return {
+            name: {
+                "segundos": round(stats["segundos"], 3),
+                "linhas_por_segundo": (
+                    round(rows / stats["segundos"], 1) if stats["segundos"] else 0
+                ),
+                "consultas": stats["consultas"],
+                "memoria_mb": (
+                    round(stats["memoria"] / 1024 ** 2, 1) if self.traced else None
+                ),
+            }
+            for name, stats in self.stages.items()
+        }
+
+
+class ImovelImporter:
+    """
+    Importação da planilha do cadastro em conjunto. Os mapas código/inscrição
+    -> id são carregados uma vez e cada linha é classificada em memória
+    (nova, inalterada, alterada ou em conflito); as gravações de cada chunk
+    vão numa transação só, com bulk_update/bulk_create, e as consultas
+    crescem por chunk e não por linha. Linhas com o fingerprint igual ao do
+    Imovel gravado contam como inalteradas sem carregar nem gravar o imóvel.
+    """
+
+    def __init__(self, log: ImovelUpdateLog, chunk_size=CHUNK_SIZE):
+        self.log = log
+        self.chunk_size = chunk_size
+        self.total = 0
+        self.inalterados = 0
+        self.alterados = 0
+        self.novos = 0
+        self.falhas = 0
+        self.rejeitados = 0
+        self.conflitos = 0
+        self.inativos = 0
+        self.reativados = 0
+        self.rejected = []
+        self.seen_codigos = set()
+        self.seen_inscricoes = set()
+        self.codigo_map = {}
+        self.inscricao_map = {}
+        self.fingerprint_map = {}
+        self.now = timezone.now()
+        self.meter = StageMeter()
+        # imóveis ainda não gravados usam chaves negativas nos mapas
+        self._new_key = -1
+        self._reset_chunk()
+
+    def stage(self, name):
+        return self.meter.stage(name)
+
+    def read(self, chunks):
+        """Percorre os chunks contando o tempo de leitura do arquivo."""
+        chunks = iter(chunks)
+        while True:
+            with self.stage("leitura"):
+                df = next(chunks, None)
+            if df is None:
+                return
+            yield df
+
+    def _reset_chunk(self):
+        self._objects = {}
+        self._touched = {}
+        self._new = {}
+        self._changed = {}
+        self._renamed = {}
+        self._rehashed = {}
+        self._rekeyed = set()
+        self._conflicts = []
+        self._changes = []
+
+    def load_maps(self):
+        with self.stage("mapas"):
+            self.codigo_map = {}
+            self.inscricao_map = {}
+            self.fingerprint_map = {}
+            queryset = Imovel.objects.values_list(
+                "id", "codigo", "inscricao_imobiliaria", "fingerprint"
+            )
+            for pk, codigo, inscricao_imobiliaria, stored_fingerprint in queryset.iterator():
+                self.codigo_map[codigo] = pk
+                self.inscricao_map[inscricao_imobiliaria] = pk
+                self.fingerprint_map[pk] = stored_fingerprint
+
+    def is_unchanged(self, data, row_fingerprint) -> bool:
+        key = self.codigo_map.get(data["codigo"])
+        return (
+            key is not None
+            and key > 0
+            and key == self.inscricao_map.get(data["inscricao_imobiliaria"])
+            and self.fingerprint_map.get(key) == row_fingerprint
+        )
+
+    def preload(self, rows):
+        keys = set()
+        for data, row_fingerprint in rows:
+            if self.is_unchanged(data, row_fingerprint):
+                continue
+            for key in (
+                self.codigo_map.get(data["codigo"]),
+                self.inscricao_map.get(data["inscricao_imobiliaria"]),
+            ):
+                if key and key > 0 and key not in self._objects:
+                    keys.add(key)
+        if keys:
+            self._objects.update(Imovel.objects.defer("busca").in_bulk(keys))
+
+    def _get(self, key) -> Imovel:
+        if key not in self._objects:
+            self._objects[key] = Imovel.objects.defer("busca").get(pk=key)
+        return self._objects[key]
+
+    def _touch(self, key):
+        self._touched.pop(key, None)
+        self._touched[key] = None
+
+    def _rekey(self, key, imovel, old_codigo, old_inscricao_imobiliaria):
+        if key > 0 and (
+            imovel.codigo != old_codigo
+            or imovel.inscricao_imobiliaria != old_inscricao_imobiliaria
+        ):
+            self._rekeyed.add(key)
+        if imovel.codigo != old_codigo:
+            if self.codigo_map.get(old_codigo) == key:
+                del self.codigo_map[old_codigo]
+            self.codigo_map[imovel.codigo] = key
+        if imovel.inscricao_imobiliaria != old_inscricao_imobiliaria:
+            if self.inscricao_map.get(old_inscricao_imobiliaria) == key:
+                del self.inscricao_map[old_inscricao_imobiliaria]
+            self.inscricao_map[imovel.inscricao_imobiliaria] = key
+
+    def _create(self, data):
+        imovel = Imovel(**data)
+        imovel.update_fingerprint()
+        imovel.imported = self.now
+        key = self._new_key
+        self._new_key -= 1
+        self._objects[key] = imovel
+        self._new[key] = imovel
+        self.codigo_map[imovel.codigo] = key
+        self.inscricao_map[imovel.inscricao_imobiliaria] = key
+        self._touch(key)
+
+    def _apply(self, key, data) -> bool:
+        imovel = self._get(key)
+        before = [getattr(imovel, name) for name in COMPARE_FIELDS]
+        old_fingerprint = imovel.fingerprint
+        old_codigo = imovel.codigo
+        old_inscricao_imobiliaria = imovel.inscricao_imobiliaria
+        for attr, value in data.items():
+            setattr(imovel, attr, value)
+        imovel.update_fingerprint()
+        if key > 0:
+            self.fingerprint_map[key] = imovel.fingerprint
+        if [getattr(imovel, name) for name in COMPARE_FIELDS] == before:
+            if imovel.fingerprint != old_fingerprint and key > 0:
+                # imóvel gravado antes do fingerprint existir
+                self._rehashed[key] = imovel
+                self._touch(key)
+            return False
+        self._rekey(key, imovel, old_codigo, old_inscricao_imobiliaria)
+        imovel.imported = self.now
+        imovel.updated = self.now
+        if key not in self._new:
+            self._changed[key] = imovel
+            self._journal(key, imovel, before)
+        self._touch(key)
+        return True
+
+    def _journal(self, key, imovel, before):
+        self._changes.append(
+            ImovelChange(
+                imovel_id=key,
+                log=self.log,
+                diferencas={
+                    name: [old, getattr(imovel, name)]
+                    for name, old in zip(COMPARE_FIELDS, before)
+                    if old != getattr(imovel, name)
+                },
+            )
+        )
+
+    def _resolve_conflict(self, data, key_codigo, key_inscricao):
+        imovel_per_codigo = self._get(key_codigo)
+        imovel_per_inscricao_imobiliaria = self._get(key_inscricao)
+        codigo_check_address = same_address(imovel_per_codigo, data)
+        inscricao_check_address = same_address(imovel_per_inscricao_imobiliaria, data)
+
+        diferencas = {}
+        for name in COMPARE_FIELDS:
+            values = [
+                getattr(imovel_per_codigo, name),
+                getattr(imovel_per_inscricao_imobiliaria, name),
+                data.get(name),
+            ]
+            if values[0] != values[1] or values[0] != values[2]:
+                diferencas[name] = values
+
+        if codigo_check_address and not inscricao_check_address:
+            # conflito: prioridade imovel_per_codigo
+            resolucao = ImovelConflict.CODIGO
+            winner_key, loser_key = key_codigo, key_inscricao
+            field = "inscricao_imobiliaria"
+        else:
+            # conflito: prioridade imovel_per_inscricao_imobiliaria,
+            # também quando ambos ou nenhum conferem com o endereço
+            if inscricao_check_address and not codigo_check_address:
+                resolucao = ImovelConflict.INSCRICAO
+            elif inscricao_check_address:
+                resolucao = ImovelConflict.AMBOS
+            else:
+                resolucao = ImovelConflict.NENHUM
+            winner_key, loser_key = key_inscricao, key_codigo
+            field = "codigo"
+
+        winner = self._get(winner_key)
+        loser = self._get(loser_key)
+        old_codigo = loser.codigo
+        old_inscricao_imobiliaria = loser.inscricao_imobiliaria
+        before = [getattr(loser, name) for name in COMPARE_FIELDS]
+        valor_anterior = getattr(loser, field)
+        setattr(loser, field, f"ERROR_CHANGE_{loser.id}_IN_FAVOR_OF_{winner.id}")
+        loser.normalize()
+        self._journal(loser_key, loser, before)
+        self.fingerprint_map[loser_key] = loser.fingerprint
+        loser.imported = self.now
+        loser.updated = self.now
+        self._rekey(loser_key, loser, old_codigo, old_inscricao_imobiliaria)
+        self._renamed[loser_key] = loser
+        self._touch(loser_key)
+
+        self._apply(winner_key, data)
+        self._conflicts.append(
+            ImovelConflict(
+                log=self.log,
+                resolucao=resolucao,
+                imovel_codigo_id=imovel_per_codigo.id,
+                imovel_inscricao_id=imovel_per_inscricao_imobiliaria.id,
+                vencedor_id=winner.id,
+                perdedor_id=loser.id,
+                campo=field,
+                valor_anterior=valor_anterior or "",
+                diferencas=diferencas,
+                dados=data,
+            )
+        )
+
+    def process_row(self, data, row_fingerprint):
+        if self.is_unchanged(data, row_fingerprint):
+            self.inalterados += 1
+            return
+
+        key_codigo = self.codigo_map.get(data["codigo"])
+        key_inscricao = self.inscricao_map.get(data["inscricao_imobiliaria"])
+
+        if key_codigo is None and key_inscricao is None:
+            self._create(data)
+            self.novos += 1
+        elif (
+            key_codigo is None
+            or key_inscricao is None
+            or key_codigo == key_inscricao
+        ):
+            key = key_codigo if key_codigo is not None else key_inscricao
+            if self._apply(key, data):
+                self.alterados += 1
+            else:
+                self.inalterados += 1
+        else:
+            with self.stage("conflitos"):
+                if key_codigo < 0 or key_inscricao < 0:
+                    # a resolução usa os ids, grava os imóveis novos antes
+                    self.flush()
+                    key_codigo = self.codigo_map[data["codigo"]]
+                    key_inscricao = self.inscricao_map[data["inscricao_imobiliaria"]]
+                self._resolve_conflict(data, key_codigo, key_inscricao)
+            self.alterados += 2
+
+    def _assign_new_ids(self, new_objects):
+        if connection.features.can_return_rows_from_bulk_insert:
+            return
+        ids = dict(
+            Imovel.objects.filter(
+                codigo__in=[imovel.codigo for imovel in new_objects]
+            ).values_list("codigo", "id")
+        )
+        for imovel in new_objects:
+            imovel.id = ids.get(imovel.codigo)
+
+    def _park_keys(self):
+        """
+        Passa os imóveis que trocam de código ou inscrição para chaves
+        provisórias, num UPDATE só: numa troca entre dois imóveis o valor
+        final de um ainda está gravado no outro.
+        """
+        if not self._rekeyed:
+            return
+        parked = Concat(Value(PARKED_PREFIX), Cast("id", CharField()))
+        Imovel.objects.filter(pk__in=self._rekeyed).update(
+            codigo=parked, inscricao_imobiliaria=parked
+        )
+
+    def _restore_keys(self, key, codigo, inscricao_imobiliaria):
+        for name, value in (
+            ("codigo", codigo),
+            ("inscricao_imobiliaria", inscricao_imobiliaria),
+        ):
+            try:
+                with transaction.atomic():
+                    Imovel.objects.filter(pk=key).update(**{name: value})
+            except DatabaseError as ex:
+                # o valor já foi gravado em outro imóvel desta importação,
+                # fica a chave provisória
+                logger.error(ex)
+
+    def _write_bulk(self):
+        new_objects = list(self._new.values())
+        with transaction.atomic():
+            self._park_keys()
+            if self._renamed:
+                Imovel.objects.bulk_update(
+                    list(self._renamed.values()), RENAME_FIELDS
+                )
+            if self._rehashed:
+                Imovel.objects.bulk_update(
+                    list(self._rehashed.values()), ["fingerprint"]
+                )
+            if self._changed:
+                Imovel.objects.bulk_update(
+                    list(self._changed.values()), UPDATE_FIELDS
+                )
+            if new_objects:
+                Imovel.objects.bulk_create(new_objects)
+                self._assign_new_ids(new_objects)
+            if self._conflicts:
+                ImovelConflict.objects.bulk_create(self._conflicts)
+            if self._changes:
+                ImovelChange.objects.bulk_create(self._changes)
+
+    def _write_sequential(self) -> set:
+        """
+        Grava um imóvel por vez, cada um no seu savepoint, depois de passar
+        os que trocam de chave para as chaves provisórias. Os imóveis que
+        falham voltam para o código e a inscrição gravados antes.
+        :returns: as chaves que não foram gravadas
+        """
+        stored = {
+            pk: (codigo, inscricao_imobiliaria)
+            for pk, codigo, inscricao_imobiliaria in Imovel.objects.filter(
+                pk__in=self._rekeyed
+            ).values_list("id", "codigo", "inscricao_imobiliaria")
+        }
+        self._park_keys()
+        failed = set()
+        for key in self._touched:
+            imovel = self._objects[key]
+            is_new = key in self._new
+            if is_new:
+                imovel.id = None
+            try:
+                with transaction.atomic():
+                    imovel.save(force_insert=is_new)
+            except DatabaseError as ex:
+                logger.error(ex)
+                failed.add(key)
+                self.falhas += 1
+                if is_new:
+                    self.novos -= 1
+                    self._new.pop(key)
+                elif key in self._changed or key in self._renamed:
+                    self.alterados -= 1
+                self._changed.pop(key, None)
+                self._renamed.pop(key, None)
+                self._rehashed.pop(key, None)
+        # depois de todos, para não tomar a chave que outro imóvel recebeu
+        for key in failed:
+            if key in stored:
+                self._restore_keys(key, *stored[key])
+        return failed
+
+    def flush(self):
+        conflicts = self._conflicts
+        failed = set()
+        with self.stage("gravacao"):
+            if self._touched:
+                try:
+                    self._write_bulk()
+                except DatabaseError as ex:
+                    # algum imóvel não pode ser gravado, grava um a um e
+                    # registra só os conflitos e o histórico dos gravados
+                    logger.warning(ex)
+                    failed = self._write_sequential()
+                    self.load_maps()
+                    conflicts = [
+                        conflict
+                        for conflict in self._conflicts
+                        if conflict.vencedor_id not in failed
+                        and conflict.perdedor_id not in failed
+                    ]
+                    if conflicts:
+                        ImovelConflict.objects.bulk_create(conflicts)
+                    ImovelChange.objects.bulk_create(
+                        [
+                            change
+                            for change in self._changes
+                            if change.imovel_id not in failed
+                        ]
+                    )
+                for imovel in self._new.values():
+                    if imovel.id:
+                        self.codigo_map[imovel.codigo] = imovel.id
+                        self.inscricao_map[imovel.inscricao_imobiliaria] = imovel.id
+                        self.fingerprint_map[imovel.id] = imovel.fingerprint
+
+        self.conflitos += len(conflicts)
+
+        objects = self._objects
+        self._reset_chunk()
+        # mantém os imóveis já carregados para o restante do chunk, menos os
+        # que não foram gravados, que diferem do banco
+        self._objects = {
+            key: imovel
+            for key, imovel in objects.items()
+            if key > 0 and key not in failed
+        }
+
+    def write_rejected(self):
+        dest_folder = (settings.MEDIA_ROOT + "//temp_geoitajai")
+        os.makedirs(dest_folder, exist_ok=True)
+        filename = (
+            f'{datetime.now().strftime("%Y-%m-%d")}-{self.log.id}-REJEITADOS.csv'
+        )
+        pd.concat(self.rejected).to_csv(
+            os.path.join(dest_folder, filename), index=False, sep=";"
+        )
+
+    def save_progress(self, total_rows, checkpoint):
+        # só os contadores, na mesma transação do chunk: o checkpoint
+        # aponta sempre para o último chunk gravado
+        with self.stage("progresso"):
+            self.log.state = 21
+            self.log.total = self.total
+            self.log.inalterados = self.inalterados
+            self.log.alterados = self.alterados
+            self.log.novos = self.novos
+            self.log.falhas = self.falhas
+            self.log.rejeitados = self.rejeitados
+            self.log.conflitos = self.conflitos
+            self.log.checkpoint = checkpoint
+            if total_rows and total_rows > 1:
+                self.log.progresso = min(self.total / total_rows, 0.99)
+            else:
+                self.log.progresso = 0
+            self.log.save(update_fields=PROGRESS_FIELDS)
+
+    def resume(self):
+        """Continua a partir do último chunk gravado de uma importação interrompida."""
+        print(f"Retomando a importação a partir da linha {self.log.checkpoint}")
+        self.total = self.log.total
+        self.inalterados = self.log.inalterados
+        self.alterados = self.log.alterados
+        self.novos = self.log.novos
+        self.falhas = self.log.falhas
+        self.rejeitados = self.log.rejeitados
+        self.conflitos = self.log.conflitos
+        self.log.status = "Lendo"
+        self.log.response = "Retomando a importação"
+        self.log.save(update_fields=["status", "response", "datetime"])
+
+    def start(self):
+        print("Lendo arquivo")
+        self.log.state = 20
+        self.log.status = "Lendo"
+        self.log.response = "Lendo arquivo"
+        self.log.total = 0
+        self.log.inalterados = 0
+        self.log.alterados = 0
+        self.log.novos = 0
+        self.log.falhas = 0
+        self.log.rejeitados = 0
+        self.log.conflitos = 0
+        self.log.checkpoint = 0
+        self.log.progresso = 0
+        self.log.save()
+
+    def validate(self, df):
+        with self.stage("validacao"):
+            df, rejected = validate_chunk(
+                df, self.seen_codigos, self.seen_inscricoes
+            )
+        if not rejected.empty:
+            self.total += len(rejected.index)
+            self.rejeitados += len(rejected.index)
+            self.rejected.append(rejected)
+        return df
+
+    def process_chunk(self, df):
+        self.process_rows(self.validate(df))
+
+    def prepare(self, df) -> list:
+        """Limpa as linhas de um DataFrame já validado, retorna (dados, fingerprint)."""
+        prepared = []
+        with self.stage("preparo"):
+            for row in df.to_dict("records"):
+                self.total += 1
+                try:
+                    data = clean_imovel_data(row)
+                    prepared.append((data, get_fingerprint(data)))
+                except Exception as ex:
+                    self.falhas += 1
+                    logger.error(ex)
+        return prepared
+
+    def process_rows(self, df):
+        """Importa as linhas de um DataFrame já validado."""
+        self.process_prepared(self.prepare(df))
+
+    def process_prepared(self, prepared):
+        self.now = timezone.now()
+        self._objects = {}
+        with self.stage("classificacao"):
+            self.preload(prepared)
+            for data, row_fingerprint in prepared:
+                try:
+                    self.process_row(data, row_fingerprint)
+                except Exception as ex:
+                    self.falhas += 1
+                    logger.error(ex)
+        self.flush()
+
+    def run(self, chunks, total_rows=0, deactivate=False):
+        checkpoint = self.log.checkpoint
+        if checkpoint:
+            self.resume()
+        else:
+            self.start()
+
+        self.load_maps()
+
+        for df in self.read(chunks):
+            if df.empty:
+                continue
+            position = int(df.index[-1]) + 1
+            if position <= checkpoint:
+                # chunk já gravado: só refaz a validação, para a detecção de
+                # duplicados e o relatório de rejeitados
+                _, rejected = validate_chunk(
+                    df, self.seen_codigos, self.seen_inscricoes
+                )
+                if not rejected.empty:
+                    self.rejected.append(rejected)
+                continue
+            with transaction.atomic():
+                self.process_chunk(df)
+                self.save_progress(total_rows, position)
+            self.print_progress()
+
+        return self.finish(deactivate)
+
+    def print_progress(self):
+        print(f'''Lendo arquivo compactado:
+                Total= {str(self.total)}
+                Inalterados= {str(self.inalterados)}
+                Alterados= {str(self.alterados)}
+                Novos= {str(self.novos)}
+                Falhas= {str(self.falhas)}
+                Rejeitados= {str(self.rejeitados)}
+                Conflitos= {str(self.conflitos)}''')
+
+    def counters(self) -> dict:
+        return {name: getattr(self, name) for name in PARTITION_COUNTERS}
+
+    def merge(self, counters: dict):
+        for name, value in counters.items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def serial_mask(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Linhas que precisam ser importadas em sequência, antes das partições:
+        código e inscrição de imóveis diferentes (conflito), ou um imóvel
+        alcançado por mais de uma linha. As demais alteram cada uma um imóvel
+        só, ou criam um novo, e podem ir para qualquer partição.
+        """
+        key_codigo = df["codigo"].map(self.codigo_map)
+        key_inscricao = df["inscricao_imobiliaria"].map(self.inscricao_map)
+        touched = pd.concat(
+            [key_codigo, key_inscricao.where(key_inscricao != key_codigo)]
+        ).dropna()
+        counts = touched.value_counts()
+        shared = counts[counts > 1].index
+        return (
+            (key_codigo.notna() & key_inscricao.notna() & (key_codigo != key_inscricao))
+            | key_codigo.isin(shared)
+            | key_inscricao.isin(shared)
+        )
+
+    def run_parallel(self, chunks, total_rows=0, workers=2, deactivate=False):
+        """
+        Importa em paralelo, num pool de processos. O arquivo é lido e validado
+        inteiro, as linhas com colisões entre partições são importadas aqui
+        primeiro e o restante é dividido pelo hash do código entre os workers,
+        cada um com a sua conexão. Os contadores voltam para este log.
+        Não grava checkpoints: numa nova tentativa as linhas já gravadas
+        passam direto pelo fingerprint.
+        """
+        self.start()
+        frames = [self.validate(df) for df in self.read(chunks) if not df.empty]
+        if not frames:
+            return self.finish(deactivate)
+        df = pd.concat(frames)
+
+        self.load_maps()
+        serial = self.serial_mask(df)
+        for chunk in dataframe_chunks(df[serial], self.chunk_size):
+            with transaction.atomic():
+                self.process_rows(chunk)
+                self.save_progress(total_rows, 0)
+        print(f"Importadas {serial.sum()} linhas com colisões entre partições")
+
+        df = df[~serial]
+        partition = df["codigo"].map(
+            lambda codigo: zlib.crc32(codigo.encode()) % workers
+        )
+        partitions = [df[partition == n] for n in range(workers)]
+        # processos novos (spawn), que não herdam a conexão deste: fechá-la
+        # antes de um fork liberaria a trava de importação no meio dela
+        with self.stage("particoes"):
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            ) as executor:
+                futures = [
+                    executor.submit(import_partition, self.log.id, rows, self.chunk_size)
+                    for rows in partitions
+                    if not rows.empty
+                ]
+                for future in as_completed(futures):
+                    self.merge(future.result())
+                    self.save_progress(total_rows, 0)
+                    self.print_progress()
+
+        return self.finish(deactivate)
+
+    def deactivate_missing(self):
+        """
+        Inativa, com a geração desta importação (o id do log), os imóveis cujo
+        código e inscrição não estão no arquivo, rejeitados inclusive, e
+        reativa os que voltaram. As chaves do arquivo vão para tabelas
+        temporárias e cada caso é um UPDATE só, com anti-join, precedido
+        do registro no histórico (ImovelChange).
+        """
+        codigos = set(self.seen_codigos)
+        inscricoes = set(self.seen_inscricoes)
+        for rejected in self.rejected:
+            codigos.update(rejected["codigo"].dropna())
+            inscricoes.update(rejected["inscricao_imobiliaria"].dropna())
+        if not codigos:
+            # arquivo sem nenhuma linha, não inativa o cadastro inteiro
+            return
+
+        imovel = Imovel._meta.db_table
+        present = (
+            f"EXISTS (SELECT 1 FROM {CODIGOS_TABLE} k WHERE k.chave = {imovel}.codigo)"
+            f" OR EXISTS (SELECT 1 FROM {INSCRICOES_TABLE} k"
+            f" WHERE k.chave = {imovel}.inscricao_imobiliaria)"
+        )
+        defaults = ", ".join(["%s"] * len(DEFAULT_CODIGOS))
+        missing = f"ativo = %s AND codigo NOT IN ({defaults}) AND NOT ({present})"
+        missing_params = [True, *DEFAULT_CODIGOS]
+        returned = f"ativo = %s AND ({present})"
+        journal = (
+            f"INSERT INTO {ImovelChange._meta.db_table} "
+            "(imovel_id, log_id, diferencas, created) "
+            f"SELECT id, %s, %s, %s FROM {imovel} WHERE "
+        )
+        with self.stage("inativos"), transaction.atomic():
+            with connection.cursor() as cursor:
+                load_keys(cursor, CODIGOS_TABLE, codigos)
+                load_keys(cursor, INSCRICOES_TABLE, inscricoes)
+                cursor.execute(
+                    journal + missing,
+                    [
+                        self.log.id,
+                        json.dumps({"ativo": [True, False], "geracao": [None, self.log.id]}),
+                        self.now,
+                        *missing_params,
+                    ],
+                )
+                cursor.execute(
+                    f"UPDATE {imovel} SET ativo = %s, geracao = %s, updated = %s WHERE {missing}",
+                    [False, self.log.id, self.now, *missing_params],
+                )
+                self.inativos = cursor.rowcount
+                cursor.execute(
+                    journal + returned,
+                    [self.log.id, json.dumps({"ativo": [False, True]}), self.now, False],
+                )
+                cursor.execute(
+                    f"UPDATE {imovel} SET ativo = %s, geracao = NULL, updated = %s WHERE {returned}",
+                    [True, self.now, False],
+                )
+                self.reativados = cursor.rowcount
+                cursor.execute(f"DROP TABLE {CODIGOS_TABLE}")
+                cursor.execute(f"DROP TABLE {INSCRICOES_TABLE}")
+        print(f"Imóveis inativados: {self.inativos} | reativados: {self.reativados}")
+
+    def finish(self, deactivate=False):
+        # só um arquivo com o cadastro inteiro diz quais imóveis saíram dele,
+        # nunca uma parte dele (benchmark, partições, planilhas parciais)
+        if deactivate:
+            self.deactivate_missing()
+        print(
+            "total: " + str(self.total),
+            " | inalterados: " + str(self.inalterados),
+            " | alterados: " + str(self.alterados),
+            " | novos: " + str(self.novos),
+            " | falhas: " + str(self.falhas),
+            " | rejeitados: " + str(self.rejeitados),
+            " | conflitos: " + str(self.conflitos),
+            " | inativos: " + str(self.inativos),
+        )
+        if self.rejected:
+            with self.stage("finalizacao"):
+                self.write_rejected()
+        print("Done!")
+        self.log.state = 99
+        self.log.total = self.total
+        self.log.inalterados = self.inalterados
+        self.log.alterados = self.alterados
+        self.log.novos = self.novos
+        self.log.falhas = self.falhas
+        self.log.rejeitados = self.rejeitados
+        self.log.conflitos = self.conflitos
+        self.log.inativos = self.inativos
+        self.log.etapas = self.meter.report(self.total)
+        self.log.progresso = 1
+        self.log.status = "Finalizado"
+        self.log.response = (
+            f'Imóveis atualizados ({str(self.novos)} novos, {str(self.alterados)} alterados,'
+            f' {str(self.inativos)} inativos e {str(self.rejeitados)} rejeitados)'
+        )
+        self.log.save()
+        return True
+
+
+def copy_value(value) -> str:
+    # formato text do COPY: \N é nulo, barra, tab e quebras de linha escapados
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def load_keys(cursor, table: str, keys):
+    """Cria a tabela temporária table com as chaves, COPY no Postgres."""
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    cursor.execute(f"CREATE TEMPORARY TABLE {table} (chave text PRIMARY KEY)")
+    if connection.vendor == "postgresql":
+        buffer = io.StringIO("".join(copy_value(key) + "\n" for key in keys))
+        cursor.copy_expert(f"COPY {table} (chave) FROM STDIN", buffer)
+        cursor.execute(f"ANALYZE {table}")
+    else:
+        cursor.executemany(
+            f"INSERT INTO {table} (chave) VALUES (%s)", [(key,) for key in keys]
+        )
+
+
+class StagingImporter(ImovelImporter):
+    """
+    Importação pelo Postgres: as linhas validadas são copiadas com COPY para
+    uma tabela temporária e aplicadas em eventapp_imovel com UPDATE ... FROM e
+    INSERT ... ON CONFLICT, com as regras de conflito do ImovelImporter
+    escritas em SQL sobre a tabela temporária.
+
+    Linhas que alcançam um imóvel também alcançado por outra linha dependem
+    da ordem do arquivo e são importadas pelo ImovelImporter, em seguida.
+    As alterações são gravadas numa transação só, sem checkpoints.
+    """
+
+    def run(self, chunks, total_rows=0, deactivate=False):
+        self.start()
+        try:
+            with connection.cursor() as cursor:
+                self.create_staging(cursor)
+                for df in self.read(chunks):
+                    if df.empty:
+                        continue
+                    df = self.validate(df)
+                    with self.stage("copia"):
+                        self.copy_chunk(cursor, df)
+                    self.save_progress(total_rows, 0)
+                    self.print_progress()
+                with self.stage("copia"):
+                    cursor.execute(f"ANALYZE {STAGING_TABLE}")
+
+                with transaction.atomic():
+                    self.now = timezone.now()
+                    with self.stage("classificacao"):
+                        self.classify(cursor)
+                    with self.stage("gravacao"):
+                        self.apply_staging(cursor)
+                        self.count_staging(cursor)
+                        entangled = self.entangled_rows(cursor)
+                    if entangled:
+                        print(f"Importando {len(entangled)} linhas com imóveis em comum")
+                        self.load_maps()
+                        self.process_prepared(entangled)
+                    self.save_progress(total_rows, 0)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+
+        return self.finish(deactivate)
+
+    def create_staging(self, cursor):
+        columns = ", ".join(
+            f"{name} {Imovel._meta.get_field(name).db_type(connection)}"
+            for name in STAGING_FIELDS[1:]
+        )
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {STAGING_TABLE} ("
+            f"linha integer PRIMARY KEY, {columns}, "
+            "key_codigo integer, key_inscricao integer, situacao varchar(2), "
+            "resolucao varchar(2), vencedor integer, perdedor integer)"
+        )
+
+    def copy_chunk(self, cursor, df):
+        buffer = io.StringIO()
+        for position, row in zip(df.index, df.to_dict("records")):
+            self.total += 1
+            try:
+                data = clean_imovel_data(row)
+            except Exception as ex:
+                self.falhas += 1
+                logger.error(ex)
+                continue
+            values = (
+                [position + 2]
+                + [data[name] for name in COMPARE_FIELDS]
+                + [get_fingerprint(data)]
+            )
+            buffer.write("\t".join(copy_value(value) for value in values) + "\n")
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(STAGING_FIELDS)}) FROM STDIN", buffer
+        )
+
+    def classify(self, cursor):
+        """
+        Situação de cada linha: NO novo, AL alterado, IN inalterado, RH só o
+        fingerprint desatualizado, CF conflito e EN com imóveis em comum.
+        """
+        imovel = Imovel._meta.db_table
+
+        cursor.execute(
+            f"UPDATE {STAGING_TABLE} s SET key_codigo = m.id "
+            f"FROM {imovel} m WHERE m.codigo = s.codigo"
+        )
+        cursor.execute(
+            f"UPDATE {STAGING_TABLE} s SET key_inscricao = m.id "
+            f"FROM {imovel} m WHERE m.inscricao_imobiliaria = s.inscricao_imobiliaria"
+        )
+        # mesmas linhas do ImovelImporter.serial_mask, menos os conflitos
+        cursor.execute(
+            f"""
+            WITH shared AS (
+                SELECT id FROM (
+                    SELECT key_codigo AS id FROM {STAGING_TABLE}
+                    UNION ALL
+                    SELECT key_inscricao FROM {STAGING_TABLE}
+                    WHERE key_inscricao IS DISTINCT FROM key_codigo
+                ) touched
+                WHERE id IS NOT NULL
+                GROUP BY id HAVING count(*) > 1
+            )
+            UPDATE {STAGING_TABLE} SET situacao = 'EN'
+            WHERE key_codigo IN (SELECT id FROM shared)
+                OR key_inscricao IN (SELECT id FROM shared)
+            """
+        )
+        cursor.execute(
+            f"UPDATE {STAGING_TABLE} SET situacao = 'NO' "
+            "WHERE situacao IS NULL AND key_codigo IS NULL AND key_inscricao IS NULL"
+        )
+        cursor.execute(
+            f"""
+            UPDATE {STAGING_TABLE} s SET situacao = CASE
+                WHEN s.key_codigo = s.key_inscricao
+                    AND s.fingerprint = m.fingerprint THEN 'IN'
+                WHEN ({", ".join("s." + name for name in COMPARE_FIELDS)})
+                    IS DISTINCT FROM ({", ".join("m." + name for name in COMPARE_FIELDS)})
+                    THEN 'AL'
+                WHEN s.fingerprint IS DISTINCT FROM m.fingerprint THEN 'RH'
+                ELSE 'IN'
+            END
+            FROM {imovel} m
+            WHERE s.situacao IS NULL
+                AND m.id = COALESCE(s.key_codigo, s.key_inscricao)
+                AND (s.key_codigo IS NULL OR s.key_inscricao IS NULL
+                    OR s.key_codigo = s.key_inscricao)
+            """
+        )
+        # conflito: prioridade do imóvel da inscrição, a não ser que só o
+        # imóvel do código confira com o endereço, ver _resolve_conflict
+        codigo_check = (
+            f"({', '.join('c.' + name for name in ADDRESS_FIELDS)}) "
+            f"IS NOT DISTINCT FROM ({', '.join('s.' + name for name in ADDRESS_FIELDS)})"
+        )
+        inscricao_check = codigo_check.replace("c.", "i.")
+        cursor.execute(
+            f"""
+            UPDATE {STAGING_TABLE} s SET situacao = 'CF', resolucao = CASE
+                WHEN {codigo_check} AND NOT {inscricao_check} THEN %(codigo)s
+                WHEN {inscricao_check} AND NOT {codigo_check} THEN %(inscricao)s
+                WHEN {inscricao_check} THEN %(ambos)s
+                ELSE %(nenhum)s
+            END
+            FROM {imovel} c, {imovel} i
+            WHERE s.situacao IS NULL
+                AND c.id = s.key_codigo AND i.id = s.key_inscricao
+            """,
+            {
+                "codigo": ImovelConflict.CODIGO,
+                "inscricao": ImovelConflict.INSCRICAO,
+                "ambos": ImovelConflict.AMBOS,
+                "nenhum": ImovelConflict.NENHUM,
+            },
+        )
+        cursor.execute(
+            f"""
+            UPDATE {STAGING_TABLE} SET
+                vencedor = CASE WHEN resolucao = %(codigo)s
+                    THEN key_codigo ELSE key_inscricao END,
+                perdedor = CASE WHEN resolucao = %(codigo)s
+                    THEN key_inscricao ELSE key_codigo END
+            WHERE situacao = 'CF'
+            """,
+            {"codigo": ImovelConflict.CODIGO},
+        )
+
+    def apply_staging(self, cursor):
+        imovel = Imovel._meta.db_table
+        params = {
+            "now": self.now,
+            "log": self.log.id,
+            "codigo": ImovelConflict.CODIGO,
+        }
+
+        def as_json(alias, name):
+            # o DjangoJSONEncoder grava o Decimal como texto
+            if name == "area_lote":
+                return f"{alias}.{name}::text"
+            return f"{alias}.{name}"
+
+        diferencas = ", ".join(
+            f"'{name}', CASE WHEN c.{name} IS DISTINCT FROM i.{name} "
+            f"OR c.{name} IS DISTINCT FROM s.{name} THEN jsonb_build_array("
+            f"{as_json('c', name)}, {as_json('i', name)}, {as_json('s', name)}) END"
+            for name in COMPARE_FIELDS
+        )
+        dados = ", ".join(
+            f"'{name}', {as_json('s', name)}" for name in COMPARE_FIELDS
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {ImovelConflict._meta.db_table} (
+                log_id, resolucao, imovel_codigo_id, imovel_inscricao_id,
+                vencedor_id, perdedor_id, campo, valor_anterior,
+                diferencas, dados, created
+            )
+            SELECT
+                %(log)s, s.resolucao, s.key_codigo, s.key_inscricao,
+                s.vencedor, s.perdedor,
+                CASE WHEN s.resolucao = %(codigo)s
+                    THEN 'inscricao_imobiliaria' ELSE 'codigo' END,
+                COALESCE(CASE WHEN s.resolucao = %(codigo)s
+                    THEN i.inscricao_imobiliaria ELSE c.codigo END, ''),
+                jsonb_strip_nulls(jsonb_build_object({diferencas})),
+                jsonb_build_object({dados}),
+                %(now)s
+            FROM {STAGING_TABLE} s
+            JOIN {imovel} c ON c.id = s.key_codigo
+            JOIN {imovel} i ON i.id = s.key_inscricao
+            WHERE s.situacao = 'CF'
+            ORDER BY s.linha
+            """,
+            params,
+        )
+
+        # histórico, antes das alterações: o perdedor do conflito troca o
+        # código ou a inscrição (e o codigo_lote), os demais recebem a linha
+        renamed = (
+            "CASE WHEN s.resolucao = %(codigo)s THEN m.inscricao_imobiliaria ELSE m.codigo END"
+        )
+        new_name = "'ERROR_CHANGE_' || m.id || '_IN_FAVOR_OF_' || s.vencedor"
+        new_lote = (
+            f"left(regexp_replace(CASE WHEN s.resolucao = %(codigo)s THEN {new_name}"
+            f" ELSE m.inscricao_imobiliaria END, '\\D', '', 'g'), {INSCRICAO_MIN_DIGITS})"
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {ImovelChange._meta.db_table} (imovel_id, log_id, diferencas, created)
+            SELECT
+                m.id, %(log)s,
+                jsonb_strip_nulls(jsonb_build_object(
+                    CASE WHEN s.resolucao = %(codigo)s
+                        THEN 'inscricao_imobiliaria' ELSE 'codigo' END,
+                    jsonb_build_array({renamed}, {new_name}),
+                    'codigo_lote', CASE WHEN m.codigo_lote IS DISTINCT FROM {new_lote}
+                        THEN jsonb_build_array(m.codigo_lote, {new_lote}) END
+                )),
+                %(now)s
+            FROM {STAGING_TABLE} s
+            JOIN {imovel} m ON m.id = s.perdedor
+            WHERE s.situacao = 'CF'
+            ORDER BY s.linha
+            """,
+            params,
+        )
+        changes = ", ".join(
+            f"'{name}', CASE WHEN m.{name} IS DISTINCT FROM s.{name} THEN "
+            f"jsonb_build_array({as_json('m', name)}, {as_json('s', name)}) END"
+            for name in COMPARE_FIELDS
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {ImovelChange._meta.db_table} (imovel_id, log_id, diferencas, created)
+            SELECT
+                m.id, %(log)s, jsonb_strip_nulls(jsonb_build_object({changes})), %(now)s
+            FROM {STAGING_TABLE} s
+            JOIN {imovel} m ON m.id = COALESCE(s.vencedor, s.key_codigo, s.key_inscricao)
+            WHERE s.situacao IN ('AL', 'CF')
+            ORDER BY s.linha
+            """,
+            params,
+        )
+
+        # o perdedor do conflito libera o código ou a inscrição para o
+        # vencedor; o fingerprint é calculado em Python e fica vazio
+        cursor.execute(
+            f"""
+            UPDATE {imovel} m SET
+                codigo = CASE WHEN s.resolucao = %(codigo)s THEN m.codigo
+                    ELSE 'ERROR_CHANGE_' || m.id || '_IN_FAVOR_OF_' || s.vencedor END,
+                inscricao_imobiliaria = CASE WHEN s.resolucao = %(codigo)s
+                    THEN 'ERROR_CHANGE_' || m.id || '_IN_FAVOR_OF_' || s.vencedor
+                    ELSE m.inscricao_imobiliaria END,
+                fingerprint = '',
+                imported = %(now)s,
+                updated = %(now)s
+            FROM {STAGING_TABLE} s
+            WHERE s.situacao = 'CF' AND m.id = s.perdedor
+            """,
+            params,
+        )
+        cursor.execute(
+            f"""
+            UPDATE {imovel} m SET codigo_lote = left(
+                regexp_replace(m.inscricao_imobiliaria, '\\D', '', 'g'), {INSCRICAO_MIN_DIGITS}
+            )
+            FROM {STAGING_TABLE} s
+            WHERE s.situacao = 'CF' AND m.id = s.perdedor
+            """
+        )
+
+        assignments = ", ".join(f"{name} = s.{name}" for name in COMPARE_FIELDS)
+        cursor.execute(
+            f"""
+            UPDATE {imovel} m SET
+                {assignments},
+                fingerprint = s.fingerprint,
+                imported = %(now)s,
+                updated = %(now)s
+            FROM {STAGING_TABLE} s
+            WHERE s.situacao IN ('AL', 'CF')
+                AND m.id = COALESCE(s.vencedor, s.key_codigo, s.key_inscricao)
+            """,
+            params,
+        )
+        cursor.execute(
+            f"""
+            UPDATE {imovel} m SET fingerprint = s.fingerprint
+            FROM {STAGING_TABLE} s
+            WHERE s.situacao = 'RH'
+                AND m.id = COALESCE(s.key_codigo, s.key_inscricao)
+            """
+        )
+
+        fields = ", ".join(COMPARE_FIELDS)
+        cursor.execute(
+            f"""
+            INSERT INTO {imovel} (
+                {fields}, cep, fingerprint, created, updated, imported, ativo
+            )
+            SELECT
+                {", ".join("s." + name for name in COMPARE_FIELDS)},
+                '', s.fingerprint, %(now)s, %(now)s, %(now)s, true
+            FROM {STAGING_TABLE} s
+            WHERE s.situacao = 'NO'
+            ORDER BY s.linha
+            ON CONFLICT DO NOTHING
+            """,
+            params,
+        )
+        self.inserted = cursor.rowcount
+
+    def count_staging(self, cursor):
+        cursor.execute(
+            f"SELECT situacao, count(*) FROM {STAGING_TABLE} GROUP BY situacao"
+        )
+        counts = dict(cursor.fetchall())
+        self.inalterados += counts.get("IN", 0) + counts.get("RH", 0)
+        self.alterados += counts.get("AL", 0) + 2 * counts.get("CF", 0)
+        self.conflitos += counts.get("CF", 0)
+        self.novos += self.inserted
+        self.falhas += counts.get("NO", 0) - self.inserted
+
+    def entangled_rows(self, cursor) -> list:
+        cursor.execute(
+            f"SELECT {', '.join(COMPARE_FIELDS)}, fingerprint FROM {STAGING_TABLE} "
+            "WHERE situacao = 'EN' ORDER BY linha"
+        )
+        return [
+            (dict(zip(COMPARE_FIELDS, row[:-1])), row[-1])
+            for row in cursor.fetchall()
+        ]
+
+
+def import_partition(log_id: int, df: pd.DataFrame, chunk_size=CHUNK_SIZE) -> dict:
+    """Importa uma partição no processo do pool, retorna os contadores."""
+    try:
+        importer = ImovelImporter(
+            ImovelUpdateLog.objects.get(id=log_id), chunk_size
+        )
+        importer.load_maps()
+        for chunk in dataframe_chunks(df, chunk_size):
+            with transaction.atomic():
+                importer.process_rows(chunk)
+        return importer.counters()
+    finally:
+        connections.close_all()
+
+
+def diff_value(value) -> str:
+    return "" if pd.isna(value) else str(value)
+
+
+def values_differ(new: pd.Series, old: pd.Series, name: str) -> pd.Series:
+    if name == "area_lote":
+        new = pd.to_numeric(new, errors="coerce").round(2)
+        old = pd.to_numeric(old, errors="coerce").round(2)
+    return ~((new == old) | (new.isna() & old.isna()))
+
+
+def dry_run(chunks) -> tuple:
+    """
+    Simula a importação, sem gravar nada nem buscar CEP.
+    Classifica as linhas de uma vez contra uma cópia dos imóveis em memória.
+    :param chunks: DataFrames como os do SpreadsheetReader
+    :returns: (resumo, DataFrame com a diferença de cada linha)
+    """
+    seen_codigos = set()
+    seen_inscricoes = set()
+    frames = []
+    rejected = []
+    for df in chunks:
+        df, chunk_rejected = validate_chunk(df, seen_codigos, seen_inscricoes)
+        frames.append(df)
+        if not chunk_rejected.empty:
+            rejected.append(chunk_rejected)
+    df = pd.concat(frames) if frames else pd.DataFrame(columns=COMPARE_FIELDS)
+
+    db = pd.DataFrame.from_records(
+        Imovel.objects.values_list("id", "ativo", *COMPARE_FIELDS).iterator(),
+        columns=["id", "ativo"] + COMPARE_FIELDS,
+    ).set_index("id", drop=False)
+    key_codigo = df["codigo"].map(
+        pd.Series(db["id"].values, index=db["codigo"].values)
+    )
+    key_inscricao = df["inscricao_imobiliaria"].map(
+        pd.Series(db["id"].values, index=db["inscricao_imobiliaria"].values)
+    )
+
+    novo = key_codigo.isna() & key_inscricao.isna()
+    conflito = key_codigo.notna() & key_inscricao.notna() & (key_codigo != key_inscricao)
+    matched = ~novo & ~conflito
+    ids = key_codigo.fillna(key_inscricao)[matched].astype(int)
+    old = db.loc[ids.values]
+    old.index = ids.index
+    new = df[matched]
+
+    changed = pd.DataFrame(
+        {name: values_differ(new[name], old[name], name) for name in COMPARE_FIELDS},
+        index=ids.index,
+    )
+    alterado = changed.any(axis=1)
+    detalhes = pd.Series("", index=ids.index)
+    for name in COMPARE_FIELDS:
+        mask = changed[name]
+        detalhes[mask] += (
+            name + ": " + old.loc[mask, name].map(diff_value)
+            + " -> " + new.loc[mask, name].map(diff_value) + "; "
+        )
+
+    # conflitos como no ImovelImporter._resolve_conflict: o imóvel do código
+    # vence se só ele confere com o endereço da linha, senão o da inscrição,
+    # e o perdedor fica com o código (ou a inscrição) ERROR_CHANGE_...
+    conflitos = df[conflito]
+    key_codigo_conflito = key_codigo[conflito].astype(int)
+    key_inscricao_conflito = key_inscricao[conflito].astype(int)
+
+    def same_address_as(keys):
+        stored = db.loc[keys.values, ADDRESS_FIELDS]
+        stored.index = keys.index
+        return ~pd.concat(
+            [values_differ(conflitos[name], stored[name], name) for name in ADDRESS_FIELDS],
+            axis=1,
+        ).any(axis=1)
+
+    vence_codigo = same_address_as(key_codigo_conflito) & ~same_address_as(
+        key_inscricao_conflito
+    )
+    vencedor = key_codigo_conflito.where(vence_codigo, key_inscricao_conflito)
+    perdedor = key_inscricao_conflito.where(vence_codigo, key_codigo_conflito)
+
+    # como o deactivate_missing: fica ativo o imóvel com o código ou a
+    # inscrição no arquivo, rejeitados inclusive, depois da troca do perdedor
+    codigos = set(seen_codigos)
+    inscricoes = set(seen_inscricoes)
+    for chunk_rejected in rejected:
+        codigos.update(chunk_rejected["codigo"].dropna())
+        inscricoes.update(chunk_rejected["inscricao_imobiliaria"].dropna())
+    sem_codigo = db["id"].isin(perdedor[~vence_codigo])
+    sem_inscricao = db["id"].isin(perdedor[vence_codigo])
+    present = (
+        db["id"].isin(ids)
+        | db["id"].isin(vencedor)
+        | (db["codigo"].isin(codigos) & ~sem_codigo)
+        | (db["inscricao_imobiliaria"].isin(inscricoes) & ~sem_inscricao)
+    )
+    ausente = db[
+        ~present
+        & ~db["codigo"].isin(DEFAULT_CODIGOS)
+        & db["ativo"].astype(bool)
+    ]
+    perdeu = pd.Series(
+        (
+            "perde o conflito da linha " + (perdedor.index + 2).astype(str)
+            + " para o imóvel " + vencedor.astype(str)
+        ).values,
+        index=perdedor.values,
+    )
+    perdeu = perdeu[~perdeu.index.duplicated()]
+
+    def rows(mask_df, situacao, **columns):
+        return pd.DataFrame(
+            {
+                "linha": mask_df.index + 2,
+                "id": columns.get("id"),
+                "codigo": mask_df["codigo"],
+                "inscricao_imobiliaria": mask_df["inscricao_imobiliaria"],
+                "situacao": situacao,
+                "detalhes": columns.get("detalhes", ""),
+            }
+        )
+
+    parts = [
+        rows(df[novo], "novo"),
+        rows(new[alterado], "alterado", id=ids[alterado], detalhes=detalhes[alterado]),
+        rows(
+            conflitos,
+            "conflito",
+            id=vencedor,
+            detalhes=(
+                "código do imóvel " + key_codigo_conflito.astype(str)
+                + ", inscrição do imóvel " + key_inscricao_conflito.astype(str)
+                + ", vence o imóvel " + vencedor.astype(str)
+            ),
+        ),
+        pd.DataFrame(
+            {
+                "linha": None,
+                "id": ausente["id"],
+                "codigo": ausente["codigo"],
+                "inscricao_imobiliaria": ausente["inscricao_imobiliaria"],
+                "situacao": "ausente",
+                "detalhes": ausente["id"].map(perdeu).fillna(""),
+            }
+        ),
+    ]
+    for chunk_rejected in rejected:
+        parts.append(
+            pd.DataFrame(
+                {
+                    "linha": chunk_rejected["linha"],
+                    "id": None,
+                    "codigo": chunk_rejected["codigo"],
+                    "inscricao_imobiliaria": chunk_rejected["inscricao_imobiliaria"],
+                    "situacao": "rejeitado",
+                    "detalhes": chunk_rejected["motivo"],
+                }
+            )
+        )
+    diff = pd.concat(parts, ignore_index=True)
+
+    rejeitados = sum(len(chunk_rejected.index) for chunk_rejected in rejected)
+    summary = {
+        "total": len(df.index) + rejeitados,
+        "novos": int(novo.sum()),
+        "alterados": int(alterado.sum()),
+        "inalterados": int((~alterado).sum()),
+        "conflitos": int(conflito.sum()),
+        "ausentes": len(ausente.index),
+        "rejeitados": rejeitados,
+        "campos": {
+            name: int(count) for name, count in changed.sum().items() if count
+        },
+    }
+    return summary, diff
+
+
+def dry_run_file(file) -> tuple:
+    """
+    Simula a importação do arquivo e grava a diferença por linha em csv
+    :returns: (resumo, id do csv), ver diff_file_path
+    """
+    summary, diff = dry_run(SpreadsheetReader(file, None))
+    diff_id = uuid.uuid4().hex
+    os.makedirs(os.path.dirname(diff_file_path(diff_id)), exist_ok=True)
+    diff.to_csv(diff_file_path(diff_id), index=False, sep=";")
+    return summary, diff_id
+
+
+def diff_file_path(diff_id: str) -> str:
+    return os.path.join(
+        settings.MEDIA_ROOT + "//temp_geoitajai", f"{diff_id}-DIFF.csv"
+    )
+
+
+def update_from_dataframe(
+    df: pd.DataFrame, log: ImovelUpdateLog, importer=None, deactivate=False
+):
+    importer = importer or ImovelImporter(log)
+    with importer.meter.measure():
+        return importer.run(
+            dataframe_chunks(df, importer.chunk_size), len(df.index), deactivate
+        )
+
+
+def update_from_file(
+    file, log: ImovelUpdateLog, workers=None, deactivate=False, importer=None
+):
+    workers = workers or settings.IMPORT_WORKERS
+    if importer is None:
+        copy = settings.IMPORT_COPY and connection.vendor == "postgresql"
+        importer = StagingImporter(log) if copy else ImovelImporter(log)
+    copy = isinstance(importer, StagingImporter)
+    with importer.meter.measure():
+        # csv e parquet são lidos inteiros aqui
+        with importer.stage("leitura"):
+            reader = SpreadsheetReader(file, log, importer.chunk_size)
+        if workers > 1 and not copy:
+            return importer.run_parallel(
+                reader, reader.total_rows, workers, deactivate
+            )
+        return importer.run(reader, reader.total_rows, deactivate)
+
+
+def acquire_import_lock() -> bool:
+    """
+    Trava de sessão do Postgres, vale entre processos e servidores e é
+    liberada se a conexão do worker cair. Nos outros bancos não trava.
+    """
+    if connection.vendor != "postgresql":
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [IMPORT_LOCK_ID])
+        return cursor.fetchone()[0]
+
+
+def release_import_lock():
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [IMPORT_LOCK_ID])
+
+
+def fail_job(job: ImovelUpdateJob, error: str):
+    job.state = ImovelUpdateJob.FALHOU
+    job.error = error
+    job.finished = timezone.now()
+    job.save(update_fields=["state", "error", "finished"])
+    log = job.log
+    log.state = -1
+    log.status = "Falha"
+    log.response = error[:255]
+    log.save()
+
+
+def claim_next_job(worker: str):
+    """
+    Deve ser chamado com a trava de importação: um job ainda EXECUTANDO é de
+    um worker que parou no meio, e é retomado antes dos pendentes.
+    """
+    while True:
+        with transaction.atomic():
+            queryset = ImovelUpdateJob.objects.select_for_update(skip_locked=True)
+            job = (
+                queryset.filter(state=ImovelUpdateJob.EXECUTANDO).first()
+                or queryset.filter(state=ImovelUpdateJob.PENDENTE).first()
+            )
+            if not job:
+                return None
+            if job.attempts >= MAX_ATTEMPTS:
+                fail_job(job, f"Importação interrompida {job.attempts} vezes")
+                continue
+            job.state = ImovelUpdateJob.EXECUTANDO
+            job.started = timezone.now()
+            job.worker = worker
+            job.attempts += 1
+            job.save(update_fields=["state", "started", "worker", "attempts"])
+        return job
+
+
+def run_import_job(job: ImovelUpdateJob):
+    log = job.log
+    try:
+        update_default_imovel(log)
+        with job.file.open("rb") as file:
+            # os jobs do update-imovel são sempre o cadastro inteiro
+            update_from_file(file, log, deactivate=True)
+    except Exception as ex:
+        logger.exception(ex)
+        fail_job(job, str(ex))
+        return False
+    job.state = ImovelUpdateJob.CONCLUIDO
+    job.file.delete(save=False)
+    job.finished = timezone.now()
+    job.save(update_fields=["state", "finished", "file"])
+    return True
@@ -0,0 +1,91 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from rest_framework.exceptions import ParseError
+
+from eventapp.models import ImovelUpload, imovel_update_directory_path
+
+# leitura do arquivo montado para o checksum, nunca inteiro na memória
+BLOCK_SIZE = 1024 * 1024
+
+
+def imovel_upload_path(upload_id) -> str:
+    return os.path.join(settings.MEDIA_ROOT, "imovel_uploads", f"{upload_id}.part")
+
+
+def append_chunk(upload: ImovelUpload, chunk, checksum: str = "") -> int:
+    """
+    Grava a parte a partir de upload.received. Deve ser chamado com o upload
+    travado (select_for_update). Uma parte com checksum errado é descartada
+    e o upload continua do mesmo ponto.
+    :param chunk: UploadedFile, lido por chunks(), sem carregar na memória
+    :param checksum: sha256 da parte, opcional
+    :returns: bytes recebidos até agora
+    """
+    path = imovel_upload_path(upload.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    with open(path, "r+b" if os.path.exists(path) else "wb") as part:
+        # descarta o que sobrou de uma parte interrompida no meio
+        part.seek(upload.received)
+        part.truncate()
+        for data in chunk.chunks():
+            digest.update(data)
+            part.write(data)
+        if checksum and digest.hexdigest() != checksum.lower():
+            part.truncate(upload.received)
+            raise ParseError("Checksum da parte não confere")
+        received = part.tell()
+    upload.received = received
+    upload.save(update_fields=["received", "updated"])
+    return received
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(BLOCK_SIZE), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def finalize_upload(upload: ImovelUpload, checksum: str):
+    if upload.size is not None and upload.received != upload.size:
+        raise ParseError(f"Recebidos {upload.received} de {upload.size} bytes")
+    path = imovel_upload_path(upload.id)
+    if not os.path.exists(path):
+        raise ParseError("Nenhuma parte recebida")
+    digest = file_sha256(path)
+    if digest != checksum.lower():
+        raise ParseError("Checksum do arquivo não confere")
+    upload.state = ImovelUpload.FINALIZADO
+    upload.sha256 = digest
+    upload.save(update_fields=["state", "sha256", "updated"])
+
+
+def upload_file_name(upload: ImovelUpload) -> str:
+    """Nome no storage para onde move_upload vai mover o arquivo."""
+    filename = os.path.basename(upload.filename)
+    return default_storage.get_available_name(
+        imovel_update_directory_path(None, f"{upload.id.hex}-{filename}")
+    )
+
+
+def move_upload(upload: ImovelUpload, name: str):
+    """
+    Move o arquivo montado para o ImovelUpdateJob, sem copiar. Fica por
+    último na transação que cria o job, assim um erro antes não perde o
+    arquivo.
+    """
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(imovel_upload_path(upload.id), path)
+
+
+def delete_upload(upload: ImovelUpload):
+    path = imovel_upload_path(upload.id)
+    if os.path.exists(path):
+        os.remove(path)
+    upload.delete()
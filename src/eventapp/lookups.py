@@ -0,0 +1,43 @@
+from django.db.models import CharField, Func, Transform
+
+
+class ImmutableUnaccent(Transform):
+    """
+    unaccent pela função immutable_unaccent (migração 0040), que pode ser
+    usada nos índices de expressão: o unaccent da extensão é STABLE. Como o
+    unaccent do django.contrib.postgres, também se aplica ao valor buscado.
+    """
+
+    bilateral = True
+    lookup_name = "iunaccent"
+    function = "immutable_unaccent"
+
+
+class ImovelAddress(Func):
+    """
+    logradouro, numero e bairro do imóvel num texto só, com || (o concat do
+    Postgres não é IMMUTABLE): com iunaccent é a expressão dos índices
+    imovel_endereco_*, ver as migrações 0040 e 0041.
+    """
+
+    template = "coalesce(%(expressions)s, '')"
+    arg_joiner = ", '') || ' ' || coalesce("
+    output_field = CharField()
+
+    def __init__(self, **extra):
+        super().__init__("logradouro", "numero", "bairro", **extra)
+
+
+class CollateC(Func):
+    """
+    Expressão com COLLATE "C" (ordem dos bytes), que o Django 3.1 ainda não
+    tem: é a ordem do índice imovel_autocomplete_idx, ver a migração 0045. No
+    SQLite a ordem padrão (BINARY) já é essa.
+    """
+
+    template = '%(expressions)s COLLATE "C"'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template="%(expressions)s", **extra_context
+        )
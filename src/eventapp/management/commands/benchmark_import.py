@@ -0,0 +1,88 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from eventapp.imovel_benchmark import generate_cadastre, run_benchmark
+from eventapp.imovel_import import COLUMNS_DICT
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a importação de imóveis com um cadastro sintético: carga inicial "
+        "e atualização com alterações e conflitos, numa transação desfeita no fim"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000, help="Linhas do cadastro")
+        parser.add_argument(
+            "--changes", type=float, default=0.05, help="Fração de linhas alteradas"
+        )
+        parser.add_argument(
+            "--conflicts", type=float, default=0.01, help="Fração de linhas em conflito"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Semente do cadastro base")
+        parser.add_argument(
+            "--file",
+            help="Importa este arquivo (xlsx, csv ou parquet) em vez do cadastro sintético",
+        )
+        parser.add_argument(
+            "--copy", action="store_true", help="Usa a importação por COPY (Postgres)"
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Grava os imóveis e logs importados em vez de desfazer a transação",
+        )
+        parser.add_argument("--json", action="store_true", help="Relatório em JSON")
+
+    def handle(self, *args, **options):
+        if options["copy"] and connection.vendor != "postgresql":
+            raise CommandError("A importação por COPY precisa do Postgres")
+
+        # numa transação desfeita no fim: num banco com dados, os imóveis
+        # alterados pelo benchmark voltam ao que eram, não só os criados
+        reports = {}
+        with transaction.atomic():
+            if options["file"]:
+                reports["arquivo"] = run_benchmark(
+                    copy=options["copy"], path=options["file"]
+                )
+            else:
+                for name, changes, conflicts in [
+                    ("carga", 0, 0),
+                    ("atualizacao", options["changes"], options["conflicts"]),
+                ]:
+                    df = generate_cadastre(
+                        options["rows"], changes, conflicts, options["seed"]
+                    ).rename(columns=COLUMNS_DICT)
+                    reports[name] = run_benchmark(df, options["copy"])
+            if not options["keep"]:
+                transaction.set_rollback(True)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+        for name, report in reports.items():
+            self.stdout.write(self.style.SUCCESS(name))
+            self.stdout.write(
+                f"  {report['linhas']} linhas em {report['segundos']}s"
+                f" ({report['linhas_por_segundo']} linhas/s)"
+            )
+            peak = report["pico_rss_mb"]
+            self.stdout.write(
+                f"  {report['consultas']} consultas, pico de memória"
+                + (f" {peak} MB" if peak is not None else " não medido (só no Linux)")
+            )
+            self.stdout.write(
+                f"  novos {report['novos']}, alterados {report['alterados']},"
+                f" inalterados {report['inalterados']}, conflitos {report['conflitos']},"
+                f" falhas {report['falhas']}, rejeitados {report['rejeitados']}"
+            )
+            for stage, stats in report["etapas"].items():
+                memory = (
+                    f", {stats['memoria_mb']} MB" if stats["memoria_mb"] is not None else ""
+                )
+                self.stdout.write(
+                    f"  {stage}: {stats['segundos']}s, {stats['consultas']} consultas{memory}"
+                )
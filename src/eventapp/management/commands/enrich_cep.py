@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from eventapp.cep import CepEnricher
+
+
+class Command(BaseCommand):
+    help = "Busca o CEP dos imóveis que ainda não têm"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            help="Caminho da classe do backend, ex.: eventapp.cep.StubBackend",
+        )
+        parser.add_argument("--workers", type=int, help="Requisições simultâneas")
+        parser.add_argument("--rate", type=float, help="Requisições por segundo")
+        parser.add_argument("--retries", type=int, help="Novas tentativas por endereço")
+
+    def handle(self, *args, **options):
+        backend = None
+        if options["backend"]:
+            backend = import_string(options["backend"])()
+        enricher = CepEnricher(
+            backend=backend,
+            workers=options["workers"],
+            rate=options["rate"],
+            retries=options["retries"],
+        )
+        enricher.run()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{enricher.encontrados + enricher.copiados} CEPs preenchidos"
+                f" de {enricher.total} imóveis ({enricher.falhas} falhas)"
+            )
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from eventapp.imovel_benchmark import generate_cadastre, write_cadastre
+
+
+class Command(BaseCommand):
+    help = "Gera um cadastro de imóveis sintético em xlsx, csv ou parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Arquivo de saída (.xlsx, .csv, .csv.gz ou .parquet)")
+        parser.add_argument("--rows", type=int, default=10000, help="Linhas do cadastro")
+        parser.add_argument(
+            "--changes", type=float, default=0, help="Fração de linhas alteradas"
+        )
+        parser.add_argument(
+            "--conflicts", type=float, default=0, help="Fração de linhas em conflito"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Semente do cadastro base")
+
+    def handle(self, *args, **options):
+        df = generate_cadastre(
+            options["rows"],
+            changes=options["changes"],
+            conflicts=options["conflicts"],
+            seed=options["seed"],
+        )
+        write_cadastre(df, options["path"])
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(df.index)} linhas gravadas em {options['path']}")
+        )
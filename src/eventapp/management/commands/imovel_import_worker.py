@@ -0,0 +1,79 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from eventapp.cep import enrich_missing_ceps
+from eventapp.imovel_import import (StageMeter, acquire_import_lock,
+                                    claim_next_job, release_import_lock,
+                                    run_import_job)
+from eventapp.models import ImovelUpdateJob
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de importação do cadastro de imóveis"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Processa os jobs pendentes e termina",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Intervalo em segundos entre as consultas à fila",
+        )
+        parser.add_argument(
+            "--skip-cep",
+            action="store_true",
+            help="Não busca o CEP dos imóveis depois da importação",
+        )
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Worker {worker} iniciado")
+        while True:
+            close_old_connections()
+            job = self.process_next(worker)
+            # só depois de uma importação concluída
+            if job and job.state == ImovelUpdateJob.CONCLUIDO and not options["skip_cep"]:
+                self.enrich_cep(job.log)
+            if not job:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+
+    def enrich_cep(self, log):
+        # fora da trava de importação, para não segurar a fila
+        meter = StageMeter()
+        try:
+            with meter.measure(), meter.stage("cep"):
+                total = enrich_missing_ceps()
+            self.stdout.write(f"Busca de CEP concluída ({total} imóveis sem CEP)")
+        except Exception as ex:
+            self.stdout.write(self.style.ERROR(f"Busca de CEP falhou: {ex}"))
+            return
+        # junto das etapas da importação que a precedeu
+        log.refresh_from_db(fields=["etapas"])
+        log.etapas.update(meter.report(total))
+        log.save(update_fields=["etapas"])
+
+    def process_next(self, worker):
+        if not acquire_import_lock():
+            return None
+        try:
+            job = claim_next_job(worker)
+            if not job:
+                return None
+            self.stdout.write(f"Importando job {job.id} (log {job.log_id})")
+            if run_import_job(job):
+                self.stdout.write(self.style.SUCCESS(f"Job {job.id} concluído"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Job {job.id} falhou: {job.error}"))
+            return job
+        finally:
+            release_import_lock()
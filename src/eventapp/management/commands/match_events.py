@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+
+from eventapp.event_matching import (CANDIDATE_THRESHOLD, MARGIN, THRESHOLD,
+                                     match_incompatible_events)
+
+
+class Command(BaseCommand):
+    help = "Liga aos imóveis, pelo endereço, os eventos sem imóvel"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=THRESHOLD,
+            help="Similaridade mínima para atribuir sem revisão",
+        )
+        parser.add_argument(
+            "--margin",
+            type=float,
+            default=MARGIN,
+            help="Folga mínima sobre o segundo candidato",
+        )
+        parser.add_argument(
+            "--candidate-threshold",
+            type=float,
+            default=CANDIDATE_THRESHOLD,
+            help="Similaridade mínima para um imóvel ser candidato",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Só mostra o que seria atribuído, sem gravar",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Imprime o resultado, com a lista de revisão, em JSON",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            result = match_incompatible_events(
+                threshold=options["threshold"],
+                margin=options["margin"],
+                candidate_threshold=options["candidate_threshold"],
+                apply=not options["dry_run"],
+            )
+        except NotSupportedError as ex:
+            raise CommandError(ex)
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2, ensure_ascii=False))
+            return
+        for tipo, total in result["atribuidos"].items():
+            self.stdout.write(self.style.SUCCESS(f"{tipo}: {total} atribuídos"))
+        for item in result["revisao"]:
+            self.stdout.write(f"{item['tipo']} {item['evento']}: {item['address']}")
+            for candidato in item["candidatos"]:
+                self.stdout.write(
+                    f"  {candidato['similaridade']} imóvel {candidato['imovel']}:"
+                    f" {candidato['endereco']}"
+                )
+        self.stdout.write(f"{len(result['revisao'])} eventos para revisão")
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import eventapp.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0029_auto_20230312_1800'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImovelUpdateJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('PE', 'Pendente'), ('EX', 'Executando'), ('CO', 'Concluído'), ('FA', 'Falhou')], default='PE', max_length=2)),
+                ('file', models.FileField(upload_to=eventapp.models.imovel_update_directory_path)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, default=None, null=True)),
+                ('finished', models.DateTimeField(blank=True, default=None, null=True)),
+                ('worker', models.CharField(blank=True, default='', max_length=255)),
+                ('error', models.TextField(blank=True, default='')),
+                ('log', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='eventapp.imovelupdatelog')),
+            ],
+            options={
+                'ordering': ['created', 'id'],
+            },
+        ),
+    ]
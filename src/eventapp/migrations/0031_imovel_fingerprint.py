@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0030_imovelupdatejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovel',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0031_imovel_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovelupdatelog',
+            name='rejeitados',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0032_imovelupdatelog_rejeitados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CepCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('logradouro', models.CharField(max_length=255)),
+                ('numero', models.CharField(blank=True, default='', max_length=255)),
+                ('bairro', models.CharField(blank=True, default='', max_length=255)),
+                ('cep', models.CharField(blank=True, default='', max_length=255)),
+                ('dados', models.JSONField(blank=True, default=list)),
+                ('hits', models.IntegerField(default=0)),
+                ('misses', models.IntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('expires', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['logradouro', 'numero', 'bairro'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cepcache',
+            constraint=models.UniqueConstraint(fields=('logradouro', 'numero', 'bairro'), name='unique_cep_address'),
+        ),
+    ]
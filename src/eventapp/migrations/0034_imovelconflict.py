@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:20
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0033_cepcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovelupdatelog',
+            name='conflitos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ImovelConflict',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolucao', models.CharField(choices=[('CO', 'Código confere com o endereço'), ('IN', 'Inscrição imobiliária confere com o endereço'), ('AM', 'Ambos conferem com o endereço, fica a inscrição imobiliária'), ('NE', 'Nenhum confere com o endereço, fica a inscrição imobiliária')], max_length=2)),
+                ('imovel_codigo_id', models.IntegerField()),
+                ('imovel_inscricao_id', models.IntegerField()),
+                ('vencedor_id', models.IntegerField()),
+                ('perdedor_id', models.IntegerField()),
+                ('campo', models.CharField(max_length=255)),
+                ('valor_anterior', models.CharField(blank=True, default='', max_length=255)),
+                ('diferencas', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('dados', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conflicts', to='eventapp.imovelupdatelog')),
+            ],
+            options={
+                'ordering': ['log', 'id'],
+            },
+        ),
+    ]
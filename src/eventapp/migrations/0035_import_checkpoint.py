@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0034_imovelconflict'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovelupdatejob',
+            name='attempts',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imovelupdatelog',
+            name='checkpoint',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0035_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovel',
+            name='ativo',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='imovel',
+            name='geracao',
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='imovelupdatelog',
+            name='inativos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='imovel',
+            index=models.Index(condition=models.Q(ativo=True), fields=['codigo', 'id'], name='imovel_ativo_codigo_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:40
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0036_imovel_ativo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImovelChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('diferencas', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('imovel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='eventapp.imovel')),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='eventapp.imovelupdatelog')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
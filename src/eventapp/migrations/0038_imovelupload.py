@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('eventapp', '0037_imovelchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImovelUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('state', models.CharField(choices=[('AB', 'Aberto'), ('FI', 'Finalizado'), ('IM', 'Importado')], default='AB', max_length=2)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(blank=True, default=None, null=True)),
+                ('received', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('job', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='eventapp.imovelupdatejob')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='imovel_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
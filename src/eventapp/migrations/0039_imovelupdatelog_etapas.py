@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:44
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0038_imovelupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imovelupdatelog',
+            name='etapas',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+    ]
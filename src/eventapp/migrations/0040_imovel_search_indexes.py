@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# unaccent com o dicionário explícito, que não depende do search_path e
+# por isso pode ser IMMUTABLE, ver eventapp.lookups.ImmutableUnaccent
+IMMUTABLE_UNACCENT = """
+CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text AS
+$$ SELECT public.unaccent('public.unaccent', $1) $$
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+"""
+
+# a mesma expressão dos filtros do ImovelViewSet: trigram_similar no
+# logradouro e icontains (UPPER ... LIKE) nos demais
+INDEXES = [
+    ("imovel_logradouro_trgm_idx", "immutable_unaccent(logradouro)"),
+    ("imovel_numero_trgm_idx", "upper(immutable_unaccent(numero))"),
+    ("imovel_bairro_trgm_idx", "upper(immutable_unaccent(bairro))"),
+    ("imovel_complemento_trgm_idx", "upper(immutable_unaccent(complemento))"),
+    ("imovel_codigo_trgm_idx", "upper(immutable_unaccent(codigo))"),
+    # endereço comparado com o dos eventos, ver eventapp.event_matching
+    (
+        "imovel_endereco_trgm_idx",
+        "immutable_unaccent(coalesce(logradouro, '') || ' ' ||"
+        " coalesce(numero, '') || ' ' || coalesce(bairro, ''))",
+    ),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    # como o UnaccentExtension e o TrigramExtension, só no Postgres
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(IMMUTABLE_UNACCENT)
+    for name, expression in INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON eventapp_imovel"
+            f" USING gin ({expression} gin_trgm_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+    schema_editor.execute("DROP FUNCTION IF EXISTS immutable_unaccent(text)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0039_imovelupdatelog_etapas'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
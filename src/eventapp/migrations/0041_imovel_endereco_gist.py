@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# a mesma expressão do imovel_endereco_trgm_idx (0040), ver
+# eventapp.lookups.ImovelAddress; o GiST também atende o % e ainda ordena
+# por distância (<->) direto do índice, então substitui o GIN
+ENDERECO = (
+    "immutable_unaccent(coalesce(logradouro, '') || ' ' ||"
+    " coalesce(numero, '') || ' ' || coalesce(bairro, ''))"
+)
+
+
+def create_gist_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS imovel_endereco_trgm_idx")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS imovel_endereco_gist_idx ON eventapp_imovel"
+        f" USING gist ({ENDERECO} gist_trgm_ops)"
+    )
+
+
+def drop_gist_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS imovel_endereco_gist_idx")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS imovel_endereco_trgm_idx ON eventapp_imovel"
+        f" USING gin ({ENDERECO} gin_trgm_ops)"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0040_imovel_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gist_index, drop_gist_index),
+    ]
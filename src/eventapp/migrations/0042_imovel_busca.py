@@ -0,0 +1,71 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:59
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# português sem acentos, ver eventapp.models.SEARCH_CONFIG
+SEARCH_CONFIG = """
+CREATE TEXT SEARCH CONFIGURATION pt_unaccent (COPY = portuguese);
+ALTER TEXT SEARCH CONFIGURATION pt_unaccent
+    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+"""
+
+# o mesmo que eventapp.models.imovel_search_vector
+SEARCH_VECTOR = """
+UPDATE eventapp_imovel SET busca =
+    setweight(to_tsvector('pt_unaccent'::regconfig,
+        coalesce(codigo, '') || ' ' || coalesce(inscricao_imobiliaria, '')
+        || ' ' || coalesce(razao_social, '')), 'A')
+    || setweight(to_tsvector('pt_unaccent'::regconfig,
+        coalesce(logradouro, '') || ' ' || coalesce(numero, '')
+        || ' ' || coalesce(bairro, '') || ' ' || coalesce(complemento, '')), 'B');
+"""
+
+
+def create_search_config(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SEARCH_CONFIG)
+
+
+def drop_search_config(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS pt_unaccent")
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SEARCH_VECTOR)
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS imovel_busca_idx ON eventapp_imovel"
+        " USING gin (busca)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS imovel_busca_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0041_imovel_endereco_gist'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_config, drop_search_config),
+        migrations.AddField(
+            model_name='imovel',
+            name='busca',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='imovel',
+            index=models.Index(fields=['cnpj_cpf'], name='imovel_cnpj_cpf_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# prefixo do código (LIKE 'x%') com as colunas do name_string no próprio
+# índice, para o autocomplete ler só o índice (index-only scan), ver
+# eventapp.views.generics.ImovelAutocompleteView
+AUTOCOMPLETE_INDEX = """
+CREATE INDEX IF NOT EXISTS imovel_autocomplete_idx ON eventapp_imovel
+    (codigo varchar_pattern_ops)
+    INCLUDE (id, logradouro, numero, complemento, bairro)
+    WHERE ativo;
+"""
+
+
+def create_autocomplete_index(apps, schema_editor):
+    # o INCLUDE é só do Postgres (11 em diante)
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(AUTOCOMPLETE_INDEX)
+
+
+def drop_autocomplete_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS imovel_autocomplete_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0042_imovel_busca'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_autocomplete_index, drop_autocomplete_index),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# o Imovel.busca calculado pelo próprio banco, no mesmo INSERT ou UPDATE que
+# grava o imóvel (também nos bulk_create/bulk_update e no COPY da importação),
+# em vez de um segundo UPDATE depois de cada gravação. A expressão é a mesma
+# da migração 0042; no UPDATE só recalcula se um dos campos mudou.
+BUSCA_TRIGGER = """
+CREATE OR REPLACE FUNCTION eventapp_imovel_busca() RETURNS trigger AS $$
+BEGIN
+    NEW.busca :=
+        setweight(to_tsvector('pt_unaccent'::regconfig,
+            coalesce(NEW.codigo, '') || ' ' || coalesce(NEW.inscricao_imobiliaria, '')
+            || ' ' || coalesce(NEW.razao_social, '')), 'A')
+        || setweight(to_tsvector('pt_unaccent'::regconfig,
+            coalesce(NEW.logradouro, '') || ' ' || coalesce(NEW.numero, '')
+            || ' ' || coalesce(NEW.bairro, '') || ' ' || coalesce(NEW.complemento, '')), 'B');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS imovel_busca_insert ON eventapp_imovel;
+CREATE TRIGGER imovel_busca_insert BEFORE INSERT ON eventapp_imovel
+    FOR EACH ROW EXECUTE FUNCTION eventapp_imovel_busca();
+
+DROP TRIGGER IF EXISTS imovel_busca_update ON eventapp_imovel;
+CREATE TRIGGER imovel_busca_update BEFORE UPDATE ON eventapp_imovel
+    FOR EACH ROW WHEN (
+        (OLD.codigo, OLD.inscricao_imobiliaria, OLD.razao_social, OLD.logradouro,
+         OLD.numero, OLD.bairro, OLD.complemento)
+        IS DISTINCT FROM
+        (NEW.codigo, NEW.inscricao_imobiliaria, NEW.razao_social, NEW.logradouro,
+         NEW.numero, NEW.bairro, NEW.complemento)
+        OR NEW.busca IS NULL
+    )
+    EXECUTE FUNCTION eventapp_imovel_busca();
+
+-- o trigger preenche os que ainda estão sem
+UPDATE eventapp_imovel SET busca = NULL WHERE busca IS NULL;
+"""
+
+DROP_BUSCA_TRIGGER = """
+DROP TRIGGER IF EXISTS imovel_busca_update ON eventapp_imovel;
+DROP TRIGGER IF EXISTS imovel_busca_insert ON eventapp_imovel;
+DROP FUNCTION IF EXISTS eventapp_imovel_busca();
+"""
+
+
+def create_busca_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(BUSCA_TRIGGER)
+
+
+def drop_busca_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(DROP_BUSCA_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0043_imovel_autocomplete_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_busca_trigger, drop_busca_trigger),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# o varchar_pattern_ops da 0043 serve ao LIKE 'x%', mas não dá a ordem do
+# código (o ORDER BY fazia um Sort). Com COLLATE "C" e o operador padrão o
+# mesmo índice serve ao prefixo e ao ORDER BY codigo COLLATE "C" do
+# autocomplete, ver eventapp.lookups.CollateC
+AUTOCOMPLETE_INDEX = """
+DROP INDEX IF EXISTS imovel_autocomplete_idx;
+CREATE INDEX imovel_autocomplete_idx ON eventapp_imovel
+    (codigo COLLATE "C")
+    INCLUDE (id, logradouro, numero, complemento, bairro)
+    WHERE ativo;
+"""
+
+PATTERN_INDEX = """
+DROP INDEX IF EXISTS imovel_autocomplete_idx;
+CREATE INDEX imovel_autocomplete_idx ON eventapp_imovel
+    (codigo varchar_pattern_ops)
+    INCLUDE (id, logradouro, numero, complemento, bairro)
+    WHERE ativo;
+"""
+
+
+def create_collate_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(AUTOCOMPLETE_INDEX)
+
+
+def create_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(PATTERN_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventapp', '0044_imovel_busca_trigger'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_collate_index, create_pattern_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('eventapp', '0045_imovel_autocomplete_collate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImovelStreamTicket',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('expires', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imovel_stream_tickets', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,10 +1,17 @@
+import uuid
+
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 
-from eventapp.utils import text_to_id
+from eventapp.utils import fingerprint, text_to_id
 from eventtracker.custom_fields import NumberCharField
 
+# português sem acentos, criada na migração 0042
+SEARCH_CONFIG = "pt_unaccent"
+
 
 def getDefaultImovel():
     default_imovel = Imovel.objects.filter(codigo="000000").first()
@@ -69,6 +76,13 @@ class ImovelUpdateLog(models.Model):
     alterados = models.IntegerField(default=0)
     novos = models.IntegerField(default=0)
     falhas = models.IntegerField(default=0)
+    rejeitados = models.IntegerField(default=0)
+    conflitos = models.IntegerField(default=0)
+    inativos = models.IntegerField(default=0)
+    # linhas do arquivo já gravadas, para retomar a importação
+    checkpoint = models.IntegerField(default=0)
+    # {etapa: {segundos, linhas_por_segundo, consultas, memoria_mb}}
+    etapas = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
     response = models.CharField(
         max_length=255, null=True, blank=True, default=""
     )
@@ -80,8 +94,190 @@ class ImovelUpdateLog(models.Model):
         ordering = ["-datetime"]
 
 
+def imovel_update_directory_path(instance, filename):
+    return "imovel_updates/" + filename
+
+
+class ImovelUpdateJob(models.Model):
+    PENDENTE = "PE"
+    EXECUTANDO = "EX"
+    CONCLUIDO = "CO"
+    FALHOU = "FA"
+    JOBSTATE = [
+        (PENDENTE, "Pendente"),
+        (EXECUTANDO, "Executando"),
+        (CONCLUIDO, "Concluído"),
+        (FALHOU, "Falhou"),
+    ]
+    state = models.CharField(
+        max_length=2,
+        choices=JOBSTATE,
+        default=PENDENTE,
+    )
+    log = models.OneToOneField(
+        ImovelUpdateLog, related_name="job", on_delete=models.CASCADE
+    )
+    file = models.FileField(upload_to=imovel_update_directory_path)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(default=None, null=True, blank=True)
+    finished = models.DateTimeField(default=None, null=True, blank=True)
+    worker = models.CharField(max_length=255, blank=True, default="")
+    attempts = models.SmallIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        ordering = ["created", "id"]
+
+    def __str__(self):
+        return str(self.id) + "-" + self.get_state_display()
+
+
+class ImovelUpload(models.Model):
+    """
+    Planilha enviada em partes para o update-imovel, montada em disco em
+    imovel_upload_path(id) até ser finalizada.
+    """
+
+    ABERTO = "AB"
+    FINALIZADO = "FI"
+    IMPORTADO = "IM"
+    UPLOADSTATE = [
+        (ABERTO, "Aberto"),
+        (FINALIZADO, "Finalizado"),
+        (IMPORTADO, "Importado"),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    state = models.CharField(
+        max_length=2,
+        choices=UPLOADSTATE,
+        default=ABERTO,
+    )
+    filename = models.CharField(max_length=255)
+    # tamanho informado no início, opcional
+    size = models.BigIntegerField(null=True, blank=True, default=None)
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    owner = models.ForeignKey(
+        User,
+        related_name="imovel_uploads",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    job = models.OneToOneField(
+        ImovelUpdateJob,
+        related_name="upload",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created"]
+
+    def __str__(self):
+        return self.filename + "-" + self.get_state_display()
+
+
+class ImovelStreamTicket(models.Model):
+    """
+    Credencial de uso único e curta (IMPORT_STREAM_TICKET_TTL) para o
+    imovelupdatelog/stream/: o EventSource não envia o Authorization e o
+    token do knox na url iria para os logs de acesso.
+    """
+
+    key = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(
+        User, related_name="imovel_stream_tickets", on_delete=models.CASCADE
+    )
+    expires = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user} até {self.expires}"
+
+
+class ImovelConflict(models.Model):
+    # qual imóvel ficou com o código e a inscrição do arquivo
+    CODIGO = "CO"
+    INSCRICAO = "IN"
+    AMBOS = "AM"
+    NENHUM = "NE"
+    RESOLUCAO = [
+        (CODIGO, "Código confere com o endereço"),
+        (INSCRICAO, "Inscrição imobiliária confere com o endereço"),
+        (AMBOS, "Ambos conferem com o endereço, fica a inscrição imobiliária"),
+        (NENHUM, "Nenhum confere com o endereço, fica a inscrição imobiliária"),
+    ]
+    log = models.ForeignKey(
+        ImovelUpdateLog, related_name="conflicts", on_delete=models.CASCADE
+    )
+    resolucao = models.CharField(max_length=2, choices=RESOLUCAO)
+    # ids, sem chave estrangeira para o registro sobreviver ao imóvel
+    imovel_codigo_id = models.IntegerField()
+    imovel_inscricao_id = models.IntegerField()
+    vencedor_id = models.IntegerField()
+    perdedor_id = models.IntegerField()
+    # campo alterado no imóvel perdedor e o valor que ele tinha
+    campo = models.CharField(max_length=255)
+    valor_anterior = models.CharField(max_length=255, blank=True, default="")
+    # campo => [imóvel do código, imóvel da inscrição, arquivo]
+    diferencas = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    dados = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["log", "id"]
+
+    def __str__(self):
+        return (
+            str(self.log_id) + "-" + str(self.perdedor_id) + "->" + str(self.vencedor_id)
+        )
+
+
+class CepCache(models.Model):
+    # endereço normalizado, ver eventapp.cep.normalize_address
+    logradouro = models.CharField(max_length=255)
+    numero = models.CharField(max_length=255, blank=True, default="")
+    bairro = models.CharField(max_length=255, blank=True, default="")
+    # vazio quando a busca não encontrou um CEP único (cache negativo)
+    cep = models.CharField(max_length=255, blank=True, default="")
+    dados = models.JSONField(default=list, blank=True)
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    expires = models.DateTimeField()
+
+    class Meta:
+        ordering = ["logradouro", "numero", "bairro"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["logradouro", "numero", "bairro"],
+                name="unique_cep_address",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.logradouro}, {self.numero} - {self.bairro}: {self.cep}"
+
+
 class Imovel(models.Model):
 
+    IMPORTED_FIELDS = [
+        "codigo",
+        "inscricao_imobiliaria",
+        "numero_contribuinte",
+        "logradouro",
+        "numero",
+        "bairro",
+        "complemento",
+        "area_lote",
+        "razao_social",
+        "cnpj_cpf",
+    ]
+
     # common
     codigo_lote = models.CharField(max_length=255)  # inscrlig
     logradouro = models.CharField(max_length=255, null=True, blank=True, default="")
@@ -102,6 +298,12 @@ class Imovel(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     imported = models.DateTimeField(default=None, null=True, blank=True)
+    fingerprint = models.CharField(max_length=32, blank=True, default="")
+    # fora da última planilha importada; geracao é o ImovelUpdateLog que o inativou
+    ativo = models.BooleanField(default=True)
+    geracao = models.IntegerField(null=True, blank=True, default=None)
+    # busca textual, calculada por um trigger da migração 0044 (só no Postgres)
+    busca = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         string = ""
@@ -134,28 +336,61 @@ class Imovel(models.Model):
 
     class Meta:
         ordering = ["codigo", "id"]
+        indexes = [
+            models.Index(
+                fields=["codigo", "id"],
+                name="imovel_ativo_codigo_idx",
+                condition=models.Q(ativo=True),
+            ),
+            models.Index(fields=["cnpj_cpf"], name="imovel_cnpj_cpf_idx"),
+        ]
 
-    def clean_cnpj_cpf(self, value):
-        if value:
-            value = ''.join(filter(str.isdigit, value))
-            if len(value) > 11:
-                value = value.zfill(14)
-            elif len(value) > 9:
-                value = value.zfill(11)
-            else:
-                value = None
-        return value
-
-    def save(self, *args, **kwargs):
-
+    @staticmethod
+    def clean_cnpj_cpf(value):
+        # vazio vira None, como no validate_chunk da importação
+        value = ''.join(filter(str.isdigit, value or ''))
+        if len(value) > 11:
+            return value.zfill(14)
+        if len(value) > 9:
+            return value.zfill(11)
+        return None
+
+    def normalize(self):
         self.cnpj_cpf = self.clean_cnpj_cpf(self.cnpj_cpf)
         if self.inscricao_imobiliaria:
             only_number = ''.join(filter(str.isdigit, self.inscricao_imobiliaria))
             self.codigo_lote = only_number[0:10]
+        self.update_fingerprint()
+
+    def update_fingerprint(self):
+        self.fingerprint = fingerprint(
+            getattr(self, name) for name in self.IMPORTED_FIELDS
+        )
+
+    def save(self, *args, **kwargs):
+
+        self.normalize()
 
         super().save(*args, **kwargs)
 
 
+class ImovelChange(models.Model):
+    """Campos de um imóvel alterados por uma importação."""
+
+    imovel = models.ForeignKey(
+        Imovel, related_name="changes", on_delete=models.CASCADE
+    )
+    log = models.ForeignKey(
+        ImovelUpdateLog, related_name="changes", on_delete=models.CASCADE
+    )
+    # {campo: [valor anterior, valor novo]}
+    diferencas = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-id"]
+
+
 # ====NOTICES====
 class Notice(models.Model):
     imovel = models.ForeignKey(
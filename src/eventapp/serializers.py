@@ -2,7 +2,8 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from rest_framework import serializers
 
-from eventapp.models import (Activity, Imovel, ImovelUpdateLog, Notice,
+from eventapp.models import (Activity, Imovel, ImovelChange, ImovelConflict,
+                             ImovelUpdateLog, ImovelUpload, Notice,
                              NoticeAppeal, NoticeColor, NoticeEvent,
                              NoticeEventType, NoticeEventTypeFile, NoticeFine,
                              Profile, ReportEvent, ReportEventType,
@@ -133,8 +134,10 @@ class ImovelSerializer(serializers.ModelSerializer):
             "numero_contribuinte",
             "name_string",
             'cnpj_cpf',
+            "ativo",
+            "geracao",
         )
-        read_only_fields = ("name_string",)
+        read_only_fields = ("name_string", "ativo", "geracao")
 
 
 class ImovelUpdateLogSerializer(serializers.ModelSerializer):
@@ -143,6 +146,31 @@ class ImovelUpdateLogSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class ImovelConflictSerializer(serializers.ModelSerializer):
+    resolucao_display = serializers.CharField(
+        source="get_resolucao_display", read_only=True
+    )
+
+    class Meta:
+        model = ImovelConflict
+        fields = "__all__"
+
+
+class ImovelChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImovelChange
+        fields = "__all__"
+
+
+class ImovelUploadSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+    class Meta:
+        model = ImovelUpload
+        fields = "__all__"
+        read_only_fields = ("state", "received", "sha256", "owner", "job")
+
+
 class NoticeEventTypeFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = NoticeEventTypeFile
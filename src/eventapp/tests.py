@@ -0,0 +1,551 @@
+from io import StringIO
+from unittest import mock, skipUnless
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from knox.models import AuthToken
+from rest_framework.test import APIClient
+
+from eventapp.cep import StubBackend, missing_cep_queryset
+from eventapp.imovel_import import (COLUMNS_DICT, IMPORT_FIELDS,
+                                    ImovelImporter, StagingImporter,
+                                    clean_imovel_data, dry_run, fail_job,
+                                    get_fingerprint, update_from_dataframe,
+                                    validate_chunk)
+from eventapp.management.commands.imovel_import_worker import \
+    Command as ImportWorkerCommand
+from eventapp.models import (SEARCH_CONFIG, CepCache, Imovel, ImovelChange,
+                             ImovelConflict, ImovelUpdateJob, ImovelUpdateLog)
+from eventapp.views.generics import ImovelAutocompleteView
+
+
+def imovel_row(codigo, inscricao_imobiliaria, **values):
+    row = {name: None for name in IMPORT_FIELDS}
+    row.update(
+        codigo=codigo,
+        inscricao_imobiliaria=inscricao_imobiliaria,
+        logradouro="Rua Brusque",
+        numero=codigo[-2:],
+        bairro="Centro",
+    )
+    row.update(values)
+    return row
+
+
+def create_imovel(codigo, inscricao_imobiliaria, **values):
+    row = imovel_row(codigo, inscricao_imobiliaria, **values)
+    imovel = Imovel(**{name: value for name, value in row.items() if value is not None})
+    imovel.update_fingerprint()
+    imovel.save()
+    return imovel
+
+
+def prepared(*rows) -> list:
+    data = []
+    for row in rows:
+        row = dict(row, codigo_lote=row["inscricao_imobiliaria"].replace(".", "")[:10])
+        cleaned = clean_imovel_data(row)
+        data.append((cleaned, get_fingerprint(cleaned)))
+    return data
+
+
+class ImovelImporterTest(TestCase):
+    importer_class = ImovelImporter
+
+    def setUp(self):
+        self.log = ImovelUpdateLog.objects.create()
+        self.a = create_imovel("100001", "01.01.001.0001")
+        self.b = create_imovel("100002", "01.01.001.0002")
+
+    def import_rows(self, *rows):
+        update_from_dataframe(
+            pd.DataFrame(list(rows), columns=IMPORT_FIELDS),
+            self.log,
+            self.importer_class(self.log),
+        )
+        self.log.refresh_from_db()
+
+    def test_columns_are_imported_fields(self):
+        self.assertEqual(list(COLUMNS_DICT.values()), IMPORT_FIELDS)
+
+    def test_swap_codigo(self):
+        # código e inscrição trocados entre dois imóveis gravados
+        self.import_rows(
+            imovel_row("100001", "01.01.001.0002"),
+            imovel_row("100002", "01.01.001.0001"),
+        )
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual(self.log.falhas, 0)
+        self.assertEqual(
+            {self.a.codigo: self.a.inscricao_imobiliaria, self.b.codigo: self.b.inscricao_imobiliaria},
+            {"100001": "01.01.001.0002", "100002": "01.01.001.0001"},
+        )
+        self.assertFalse(Imovel.objects.filter(codigo__startswith="IMPORTANDO_").exists())
+        self.assertEqual(ImovelConflict.objects.filter(log=self.log).count(), 1)
+
+    def test_swap_codigo_sequential(self):
+        importer = self.importer_class(self.log)
+        importer.load_maps()
+        # um imóvel novo que não pode ser gravado leva à gravação um a um
+        create_imovel("100003", "01.01.001.0003")
+        importer.process_prepared(
+            prepared(
+                imovel_row("100001", "01.01.001.0002"),
+                imovel_row("100002", "01.01.001.0001"),
+                imovel_row("100003", "01.01.001.0009"),
+            )
+        )
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((importer.falhas, importer.novos), (1, 0))
+        self.assertEqual(
+            {self.a.codigo: self.a.inscricao_imobiliaria, self.b.codigo: self.b.inscricao_imobiliaria},
+            {"100001": "01.01.001.0002", "100002": "01.01.001.0001"},
+        )
+        self.assertEqual(ImovelConflict.objects.filter(log=self.log).count(), 1)
+        self.assertFalse(Imovel.objects.filter(codigo__startswith="IMPORTANDO_").exists())
+
+    def test_partial_import_keeps_active(self):
+        self.import_rows(imovel_row("100001", "01.01.001.0001", logradouro="Rua Nova"))
+        self.b.refresh_from_db()
+        self.assertTrue(self.b.ativo)
+        self.assertEqual(self.log.inativos, 0)
+
+    def test_full_import_deactivates_missing(self):
+        update_from_dataframe(
+            pd.DataFrame([imovel_row("100001", "01.01.001.0001")], columns=IMPORT_FIELDS),
+            self.log,
+            self.importer_class(self.log),
+            deactivate=True,
+        )
+        self.b.refresh_from_db()
+        self.assertEqual((self.b.ativo, self.b.geracao), (False, self.log.id))
+
+    def test_dry_run_predicts_conflict_deactivation(self):
+        # só o endereço do imóvel do código confere: o imóvel da inscrição
+        # perde a inscrição e sai do cadastro
+        Imovel.objects.filter(pk=self.a.pk).update(complemento="Casa")
+        rows = [imovel_row("100001", "01.01.001.0002", complemento="Casa")]
+        summary, diff = dry_run([pd.DataFrame(rows, columns=IMPORT_FIELDS)])
+        self.assertEqual((summary["conflitos"], summary["ausentes"]), (1, 1))
+        self.assertEqual(
+            list(diff.loc[diff["situacao"] == "ausente", "id"]), [self.b.id]
+        )
+        update_from_dataframe(
+            pd.DataFrame(rows, columns=IMPORT_FIELDS),
+            self.log,
+            self.importer_class(self.log),
+            deactivate=True,
+        )
+        self.log.refresh_from_db()
+        self.assertEqual(self.log.inativos, summary["ausentes"])
+        self.assertEqual(
+            list(Imovel.objects.filter(ativo=False).values_list("id", flat=True)),
+            [self.b.id],
+        )
+
+    def test_failed_write_not_journaled(self):
+        importer = self.importer_class(self.log)
+        importer.load_maps()
+        # outro processo grava o código depois da carga dos mapas
+        create_imovel("100003", "01.01.001.0003")
+        importer.process_prepared(
+            prepared(
+                imovel_row("100003", "01.01.001.0001"),
+                imovel_row("100002", "01.01.001.0002", logradouro="Rua Nova"),
+            )
+        )
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((importer.falhas, importer.alterados), (1, 1))
+        self.assertEqual(
+            (self.a.codigo, self.a.inscricao_imobiliaria), ("100001", "01.01.001.0001")
+        )
+        self.assertEqual(self.b.logradouro, "Rua Nova")
+        self.assertFalse(ImovelChange.objects.filter(imovel=self.a).exists())
+        self.assertTrue(ImovelChange.objects.filter(imovel=self.b).exists())
+
+    def test_failed_conflict_not_logged(self):
+        importer = self.importer_class(self.log)
+        importer.load_maps()
+        # o código ou a inscrição que o perdedor do conflito receberia já
+        # existe em outro imóvel
+        create_imovel(
+            f"ERROR_CHANGE_{self.a.id}_IN_FAVOR_OF_{self.b.id}",
+            f"ERROR_CHANGE_{self.b.id}_IN_FAVOR_OF_{self.a.id}",
+        )
+        importer.process_prepared(prepared(imovel_row("100001", "01.01.001.0002")))
+        self.assertEqual(importer.falhas, 1)
+        self.assertEqual(importer.conflitos, 0)
+        self.assertFalse(ImovelConflict.objects.exists())
+        self.assertFalse(
+            ImovelChange.objects.filter(diferencas__icontains="ERROR_CHANGE").exists()
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "COPY só no PostgreSQL")
+class StagingImporterTest(ImovelImporterTest):
+    # as trocas entre imóveis são linhas EN, gravadas pelo ImovelImporter
+    importer_class = StagingImporter
+
+    def test_swap_classified_entangled(self):
+        self.import_rows(
+            imovel_row("100001", "01.01.001.0002"),
+            imovel_row("100002", "01.01.001.0001"),
+            imovel_row("100004", "01.01.001.0004"),
+        )
+        self.assertEqual((self.log.novos, self.log.falhas), (1, 0))
+        self.assertEqual(
+            dict(Imovel.objects.values_list("codigo", "inscricao_imobiliaria")),
+            {
+                "100001": "01.01.001.0002",
+                "100002": "01.01.001.0001",
+                "100004": "01.01.001.0004",
+            },
+        )
+
+
+class ApiTestCase(TestCase):
+    """
+    Cliente da api autenticado como um usuário comum; com authenticate
+    falso o cliente começa anônimo e o teste autentica quem precisar.
+    """
+
+    authenticate = True
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user("user")
+        if self.authenticate:
+            self.client.force_authenticate(self.user)
+
+
+class ImovelCnpjCpfFilterTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        # gravado como 01234567890
+        self.imovel = create_imovel("100001", "01.01.001.0001", cnpj_cpf="1234567890")
+        create_imovel("100002", "01.01.001.0002")
+
+    def get(self, cnpj_cpf):
+        return self.client.get("/api/imovel/", {"cnpj_cpf": cnpj_cpf})
+
+    def test_normalized_like_import(self):
+        for value in ("123.456.789-0", "012.345.678-90", "01234567890"):
+            with self.subTest(value):
+                response = self.get(value)
+                self.assertEqual(
+                    [row["id"] for row in response.data["results"]], [self.imovel.id]
+                )
+
+    def test_same_value_as_import(self):
+        values = ["", None, "abc", "123", "123.456.789-0", "12.345.678/0001-90"]
+        rows = [
+            imovel_row(f"1000{index:02}", f"01.01.001.{index:04}", cnpj_cpf=value)
+            for index, value in enumerate(values)
+        ]
+        valid, rejected = validate_chunk(
+            pd.DataFrame(rows, columns=IMPORT_FIELDS), set(), set()
+        )
+        self.assertEqual(
+            list(valid["cnpj_cpf"]), [Imovel.clean_cnpj_cpf(value) for value in values]
+        )
+        self.assertIsNone(Imovel.clean_cnpj_cpf(""))
+
+    def test_rejects_without_digits(self):
+        # não pode virar cnpj_cpf IS NULL, que traz os imóveis sem CNPJ/CPF
+        for value in ("abc", "123"):
+            with self.subTest(value):
+                self.assertEqual(self.get(value).status_code, 400)
+
+
+class ImovelAutocompleteTest(ApiTestCase):
+    def test_codigo_prefix_ordered(self):
+        for n, codigo in enumerate(("100010", "100002", "200001", "10001")):
+            create_imovel(codigo, f"01.01.001.000{n}")
+        response = self.client.get("/api/imovel/autocomplete/", {"search": "1000"})
+        self.assertEqual(
+            [row["name_string"].split()[0] for row in response.data],
+            ["100002", "10001", "100010"],
+        )
+
+
+@override_settings(IMPORT_STREAM_LIFETIME=0)
+class ImovelUpdateLogStreamTest(ApiTestCase):
+    authenticate = False
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.log = ImovelUpdateLog.objects.create(state=21)
+
+    def ticket(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.post("/api/imovelupdatelog/stream/ticket/")
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, 201)
+        return response.data["ticket"]
+
+    def get(self, ticket, last_event_id=""):
+        return self.client.get(
+            "/api/imovelupdatelog/stream/",
+            {"id": self.log.id, "ticket": ticket},
+            HTTP_LAST_EVENT_ID=last_event_id,
+        )
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_ticket_single_use(self):
+        ticket = self.ticket()
+        self.assertIn(b"event: progress", self.content(self.get(ticket)))
+        self.assertEqual(self.get(ticket).status_code, 401)
+        self.assertEqual(self.get("").status_code, 401)
+
+    def test_api_token_not_accepted_in_url(self):
+        _, token = AuthToken.objects.create(self.admin)
+        response = self.client.get(
+            "/api/imovelupdatelog/stream/", {"id": self.log.id, "token": token}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_resumes_from_last_event(self):
+        event_id = self.log.datetime.isoformat()
+        # sem mudança, nenhum evento repetido
+        self.assertEqual(self.content(self.get(self.ticket(), event_id)), b"retry: 2000\n\n")
+        self.log.state = 99
+        self.log.save()
+        self.assertIn(b"event: progress", self.content(self.get(self.ticket(), event_id)))
+        self.log.refresh_from_db()
+        response = self.get(self.ticket(), self.log.datetime.isoformat())
+        self.assertEqual(response.status_code, 204)
+
+    @override_settings(IMPORT_STREAM_LIFETIME=60)
+    def test_streams_until_finished(self):
+        def finish(seconds):
+            ImovelUpdateLog.objects.filter(pk=self.log.pk).update(
+                state=99, datetime=timezone.now()
+            )
+
+        with mock.patch("eventapp.views.generics.time.sleep", side_effect=finish):
+            content = self.content(self.get(self.ticket()))
+        self.assertEqual(content.count(b"event: progress"), 2)
+        self.assertIn(b'"state": 99', content)
+
+
+def has_extension(name) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = %s", [name])
+        return cursor.fetchone() is not None
+
+
+@skipUnless(connection.vendor == "postgresql", "índices só no PostgreSQL")
+class PlanTestCase(TestCase):
+    """
+    Com poucas linhas o planejador prefere ler a tabela inteira: o
+    seqscan desligado mostra se a consulta pode usar o índice.
+    """
+
+    def setUp(self):
+        create_imovel("100001", "01.01.001.0001", cnpj_cpf="12345678901")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE eventapp_imovel")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index, index_only=False):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        if index_only:
+            self.assertIn(f"Index Only Scan using {index}", plan)
+
+
+class ImovelSearchTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.imovel = create_imovel("100001", "01.01.001.0001", razao_social="Padaria")
+
+    def test_search_without_vector(self):
+        if connection.vendor == "postgresql":
+            # como um imóvel gravado antes do trigger da migração 0044
+            with connection.cursor() as cursor:
+                cursor.execute("ALTER TABLE eventapp_imovel DISABLE TRIGGER USER")
+            Imovel.objects.update(busca=None)
+        response = self.client.get("/api/imovel/", {"search": "padaria brusque"})
+        self.assertEqual(response.status_code, 200)
+        if connection.vendor != "postgresql":
+            # sem o tsvector, os termos nos campos da busca
+            self.assertEqual(
+                [row["id"] for row in response.data["results"]], [self.imovel.id]
+            )
+
+
+@skipUnless(connection.vendor == "postgresql", "busca só no PostgreSQL")
+class ImovelSearchVectorTest(TestCase):
+    def search(self, terms):
+        return Imovel.objects.filter(busca=SearchQuery(terms, config=SEARCH_CONFIG))
+
+    def test_computed_on_save(self):
+        imovel = create_imovel("100001", "01.01.001.0001")
+        self.assertEqual(list(self.search("brusque")), [imovel])
+        imovel.logradouro = "Rua Itajaí"
+        # o trigger calcula no mesmo UPDATE
+        with self.assertNumQueries(1):
+            imovel.save()
+        self.assertEqual(list(self.search("itajai")), [imovel])
+        self.assertFalse(self.search("brusque").exists())
+
+    def test_computed_on_import(self):
+        log = ImovelUpdateLog.objects.create()
+        update_from_dataframe(
+            pd.DataFrame([imovel_row("100001", "01.01.001.0001")], columns=IMPORT_FIELDS),
+            log,
+            ImovelImporter(log),
+        )
+        self.assertTrue(self.search("brusque").exists())
+
+
+class SearchPlanTest(PlanTestCase):
+    def test_cnpj_cpf_btree(self):
+        # com poucas linhas, o índice do código (a ordem padrão) ganha do filtro
+        self.assertUsesIndex(
+            Imovel.objects.filter(cnpj_cpf="12345678901").order_by(),
+            "imovel_cnpj_cpf_idx",
+        )
+
+    def test_busca_gin(self):
+        self.assertUsesIndex(
+            # o viewset ordena pelo ts_rank, não pelo código
+            Imovel.objects.filter(
+                busca=SearchQuery("brusque", config=SEARCH_CONFIG)
+            ).order_by(),
+            "imovel_busca_idx",
+        )
+
+
+class AutocompletePlanTest(PlanTestCase):
+    def test_codigo_prefix_index_only(self):
+        # como o seqscan: sem o Sort, só sobra o plano em que o índice já dá a
+        # ordem do código
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_sort = off")
+        queryset = ImovelAutocompleteView().get_queryset("1000")[:10]
+        self.assertUsesIndex(queryset, "imovel_autocomplete_idx", index_only=True)
+        self.assertNotIn("Sort", queryset.explain())
+
+
+class SearchIndexPlanTest(PlanTestCase):
+    def setUp(self):
+        if not has_extension("pg_trgm"):
+            self.skipTest("sem a extensão pg_trgm")
+        super().setUp()
+
+    def test_logradouro_trigram(self):
+        self.assertUsesIndex(
+            Imovel.objects.filter(logradouro__iunaccent__trigram_similar="Rua Brusqué"),
+            "imovel_logradouro_trgm_idx",
+        )
+
+    def test_icontains(self):
+        for name in ("numero", "bairro", "complemento", "codigo"):
+            with self.subTest(name):
+                self.assertUsesIndex(
+                    Imovel.objects.filter(**{f"{name}__iunaccent__icontains": "cêntro"}),
+                    f"imovel_{name}_trgm_idx",
+                )
+
+    def assertUsesTrigramIndex(self, queryset, names):
+        # o planejador escolhe um ou mais índices da combinação (BitmapAnd),
+        # e os outros filtros são conferidos nas linhas
+        plan = queryset.order_by().explain()
+        self.assertNotIn("Seq Scan", plan)
+        self.assertTrue(
+            any(f"imovel_{name}_trgm_idx" in plan for name in names), plan
+        )
+
+    def test_combinations(self):
+        # as combinações mais comuns dos filtros do ImovelViewSet
+        combinations = {
+            "logradouro, numero, bairro": Imovel.objects.filter(
+                logradouro__iunaccent__trigram_similar="Rua Brusqué",
+                numero__iunaccent__icontains="10",
+                bairro__iunaccent__icontains="cêntro",
+            ),
+            "codigo, bairro": Imovel.objects.filter(
+                codigo__iunaccent__icontains="1000",
+                bairro__iunaccent__icontains="cêntro",
+            ),
+        }
+        for fields, queryset in combinations.items():
+            with self.subTest(fields):
+                self.assertUsesTrigramIndex(queryset, fields.split(", "))
+
+
+class CepViewTest(ApiTestCase):
+    authenticate = False
+
+    def setUp(self):
+        super().setUp()
+        self.backend = StubBackend(
+            [{"logradouro": "Rua Brusque", "numero": "10", "bairro": "Centro", "cep": "88301000"}]
+        )
+
+    def get(self, url, **params):
+        with mock.patch("eventapp.views.generics.get_backend", return_value=self.backend):
+            return self.client.get(url, params)
+
+    def test_anonymous_does_not_write_cache(self):
+        response = self.get("/api/cep/", logradouro="Rua Brusque", numeroLogradouro="10")
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(CepCache.objects.exists())
+
+    def test_cached_lookup(self):
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            response = self.get(
+                "/api/cep/", logradouro="Rua Brusque", numeroLogradouro="n 10", bairro="Centro"
+            )
+            self.assertEqual(response.data["cep"], "88301000")
+        entry = CepCache.objects.get()
+        self.assertEqual((entry.hits, entry.misses), (1, 1))
+
+    def test_buscacep_forwards_params(self):
+        with mock.patch("eventapp.views.generics.requests.get") as get:
+            get.return_value.ok = True
+            get.return_value.json.return_value = {"erro": False, "dados": []}
+            response = self.client.get(
+                "/api/buscacep/", {"logradouro": "R. Brusque", "uf": "SC", "localidade": "Itajai"}
+            )
+        self.assertEqual(response.data, {"erro": False, "dados": []})
+        params = get.call_args.kwargs["params"]
+        self.assertEqual((params["logradouro"], params["uf"]), ("brusque", "SC"))
+        self.assertFalse(CepCache.objects.exists())
+
+
+class CepEnrichmentTest(TestCase):
+    def test_missing_cep_only_active(self):
+        ativo = create_imovel("100001", "01.01.001.0001")
+        create_imovel("100002", "01.01.001.0002", ativo=False)
+        self.assertEqual(list(missing_cep_queryset()), [ativo])
+
+    def test_worker_skips_failed_job(self):
+        log = ImovelUpdateLog.objects.create()
+        job = ImovelUpdateJob.objects.create(log=log, file="imovel_update/vazio.xlsx")
+        command = ImportWorkerCommand(stdout=StringIO())
+        worker = "eventapp.management.commands.imovel_import_worker"
+        # a conexão do TestCase fica aberta
+        with mock.patch(f"{worker}.close_old_connections"), mock.patch(
+            f"{worker}.run_import_job",
+            side_effect=lambda job: fail_job(job, "planilha inválida"),
+        ), mock.patch.object(command, "enrich_cep") as enrich_cep:
+            command.handle(once=True, sleep=0, skip_cep=False)
+        enrich_cep.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.attempts), (ImovelUpdateJob.FALHOU, 1))
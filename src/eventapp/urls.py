@@ -7,6 +7,10 @@ router = routers.DefaultRouter()
 router.register(r"user", viewsets.UserViewSet, "user")
 router.register(r"userprofile", viewsets.UserProfileViewSet, "userprofile")
 router.register(r"imovel", viewsets.ImovelViewSet, "imovel")
+router.register(
+    r"imovelconflict", viewsets.ImovelConflictViewSet, "imovelconflict"
+)
+router.register(r"imovelchange", viewsets.ImovelChangeViewSet, "imovelchange")
 router.register(
     r"noticeeventtype", viewsets.NoticeEventTypeViewSet, "noticeeventtype"
 )
@@ -44,12 +48,65 @@ urlpatterns = [
         generics.update_imovel.as_view(),
         name="update-imovel",
     ),
+    path(
+        r"update-imovel/upload/",
+        generics.ImovelUploadView.as_view(),
+        name="update-imovel-upload",
+    ),
+    path(
+        r"update-imovel/upload/<uuid:upload_id>/",
+        generics.ImovelUploadDetailView.as_view(),
+        name="update-imovel-upload-detail",
+    ),
+    path(
+        r"update-imovel/upload/<uuid:upload_id>/finalize/",
+        generics.ImovelUploadFinalizeView.as_view(),
+        name="update-imovel-upload-finalize",
+    ),
+    path(
+        r"update-imovel/dry-run/",
+        generics.ImovelUpdateDryRunView.as_view(),
+        name="update-imovel-dry-run",
+    ),
+    path(
+        r"update-imovel/dry-run/<uuid:diff_id>/",
+        generics.ImovelUpdateDiffView.as_view(),
+        name="update-imovel-diff",
+    ),
     path(
         r"imovelupdatelog/",
         generics.ImovelUpdateLogView.as_view(),
         name="imovelupdatelog",
     ),
+    path(
+        r"imovelupdatelog/history/",
+        generics.ImovelUpdateLogHistoryView.as_view(),
+        name="imovelupdatelog-history",
+    ),
+    path(
+        r"imovelupdatelog/stream/",
+        generics.ImovelUpdateLogStreamView.as_view(),
+        name="imovelupdatelog-stream",
+    ),
+    path(
+        r"imovelupdatelog/stream/ticket/",
+        generics.ImovelUpdateLogStreamTicketView.as_view(),
+        name="imovelupdatelog-stream-ticket",
+    ),
+    path(
+        r"incompatible/match/",
+        generics.IncompatibleMatchView.as_view(),
+        name="incompatible-match",
+    ),
+    # antes do router, senão "autocomplete" vira o pk do imovel/<pk>/
+    path(
+        r"imovel/autocomplete/",
+        generics.ImovelAutocompleteView.as_view(),
+        name="imovel-autocomplete",
+    ),
     path(r"buscacep/", generics.buscacep.as_view(), name="buscacep"),
+    path(r"cep/", generics.CepView.as_view(), name="cep"),
+    path(r"cepcache/", generics.CepCacheView.as_view(), name="cepcache"),
 ]
 
 urlpatterns += [
@@ -1,7 +1,9 @@
+import hashlib
 import os
 import re
 import unicodedata
 from datetime import date, timedelta
+from decimal import Decimal
 
 from docx import Document
 
@@ -54,6 +56,27 @@ def text_to_id(text):
     return text
 
 
+def fingerprint(values):
+    """
+    Hash a sequence of values, ignoring decimal trailing zeros.
+
+    :param values: The values to hash.
+    :type values: Iterable.
+
+    :returns: The hexadecimal digest (32 characters).
+    :rtype: String.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        if value is None:
+            value = "\x00"
+        elif isinstance(value, Decimal):
+            value = format(value.normalize(), "f")
+        digest.update(str(value).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
 def add_days(from_date, number_of_days, business_days=False):
     to_date = from_date
     while number_of_days:
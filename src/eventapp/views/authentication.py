@@ -0,0 +1,46 @@
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from eventapp.models import ImovelStreamTicket
+
+
+def create_stream_ticket(user) -> ImovelStreamTicket:
+    now = timezone.now()
+    # os vencidos e não usados
+    ImovelStreamTicket.objects.filter(expires__lt=now).delete()
+    return ImovelStreamTicket.objects.create(
+        key=secrets.token_hex(32),
+        user=user,
+        expires=now + timedelta(seconds=settings.IMPORT_STREAM_TICKET_TTL),
+    )
+
+
+class StreamTicketAuthentication(BaseAuthentication):
+    """
+    Ticket no parâmetro "ticket" da url, para o EventSource do navegador,
+    que não envia o cabeçalho Authorization. O ticket vale uma conexão só.
+    """
+
+    def authenticate(self, request):
+        key = request.query_params.get("ticket", None)
+        if not key:
+            return None
+        ticket = (
+            ImovelStreamTicket.objects.select_related("user")
+            .filter(key=key, expires__gte=timezone.now())
+            .first()
+        )
+        # o delete decide, se duas conexões usarem o mesmo ticket
+        if not ticket or not ImovelStreamTicket.objects.filter(key=key).delete()[0]:
+            raise AuthenticationFailed("Ticket inválido ou já usado.")
+        if not ticket.user.is_active:
+            raise AuthenticationFailed("Usuário inativo.")
+        return (ticket.user, None)
+
+    def authenticate_header(self, request):
+        return "Ticket"
@@ -1,651 +1,653 @@
-import logging
-import os
-from datetime import datetime
-
-import pandas as pd
-import requests
-from django.conf import settings
-from django.contrib.auth.models import User
-from django.core import serializers
-from django.db import transaction
-from django.db.models import Q
-from django.utils import timezone
-from knox.auth import TokenAuthentication
-from knox.views import LoginView as KnoxLoginView
-from rest_framework import generics, permissions, status
-from rest_framework.authentication import BasicAuthentication
-from rest_framework.exceptions import ParseError, ValidationError
-from rest_framework.response import Response
-
-from eventapp.models import Imovel, ImovelUpdateLog
-from eventapp.serializers import (ChangePasswordSerializer,
-                                  ImovelUpdateLogSerializer, NoticeSerializer,
-                                  UserProfileSerializer)
-from eventapp.utils import text_to_id
-
-logger = logging.getLogger(__name__)
-
-
-def update_cep_imovel(imovel):
-    if not imovel:
-        return False
-
-    if imovel.cep:
-        if len(imovel.cep) >= 8:
-            return True
-
-    url_str = (
-        "https://buscacepinter.correios.com.br"
-        "/app"
-        "/localidade_logradouro"
-        "/carrega-localidade-logradouro.php"
-    )
-    logradouro = ""
-    if imovel.logradouro:
-        logradouro = imovel.logradouro.lower().strip()
-        if logradouro.startswith("r."):
-            logradouro = logradouro.replace("r.", "", 1).strip()
-        if logradouro.startswith("av."):
-            logradouro = logradouro.replace("av.", "", 1).strip()
-        if logradouro.endswith("bc."):
-            logradouro = "".join(logradouro.rsplit("bc.", 1)).strip()
-        if logradouro.endswith("jr"):
-            logradouro = "".join(logradouro.rsplit("jr", 1)).strip()
-        if logradouro.startswith("trav."):
-            logradouro = logradouro.replace("trav.", "", 1).strip()
-        if logradouro.endswith("rod."):
-            logradouro = "".join(logradouro.rsplit("rod.", 1)).strip()
-        if logradouro.endswith("bc"):
-            logradouro = "".join(logradouro.rsplit("bc", 1)).strip()
-
-    numero = ""
-    if imovel.numero:
-        numero = imovel.numero.lower().strip()
-        if numero.startswith("n"):
-            numero = numero.replace("n", "", 1).strip()
-        if numero == "s/n":
-            numero = ""
-
-    data = {
-        "uf": "SC",
-        "localidade": "Itajai",
-        "logradouro": logradouro,
-        "numeroLogradouro": numero,
-        "tipologradouro": "",
-    }
-
-    query_logradouro = Q(logradouro=imovel.logradouro)
-    query_numero = Q(numero=imovel.numero)
-    query_bairro = Q(bairro=imovel.bairro)
-    query_cep = Q(cep__isnull=False)
-    query = Q(
-        query_logradouro,
-        query_numero,
-        query_bairro,
-        query_cep,
-    )
-    imovel_with_cep = Imovel.objects.filter(query).first()
-    if imovel_with_cep:
-        if imovel_with_cep.cep:
-            if len(imovel_with_cep.cep) >= 8:
-                imovel.cep = imovel_with_cep.cep
-                imovel.save()
-                return True
-
-    try:
-        r = requests.post(url_str, data=data)
-
-        if r.ok:
-            jsonresponse = r.json()
-            if jsonresponse["total"] == 1:
-                imovel.cep = jsonresponse["dados"][0]["cep"]
-                imovel.save()
-            else:
-                ceps = []
-                for cep_data in jsonresponse["dados"]:
-                    if text_to_id(imovel.bairro) == text_to_id(
-                        cep_data["bairro"]
-                    ):
-                        ceps.append(cep_data["cep"])
-                if len(ceps) == 1:
-                    imovel.cep = ceps[0]
-                    imovel.save()
-        else:
-            print(r)
-    except Exception as e:
-        print('CEP: ', imovel.id, str(imovel))
-        print('CEP: ', "Falha request correios: " + e)
-    return True
-
-
-def get_dataframe_from_file(file, log: ImovelUpdateLog) -> pd.DataFrame:
-
-    print("Preparando arquivo")
-    log.state = 10
-    log.status = "Preparando"
-    log.response = "Preparando arquivo"
-    log.save()
-
-    columns_dict = {
-        'Código imóvel': 'codigo',
-        'Inscrição': 'inscricao_imobiliaria',
-        'Cód. contribuinte': 'numero_contribuinte',
-        'Logradouro': 'logradouro',
-        'Nº imóvel': 'numero',
-        'Nome do bairro': 'bairro',
-        'Complemento': 'complemento',
-        'Área do terreno m2': 'area_lote',
-        'Razão Social': 'razao_social',
-        'CNPJ CPF': 'cnpj_cpf',
-    }
-
-    dtype = {
-        'Código imóvel': str,
-        'Inscrição': str,
-        'Cód. contribuinte': str,
-        'Logradouro': str,
-        'Nº imóvel': str,
-        'Nome do bairro': str,
-        'Complemento': str,
-        'Área do terreno m2': str,
-        'Razão Social': str,
-        'CNPJ CPF': str,
-    }
-
-    try:
-        excel = pd.read_excel(
-            file,
-            dtype=dtype,
-            usecols=columns_dict.keys()
-        )
-        df = pd.DataFrame(excel).dropna(how='all')
-        df = df.where(df.notnull(), None)
-        df = df.rename(columns=columns_dict)
-
-        return df
-
-    except ValueError as e:
-        raise ParseError(e)
-
-
-def update_default_imovel(log: ImovelUpdateLog):
-    imovel_base = [
-        {
-            "name": "Sem imóvel",
-            "code": "000000",
-        },
-        {
-            "name": "Pessoa Física",
-            "code": "000001",
-        },
-        {
-            "name": "Pessoa Jurídica",
-            "code": "000002",
-        },
-    ]
-    for instance in imovel_base:
-        imovel_data = {
-            # common
-            "codigo_lote": instance["code"],
-            "logradouro": instance["name"],
-            "numero": "S/N",
-            # properties
-            "inscricao_imobiliaria": instance["code"],
-            "codigo": instance["code"],
-            "numero_contribuinte": instance["code"],
-        }
-        imovel = Imovel.objects.filter(inscricao_imobiliaria=instance["code"]).first()
-        if not imovel:
-            imovel = Imovel(**imovel_data)
-            imovel.save()
-    return True
-
-
-def create_imovel(imovel_data: pd.Series):
-    imovel = Imovel(**imovel_data)
-    imovel.imported = timezone.now()
-    imovel.save()
-    update_cep_imovel(imovel)
-
-
-def update_imovel_without_error(imovel: Imovel, imovel_data: pd.Series):
-    for attr, value in imovel_data.items():
-        setattr(imovel, attr, value)
-    imovel.imported = timezone.now()
-    imovel.save()
-    update_cep_imovel(imovel)
-
-
-def update_imovel_with_error(imovel,
-                             imovel_data: pd.Series,
-                             imovel_status,
-                             imovel_per_codigo,
-                             imovel_per_inscricao_imobiliaria):
-
-    alterados = 0
-    dest_folder = (settings.MEDIA_ROOT + "//temp_geoitajai")
-    filename = (f'{datetime.now().strftime("%Y-%m-%d")}-ERRORS.txt')
-    file_path_error = os.path.join(dest_folder, filename)
-    with open(file_path_error, "a", encoding="utf8") as f:
-        print(f'ERROR: {datetime.now().strftime("%d-%m-%Y")}')
-        f.write("=======ERROR=====\n")
-        f.write(datetime.now().strftime("%d-%m-%Y, %H:%M:%S")+"\n")
-        f.write(f'Imóvel com erro ({datetime.now().strftime("%d-%m-%Y")})')
-        if imovel_status == "novo_codigo":
-            f.write("Trocou de CÓDIGO:\n")
-            f.write("\n")
-        if imovel_status == "nova_inscricao":
-            f.write("Trocou de INSCRIÇÃO IMOBILIÁRIA:\n")
-            f.write("\n")
-        f.write("\n")
-        if imovel_per_codigo:
-            f.write("Dados do código:\n")
-            f.write(serializers.serialize("json", [imovel_per_codigo, ],))
-            f.write("\n")
-            f.write("\n")
-            if imovel_per_inscricao_imobiliaria:
-                f.write("Dados da inscrição imobiliária:\n")
-                f.write(serializers.serialize("json", [imovel_per_inscricao_imobiliaria, ],))
-                f.write("\n")
-                f.write("\n")
-            f.write("Dados no arquivo:\n")
-            f.write(str(imovel_data))
-            f.write("\n")
-            f.write("\n")
-            f.write("Tentativa de solição:\n")
-            imovel_per_codigo_check_address = False
-            imovel_per_inscricao_imobiliaria_check_address = False
-            if imovel_data:
-                if (imovel_per_codigo.logradouro == imovel_data["logradouro"] and
-                    imovel_per_codigo.numero == imovel_data["numero"] and
-                    imovel_per_codigo.bairro == imovel_data["bairro"] and
-                        imovel_per_codigo.complemento == imovel_data["complemento"]):
-                    imovel_per_codigo_check_address = True
-
-                if (imovel_per_inscricao_imobiliaria.logradouro == imovel_data["logradouro"] and
-                    imovel_per_inscricao_imobiliaria.numero == imovel_data["numero"] and
-                    imovel_per_inscricao_imobiliaria.bairro == imovel_data["bairro"] and
-                        imovel_per_inscricao_imobiliaria.complemento == imovel_data["complemento"]):
-                    imovel_per_inscricao_imobiliaria_check_address = True
-
-                if (imovel_per_codigo_check_address
-                        and not imovel_per_inscricao_imobiliaria_check_address):
-                    # conflito: prioridade imovel_per_codigo
-                    f.write("Código confere com o endereço\n")
-                    with transaction.atomic():
-                        imovel_per_inscricao_imobiliaria.inscricao_imobiliaria = "ERROR_CHANGE_" + \
-                            str(imovel_per_inscricao_imobiliaria.id) + \
-                            "_IN_FAVOR_OF_"+str(imovel_per_codigo.id)
-                        imovel_per_inscricao_imobiliaria.imported = timezone.now()
-                        imovel_per_inscricao_imobiliaria.save()
-                        f.write("Alterada a inscrição imobiliária do imóvel " +
-                                str(imovel_per_inscricao_imobiliaria.id)+"\n")
-                        for attr, value in imovel_data.items():
-                            setattr(imovel_per_codigo, attr, value)
-                        imovel_per_codigo.imported = timezone.now()
-                        imovel_per_codigo.save()
-                        f.write("Mantido o imóvel "+str(imovel_per_codigo.id)+"\n")
-                        alterados += 2
-                    f.write("Conflito resolvido\n")
-                elif (imovel_per_inscricao_imobiliaria_check_address
-                      and not imovel_per_codigo_check_address):
-                    # conflito: prioridade imovel_per_inscricao_imobiliaria
-                    f.write("Inscrição imobiliária confere com o endereço\n")
-                    with transaction.atomic():
-                        imovel_per_codigo.codigo = "ERROR_CHANGE_" + \
-                            str(imovel_per_codigo.id)+"_IN_FAVOR_OF_" + \
-                            str(imovel_per_inscricao_imobiliaria.id)
-                        imovel_per_codigo.imported = timezone.now()
-                        imovel_per_codigo.save()
-                        f.write("Alterado o código do imóvel "+str(imovel_per_codigo.id)+"\n")
-                        for attr, value in imovel_data.items():
-                            setattr(imovel_per_inscricao_imobiliaria, attr, value)
-                        imovel_per_inscricao_imobiliaria.imported = timezone.now()
-                        imovel_per_inscricao_imobiliaria.save()
-                        f.write("Mantido o imóvel "+str(imovel_per_inscricao_imobiliaria.id)+"\n")
-                        alterados += 2
-                    f.write("Conflito resolvido\n")
-                elif (imovel_per_codigo_check_address
-                      and imovel_per_inscricao_imobiliaria_check_address):
-                    # conflito: ambos com prioridade, fica imovel_per_inscricao_imobiliaria
-                    f.write(
-                        "Código e Inscrição imobiliária confere com o endereço, ambos com prioridade\n")
-                    f.write("Por definição, fica a inscrição imobiliária\n")
-                    with transaction.atomic():
-                        imovel_per_codigo.codigo = "ERROR_CHANGE_" + \
-                            str(imovel_per_codigo.id)+"_IN_FAVOR_OF_" + \
-                            str(imovel_per_inscricao_imobiliaria.id)
-                        imovel_per_codigo.imported = timezone.now()
-                        imovel_per_codigo.save()
-                        f.write("Alterado o código do imóvel "+str(imovel_per_codigo.id)+"\n")
-                        for attr, value in imovel_data.items():
-                            setattr(imovel_per_inscricao_imobiliaria, attr, value)
-                        imovel_per_inscricao_imobiliaria.imported = timezone.now()
-                        imovel_per_inscricao_imobiliaria.save()
-                        f.write("Mantido o imóvel "+str(imovel_per_inscricao_imobiliaria.id)+"\n")
-                        alterados += 2
-                    f.write("Conflito resolvido com ressalvas\n")
-                else:
-                    # conflito: sem prioridade, fica imovel_per_inscricao_imobiliaria
-                    f.write("Código e Inscrição imobiliária NÃO confere com o endereço, sem prioridade\n")
-                    f.write("Por definição, fica a inscrição imobiliária\n")
-                    with transaction.atomic():
-                        imovel_per_codigo.codigo = "ERROR_CHANGE_" + \
-                            str(imovel_per_codigo.id)+"_IN_FAVOR_OF_" + \
-                            str(imovel_per_inscricao_imobiliaria.id)
-                        imovel_per_codigo.imported = timezone.now()
-                        imovel_per_codigo.save()
-                        f.write("Alterado o código do imóvel "+str(imovel_per_codigo.id)+"\n")
-                        for attr, value in imovel_data.items():
-                            setattr(imovel_per_inscricao_imobiliaria, attr, value)
-                        imovel_per_inscricao_imobiliaria.imported = timezone.now()
-                        imovel_per_inscricao_imobiliaria.save()
-                        f.write("Mantido o imóvel "+str(imovel_per_inscricao_imobiliaria.id)+"\n")
-                        alterados += 2
-                    f.write("Conflito resolvido com ressalvas\n")
-                    f.write("Nenhum dos imóveis conferem com o endereço\n")
-            else:
-                f.write("Problema na leitura do arquivo")
-                f.write("Sem solução")
-            f.write("============\n")
-            f.write("\n")
-            f.write("\n")
-    return alterados
-
-
-def update_from_dataframe(df: pd.DataFrame, log: ImovelUpdateLog):
-
-    print("Lendo arquivo")
-    log.state = 20
-    log.status = "Lendo"
-    log.response = "Lendo arquivo"
-    log.total = 0
-    log.inalterados = 0
-    log.alterados = 0
-    log.novos = 0
-    log.falhas = 0
-    log.progresso = 0
-    log.save()
-
-    total = 0
-    inalterados = 0
-    alterados = 0
-    novos = 0
-    falhas = 0
-    total_rows = len(df.index)
-
-    for index, row in df.iterrows():
-        if total % 100 == 0:
-            log.state = 21
-            log.total = total
-            log.inalterados = inalterados
-            log.alterados = alterados
-            log.novos = novos
-            log.falhas = falhas
-            if total_rows and total_rows > 1:
-                log.progresso = index / total_rows
-            else:
-                log.progresso = 0
-            log.save()
-        if total % 1000 == 0:
-            print(f'''Lendo arquivo compactado:
-                    Total= {str(total)}
-                    Inalterados= {str(inalterados)}
-                    Alterados= {str(alterados)}
-                    Novos= {str(novos)}
-                    Falhas= {str(falhas)}''')
-        total += 1
-
-        try:
-
-            imovel = None
-            imovel_data = row
-
-            imovel_per_inscricao_imobiliaria = (
-                Imovel.objects.filter(
-                    inscricao_imobiliaria=imovel_data['inscricao_imobiliaria'],
-                ).first()
-            )
-
-            imovel_per_codigo = Imovel.objects.filter(
-                codigo=imovel_data["codigo"]
-            ).first()
-
-            imovel_status = "error"
-            if (imovel_per_codigo and imovel_per_inscricao_imobiliaria):
-                if (imovel_per_codigo.id == imovel_per_inscricao_imobiliaria.id):
-                    imovel_status = "ok"
-            else:
-                if imovel_per_codigo:
-                    imovel_status = "novo_codigo"
-                if imovel_per_inscricao_imobiliaria:
-                    imovel_status = "nova_inscricao"
-
-            if (
-                not imovel_per_codigo
-                and not imovel_per_inscricao_imobiliaria
-            ):
-                # create imovel
-                create_imovel(imovel_data)
-                novos += 1
-            else:
-                if (
-                    imovel_status == "ok"
-                    or imovel_status == "novo_codigo"
-                    or imovel_status == "nova_inscricao"
-                ):
-                    # update imovel, without error
-                    if imovel_per_codigo:
-                        imovel = imovel_per_codigo
-                    elif imovel_per_inscricao_imobiliaria:
-                        imovel = imovel_per_inscricao_imobiliaria
-                    if imovel:
-                        update_imovel_without_error(
-                            imovel,
-                            imovel_data
-                        )
-                        alterados += 1
-                else:
-                    # update imovel with error
-                    _alterados = update_imovel_with_error(imovel,
-                                                          imovel_data,
-                                                          imovel_status,
-                                                          imovel_per_codigo,
-                                                          imovel_per_inscricao_imobiliaria)
-                    if _alterados and _alterados > 0:
-                        alterados += _alterados
-                    else:
-                        print('ERROR')
-                        falhas += 1
-
-        except Exception as ex:
-            falhas += 1
-            logger.error(ex)
-
-    print(
-        "total: " + str(total),
-        " | inalterados: " + str(inalterados),
-        " | alterados: " + str(alterados),
-        " | novos: " + str(novos),
-        " | falhas: " + str(falhas),
-    )
-    print("Done!")
-    log.state = 99
-    log.total = total
-    log.inalterados = inalterados
-    log.alterados = alterados
-    log.novos = novos
-    log.falhas = falhas
-    log.progresso = 1
-    log.status = "Finalizado"
-    log.response = f'Imóveis atualizados ({str(novos)} novos e {str(alterados)} alterados)'
-    log.save()
-    return True
-
-
-class update_imovel(generics.ListCreateAPIView):
-    permission_classes = [
-        permissions.IsAdminUser,
-    ]
-
-    def post(self, request, *args, **kwargs):
-
-        file = request.FILES.get("file")
-        if not file:
-            raise ValidationError({'file': 'Campo obrigatório.'})
-
-        dest_folder = settings.MEDIA_ROOT + "//temp_geoitajai"
-        if not os.path.exists(dest_folder):
-            os.makedirs(dest_folder)
-
-        filename = (
-            datetime.now().strftime("%Y-%m-%d")
-            + "-update_imovel_running.txt"
-        )
-        file_update_imovel_running = os.path.join(dest_folder, filename)
-
-        if os.path.exists(file_update_imovel_running):
-            return Response(
-                {"detail": ("Migração de dados não pode ocorrer em paralelo")},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE,
-            )
-        else:
-            with open(file_update_imovel_running, "w"):
-                pass
-
-        print("Iniciando update")
-        log = ImovelUpdateLog(
-            state=0,
-            status="inicio",
-            response="Iniciando update",
-        )
-        log.save()
-
-        update_default_imovel(log)
-        df = get_dataframe_from_file(file, log)
-        update_from_dataframe(df, log)
-
-        if os.path.exists(file_update_imovel_running):
-            os.remove(file_update_imovel_running)
-
-        return Response(
-            {"detail": "Update iniciado. Por favor espere o update terminar para começar outro"},
-            status=status.HTTP_200_OK,
-        )
-
-
-class buscacep(generics.RetrieveAPIView):
-    permission_classes = [
-        permissions.AllowAny,
-    ]
-
-    def get(self, request, *args, **kwargs):
-        params = request.GET.copy()
-        logradouro = params["logradouro"].lower().strip()
-
-        if logradouro.startswith("r."):
-            logradouro = logradouro.replace("r.", "", 1).strip()
-        if logradouro.startswith("av."):
-            logradouro = logradouro.replace("av.", "", 1).strip()
-        if logradouro.endswith("bc."):
-            logradouro = "".join(logradouro.rsplit("bc.", 1)).strip()
-        if logradouro.endswith("jr"):
-            logradouro = "".join(logradouro.rsplit("jr", 1)).strip()
-        if logradouro.startswith("trav."):
-            logradouro = logradouro.replace("trav.", "", 1).strip()
-        if logradouro.endswith("rod."):
-            logradouro = "".join(logradouro.rsplit("rod.", 1)).strip()
-        if logradouro.endswith("bc"):
-            logradouro = "".join(logradouro.rsplit("bc", 1)).strip()
-
-        params["logradouro"] = logradouro
-        url_str = (
-            "https://buscacepinter.correios.com.br"
-            "/app"
-            "/localidade_logradouro"
-            "/carrega-localidade-logradouro.php"
-        )
-        r = requests.get(url_str, params=params)
-        if r.ok:
-            return Response(r.json(), status=status.HTTP_200_OK)
-        return Response(status=status.HTTP_404_NOT_FOUND)
-
-
-class LoginView(KnoxLoginView):
-    authentication_classes = [BasicAuthentication, TokenAuthentication]
-
-    def get(self, request, format=None):
-        content = {
-            "user": UserProfileSerializer(
-                request.user, context=self.get_context()
-            ).data
-        }
-        return Response(content)
-
-
-class ImovelUpdateLogView(generics.RetrieveAPIView):
-    permission_classes = [
-        permissions.IsAdminUser,
-    ]
-    serializer_class = ImovelUpdateLogSerializer
-
-    def get_object(self):
-        result = ImovelUpdateLog.objects.order_by("-datetime").all().first()
-        if result:
-            return result
-        else:
-            return None
-
-
-class ChangePasswordView(generics.UpdateAPIView):
-    model = User
-    permission_classes = [
-        permissions.IsAuthenticated,
-    ]
-    serializer_class = ChangePasswordSerializer
-
-    def get_object(self, queryset=None):
-        obj = self.request.user
-        return obj
-
-    def update(self, request, *args, **kwargs):
-        self.object = self.get_object()
-        serializer = self.get_serializer(data=request.data)
-
-        if serializer.is_valid():
-            if not self.object.check_password(
-                serializer.data.get("old_password")
-            ):
-                return Response(
-                    {"old_password": ["Senha incorreta."]},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            self.object.set_password(serializer.data.get("new_password"))
-            self.object.save()
-            response = {
-                "status": "success",
-                "code": status.HTTP_200_OK,
-                "message": "Senha atualizada com sucesso",
-                "data": [],
-            }
-            return Response(response)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-
-class UserLatestNotice(generics.RetrieveAPIView):
-    permission_classes = [
-        permissions.IsAuthenticated,
-    ]
-    serializer_class = NoticeSerializer
-
-    def get_object(self):
-
-        queryset = self.request.user.notices
-        imovel_id = self.request.query_params.get("imovel_id", None)
-        if imovel_id:
-            queryset = queryset.filter(imovel__id=imovel_id)
-        result = queryset.order_by("-notice_events__date").all().first()
-        if result:
-            return result
-        else:
-            return None
+import json
+import logging
+import os
+import time
+import uuid
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import TrigramDistance
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import NotSupportedError, transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from knox.auth import TokenAuthentication
+from knox.views import LoginView as KnoxLoginView
+from rest_framework import generics, permissions, status
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+
+from eventapp.cep import (CORREIOS_URL, CepCacheStore, choose_cep,
+                          clean_logradouro, get_backend, normalize_address)
+from eventapp.event_matching import (CANDIDATE_THRESHOLD, MARGIN, THRESHOLD,
+                                     match_incompatible_events)
+from eventapp.imovel_import import diff_file_path, dry_run_file
+from eventapp.imovel_upload import (append_chunk, delete_upload,
+                                    finalize_upload, imovel_upload_path,
+                                    move_upload, upload_file_name)
+from eventapp.lookups import CollateC, ImmutableUnaccent, ImovelAddress
+from eventapp.models import (CepCache, Imovel, ImovelUpdateJob,
+                             ImovelUpdateLog, ImovelUpload)
+from eventapp.serializers import (ChangePasswordSerializer,
+                                  ImovelUpdateLogSerializer,
+                                  ImovelUploadSerializer, NoticeSerializer,
+                                  UserProfileSerializer)
+from eventapp.utils import text_to_id
+from eventapp.views.authentication import (StreamTicketAuthentication,
+                                           create_stream_ticket)
+from eventapp.views.viewsets import LimitedResultsSetPagination
+
+logger = logging.getLogger(__name__)
+
+
+class update_imovel(generics.ListCreateAPIView):
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+
+    def post(self, request, *args, **kwargs):
+
+        file = request.FILES.get("file")
+        upload_id = request.data.get("upload")
+        if not file and not upload_id:
+            raise ValidationError({'file': 'Campo obrigatório.'})
+
+        if ImovelUpdateJob.objects.filter(
+            state__in=[ImovelUpdateJob.PENDENTE, ImovelUpdateJob.EXECUTANDO]
+        ).exists():
+            return Response(
+                {"detail": ("Migração de dados não pode ocorrer em paralelo")},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        print("Iniciando update")
+        with transaction.atomic():
+            log = ImovelUpdateLog(
+                state=0,
+                status="inicio",
+                response="Aguardando na fila de importação",
+            )
+            log.save()
+            if file:
+                ImovelUpdateJob.objects.create(log=log, file=file)
+            else:
+                upload = get_finalized_upload(
+                    ImovelUpload.objects.select_for_update(), upload_id
+                )
+                name = upload_file_name(upload)
+                upload.job = ImovelUpdateJob.objects.create(log=log, file=name)
+                upload.state = ImovelUpload.IMPORTADO
+                upload.save(update_fields=["job", "state", "updated"])
+                move_upload(upload, name)
+
+        return Response(
+            {
+                "detail": "Update iniciado. Por favor espere o update terminar para começar outro",
+                "id": log.id,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+def get_finalized_upload(queryset, upload_id):
+    try:
+        upload_id = uuid.UUID(str(upload_id))
+    except ValueError:
+        raise ValidationError({"upload": "Id inválido."})
+    upload = queryset.filter(id=upload_id, state=ImovelUpload.FINALIZADO).first()
+    if not upload:
+        raise ValidationError({"upload": "Upload não encontrado ou não finalizado."})
+    return upload
+
+
+class ImovelUploadView(generics.CreateAPIView):
+    """
+    Início do envio em partes de uma planilha grande para o update-imovel:
+    filename e, opcionalmente, size em bytes. As partes vão para
+    update-imovel/upload/<id>/ e o envio termina em
+    update-imovel/upload/<id>/finalize/ com o sha256 do arquivo.
+    """
+
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+    serializer_class = ImovelUploadSerializer
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+
+class ImovelUploadDetailView(generics.RetrieveDestroyAPIView):
+    """
+    GET mostra quantos bytes já foram recebidos, de onde o envio continua.
+    POST acrescenta uma parte (chunk, com offset igual aos bytes recebidos
+    e opcionalmente o sha256 da parte). DELETE cancela o envio.
+    """
+
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+    serializer_class = ImovelUploadSerializer
+    queryset = ImovelUpload.objects.all()
+    lookup_url_kwarg = "upload_id"
+
+    def post(self, request, upload_id, *args, **kwargs):
+        chunk = request.FILES.get("chunk")
+        if not chunk:
+            raise ValidationError({"chunk": "Campo obrigatório."})
+        try:
+            offset = int(request.data.get("offset"))
+        except (TypeError, ValueError):
+            raise ValidationError({"offset": "Campo obrigatório."})
+
+        with transaction.atomic():
+            upload = get_object_or_404(
+                ImovelUpload.objects.select_for_update(), id=upload_id
+            )
+            if upload.state != ImovelUpload.ABERTO:
+                return Response(
+                    {"detail": "Upload já finalizado"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            if offset != upload.received:
+                return Response(
+                    {
+                        "detail": "Offset diferente dos bytes recebidos",
+                        "received": upload.received,
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
+            if upload.size is not None and offset + chunk.size > upload.size:
+                raise ValidationError({"chunk": "Passa do tamanho informado."})
+            append_chunk(upload, chunk, request.data.get("sha256", ""))
+        return Response(self.get_serializer(upload).data)
+
+    def perform_destroy(self, instance):
+        if instance.state == ImovelUpload.IMPORTADO:
+            raise ValidationError({"detail": "Upload já importado."})
+        delete_upload(instance)
+
+
+class ImovelUploadFinalizeView(generics.GenericAPIView):
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+    serializer_class = ImovelUploadSerializer
+
+    def post(self, request, upload_id, *args, **kwargs):
+        checksum = request.data.get("sha256")
+        if not checksum:
+            raise ValidationError({"sha256": "Campo obrigatório."})
+        with transaction.atomic():
+            upload = get_object_or_404(
+                ImovelUpload.objects.select_for_update(), id=upload_id
+            )
+            if upload.state == ImovelUpload.ABERTO:
+                finalize_upload(upload, checksum)
+            elif upload.sha256 != checksum.lower():
+                raise ValidationError({"sha256": "Checksum do arquivo não confere."})
+        return Response(self.get_serializer(upload).data)
+
+
+class ImovelUpdateDryRunView(generics.GenericAPIView):
+    """
+    Simula o update-imovel com o arquivo enviado (file, ou o id de um
+    upload finalizado), sem gravar nada, e retorna o resumo. A diferença
+    por linha fica em update-imovel/dry-run/<diff>/.
+    """
+
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+
+    def post(self, request, *args, **kwargs):
+        file = request.FILES.get("file")
+        upload_id = request.data.get("upload")
+        if file:
+            summary, diff_id = dry_run_file(file)
+        elif upload_id:
+            upload = get_finalized_upload(ImovelUpload.objects, upload_id)
+            with open(imovel_upload_path(upload.id), "rb") as file:
+                summary, diff_id = dry_run_file(file)
+        else:
+            raise ValidationError({'file': 'Campo obrigatório.'})
+        summary["diff"] = diff_id
+        return Response(summary, status=status.HTTP_200_OK)
+
+
+class ImovelUpdateDiffView(generics.GenericAPIView):
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+
+    def get(self, request, diff_id, *args, **kwargs):
+        path = diff_file_path(diff_id.hex)
+        if not os.path.exists(path):
+            raise Http404
+        return FileResponse(
+            open(path, "rb"),
+            as_attachment=True,
+            filename=f"update-imovel-diff-{diff_id.hex}.csv",
+            content_type="text/csv",
+        )
+
+
+class IncompatibleMatchView(generics.GenericAPIView):
+    """
+    Liga aos imóveis, por similaridade do endereço, os avisos, vistorias e
+    relatórios sem imóvel. GET só simula, POST grava as atribuições; os dois
+    retornam a lista de eventos ambíguos para revisão. Parâmetros threshold,
+    margin e candidate_threshold, ver eventapp.event_matching.
+    """
+
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+
+    def get(self, request, *args, **kwargs):
+        return self.match(request, apply=False)
+
+    def post(self, request, *args, **kwargs):
+        return self.match(request, apply=True)
+
+    def match(self, request, apply):
+        params = {}
+        for name, default in (
+            ("threshold", THRESHOLD),
+            ("margin", MARGIN),
+            ("candidate_threshold", CANDIDATE_THRESHOLD),
+        ):
+            try:
+                params[name] = float(request.query_params.get(name, default))
+            except ValueError:
+                raise ValidationError({name: "Número inválido."})
+        try:
+            result = match_incompatible_events(apply=apply, **params)
+        except NotSupportedError as ex:
+            return Response(
+                {"detail": str(ex)}, status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class buscacep(generics.RetrieveAPIView):
+    """
+    Repassa a busca aos Correios, com todos os parâmetros, e retorna a
+    resposta deles como veio. A busca com o CepCache é a CepView.
+    """
+
+    permission_classes = [
+        permissions.AllowAny,
+    ]
+
+    def get(self, request, *args, **kwargs):
+        params = request.GET.copy()
+        params["logradouro"] = clean_logradouro(params["logradouro"])
+        try:
+            r = requests.get(CORREIOS_URL, params=params, timeout=settings.CEP_TIMEOUT)
+        except requests.RequestException as ex:
+            logger.error(ex)
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if r.ok:
+            return Response(r.json(), status=status.HTTP_200_OK)
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+
+class CepView(generics.RetrieveAPIView):
+    """
+    CEP de um endereço de Itajaí pelo CepCache, o mesmo da importação, e só
+    nos endereços que não estão nele pelo backend de CEP (CEP_BACKEND).
+    """
+
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+
+    def get(self, request, *args, **kwargs):
+        params = request.GET
+        key = normalize_address(
+            params.get("logradouro"),
+            params.get("numeroLogradouro"),
+            params.get("bairro"),
+        )
+        if not key[0]:
+            raise ValidationError({"logradouro": "Campo obrigatório."})
+
+        store = CepCacheStore()
+        entry = store.get(key)
+        if entry:
+            cep, dados = entry.cep, entry.dados
+        else:
+            backend = get_backend()
+            try:
+                dados = backend.lookup(key[0], key[1])
+            except Exception as ex:
+                logger.error(ex)
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            finally:
+                backend.close()
+            cep = choose_cep(dados, params.get("bairro"))
+            store.set(key, cep, dados)
+        return Response(
+            {"cep": cep or None, "total": len(dados), "dados": dados},
+            status=status.HTTP_200_OK,
+        )
+
+
+class CepCacheView(generics.RetrieveAPIView):
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+
+    def get(self, request, *args, **kwargs):
+        now = timezone.now()
+        result = CepCache.objects.aggregate(
+            entradas=Count("id"),
+            positivas=Count("id", filter=~Q(cep="")),
+            negativas=Count("id", filter=Q(cep="")),
+            expiradas=Count("id", filter=Q(expires__lte=now)),
+            hits=Coalesce(Sum("hits"), 0),
+            misses=Coalesce(Sum("misses"), 0),
+        )
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class ImovelAutocompleteView(generics.GenericAPIView):
+    """
+    Sugestões para o campo de imóvel do frontend, só id e name_string e sem
+    paginação (nem o COUNT). Termos só com dígitos buscam pelo prefixo do
+    código, os demais pelo endereço mais parecido. As respostas ficam no
+    cache por AUTOCOMPLETE_CACHE_TTL segundos, pelo termo normalizado.
+    """
+
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+    # colunas do name_string, todas no índice imovel_autocomplete_idx
+    fields = ("id", "codigo", "logradouro", "numero", "complemento", "bairro")
+    default_limit = 10
+    max_limit = 20
+    min_length = 2
+
+    def get_limit(self):
+        limit = self.request.query_params.get("limit", self.default_limit)
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError({"limit": "Deve ser um número inteiro"})
+        return max(1, min(limit, self.max_limit))
+
+    def get_queryset(self, term):
+        queryset = Imovel.objects.filter(ativo=True).only(*self.fields)
+
+        # LIKE 'x%' lido do índice imovel_autocomplete_idx (index-only), já
+        # na ordem dele, sem Sort
+        codigo = term.replace("_", "")
+        if codigo.isdigit():
+            return queryset.filter(codigo__startswith=codigo).order_by(
+                CollateC("codigo")
+            )
+
+        # como o ?address= do ImovelViewSet, em ordem do índice GiST
+        address = term.replace("_", " ")
+        return (
+            queryset.annotate(
+                endereco=ImovelAddress(),
+                distancia=TrigramDistance(
+                    ImmutableUnaccent(ImovelAddress()),
+                    ImmutableUnaccent(Value(address)),
+                ),
+            )
+            .filter(endereco__iunaccent__trigram_similar=address)
+            .order_by("distancia", "id")
+        )
+
+    def get(self, request, *args, **kwargs):
+        # sem acentos, minúsculas e sem pontuação: "Rua  Brusque," e
+        # "rua brusque" usam a mesma entrada do cache
+        term = text_to_id(request.query_params.get("search", "").strip())[:100]
+        if len(term.replace("_", "")) < self.min_length:
+            return Response([], status=status.HTTP_200_OK)
+
+        limit = self.get_limit()
+        key = f"imovel-autocomplete:{limit}:{term}"
+        results = cache.get(key)
+        if results is None:
+            results = [
+                {"id": imovel.id, "name_string": imovel.name_string}
+                for imovel in self.get_queryset(term)[:limit]
+            ]
+            cache.set(key, results, settings.AUTOCOMPLETE_CACHE_TTL)
+        return Response(results, status=status.HTTP_200_OK)
+
+
+class LoginView(KnoxLoginView):
+    authentication_classes = [BasicAuthentication, TokenAuthentication]
+
+    def get(self, request, format=None):
+        content = {
+            "user": UserProfileSerializer(
+                request.user, context=self.get_context()
+            ).data
+        }
+        return Response(content)
+
+
+class ImovelUpdateLogView(generics.RetrieveAPIView):
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+    serializer_class = ImovelUpdateLogSerializer
+
+    def get_object(self):
+        result = ImovelUpdateLog.objects.order_by("-datetime").all().first()
+        if result:
+            return result
+        else:
+            return None
+
+
+class ImovelUpdateLogHistoryView(generics.ListAPIView):
+    """
+    Importações anteriores, da mais recente, com as medidas de cada etapa
+    em etapas. ?state=99 lista só as concluídas.
+    """
+
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+    serializer_class = ImovelUpdateLogSerializer
+    pagination_class = LimitedResultsSetPagination
+
+    def get_queryset(self):
+        queryset = ImovelUpdateLog.objects.all()
+        state = self.request.query_params.get("state", None)
+        if state:
+            queryset = queryset.filter(state=state)
+        return queryset.order_by("-datetime_started", "-id")
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = "text/event-stream"
+    format = "txt"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class ImovelUpdateLogStreamTicketView(generics.GenericAPIView):
+    """
+    Ticket de uso único para abrir o imovelupdatelog/stream/ no EventSource
+    (?ticket=), no lugar do token do knox na url.
+    """
+
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+
+    def post(self, request, *args, **kwargs):
+        ticket = create_stream_ticket(request.user)
+        return Response(
+            {"ticket": ticket.key, "expires": ticket.expires},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class ImovelUpdateLogStreamView(generics.GenericAPIView):
+    """
+    Server-Sent Events com o estado e os contadores de um ImovelUpdateLog
+    (parâmetro id, por padrão o mais recente). Envia um evento "progress" a
+    cada mudança, e um comentário a cada heartbeat segundos sem mudança, até
+    a importação finalizar ou falhar ou por no máximo IMPORT_STREAM_LIFETIME
+    segundos, o tempo que um worker fica com o cliente. A conexão seguinte
+    continua do Last-Event-ID (ou ?last_event_id=), e responde 204 se o
+    cliente já tem o último estado de uma importação finalizada ou falha.
+    """
+
+    authentication_classes = [StreamTicketAuthentication, TokenAuthentication]
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+    fields = [
+        "id",
+        "state",
+        "status",
+        "response",
+        "total",
+        "inalterados",
+        "alterados",
+        "novos",
+        "falhas",
+        "rejeitados",
+        "conflitos",
+        "inativos",
+        "progresso",
+        "datetime",
+    ]
+    # em segundos
+    interval = 1
+    heartbeat = 15
+    # intervalo de reconexão do EventSource, em milissegundos
+    retry = 2000
+
+    def get_data(self, log_id):
+        return ImovelUpdateLog.objects.filter(id=log_id).values(*self.fields).first()
+
+    def get(self, request, *args, **kwargs):
+        log_id = request.query_params.get("id", None)
+        if not log_id:
+            log_id = (
+                ImovelUpdateLog.objects.order_by("-datetime")
+                .values_list("id", flat=True)
+                .first()
+            )
+        data = self.get_data(log_id) if log_id else None
+        if data is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        last_event_id = request.META.get(
+            "HTTP_LAST_EVENT_ID", request.query_params.get("last_event_id", "")
+        )
+        if last_event_id == event_id(data) and data["state"] in (99, -1):
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+        response = StreamingHttpResponse(
+            self.events(log_id, last_event_id), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def events(self, log_id, last_event_id):
+        yield f"retry: {self.retry}\n\n"
+        started = last_sent = time.monotonic()
+        while True:
+            data = self.get_data(log_id)
+            if data is None:
+                return
+            now = time.monotonic()
+            if event_id(data) != last_event_id:
+                last_event_id = event_id(data)
+                last_sent = now
+                yield (
+                    f"id: {last_event_id}\n"
+                    "event: progress\n"
+                    f"data: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+                )
+            elif now - last_sent >= self.heartbeat:
+                last_sent = now
+                yield ": keep-alive\n\n"
+            if (
+                data["state"] in (99, -1)
+                or now - started >= settings.IMPORT_STREAM_LIFETIME
+            ):
+                return
+            time.sleep(self.interval)
+
+
+def event_id(data) -> str:
+    # o datetime muda a cada gravação do log
+    return data["datetime"].isoformat()
+
+
+class ChangePasswordView(generics.UpdateAPIView):
+    model = User
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+    serializer_class = ChangePasswordSerializer
+
+    def get_object(self, queryset=None):
+        obj = self.request.user
+        return obj
+
+    def update(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+
+        if serializer.is_valid():
+            if not self.object.check_password(
+                serializer.data.get("old_password")
+            ):
+                return Response(
+                    {"old_password": ["Senha incorreta."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            self.object.set_password(serializer.data.get("new_password"))
+            self.object.save()
+            response = {
+                "status": "success",
+                "code": status.HTTP_200_OK,
+                "message": "Senha atualizada com sucesso",
+                "data": [],
+            }
+            return Response(response)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UserLatestNotice(generics.RetrieveAPIView):
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+    serializer_class = NoticeSerializer
+
+    def get_object(self):
+
+        queryset = self.request.user.notices
+        imovel_id = self.request.query_params.get("imovel_id", None)
+        if imovel_id:
+            queryset = queryset.filter(imovel__id=imovel_id)
+        result = queryset.order_by("-notice_events__date").all().first()
+        if result:
+            return result
+        else:
+            return None
@@ -1,9 +1,17 @@
+import json
+
 from django.contrib.auth.models import User
-from django.db.models import Case, Q, When
-from eventapp.models import (Activity, Imovel, Notice, NoticeColor,
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramDistance)
+from django.db import connections
+from django.db.models import Case, F, Q, Value, When
+from eventapp.lookups import ImmutableUnaccent, ImovelAddress
+from eventapp.models import (SEARCH_CONFIG, Activity, Imovel, ImovelChange,
+                             ImovelConflict, Notice, NoticeColor,
                              NoticeEventType, NoticeEventTypeFile, ReportEvent,
                              ReportEventType, SurveyEvent, SurveyEventType)
-from eventapp.serializers import (ActivitySerializer, ImovelSerializer,
+from eventapp.serializers import (ActivitySerializer, ImovelChangeSerializer,
+                                  ImovelConflictSerializer, ImovelSerializer,
                                   NoticeColorSerializer,
                                   NoticeEventTypeFileSerializer,
                                   NoticeEventTypeSerializer, NoticeSerializer,
@@ -16,7 +24,8 @@ from eventapp.utils import getDateFromString
 from eventapp.views.permissions import (IsAdminUserOrIsAuthenticatedReadOnly,
                                         IsAdminUserOrIsOwner,)
 from rest_framework import permissions, status, viewsets
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 
@@ -84,6 +93,54 @@ class LimitedResultsSetPagination(PageNumberPagination):
     max_page_size = 1000
 
 
+def estimate_count(queryset) -> int:
+    """Linhas estimadas pelo planejador (EXPLAIN), sem executar a consulta."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+class ImovelCursorPagination(CursorPagination):
+    """
+    Paginação por cursor na ordem (codigo, id) do índice
+    imovel_ativo_codigo_idx: cada página é um WHERE codigo > ... LIMIT, sem o
+    COUNT e o OFFSET da paginação por número de página. O total só vem com
+    ?count=true, contado até count_limit, ou ?count=estimate, estimado pelo
+    planejador (só no Postgres).
+    """
+
+    ordering = ("codigo", "id")
+    page_size = 11
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    count_limit = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        count = request.query_params.get("count", None)
+        if count == "estimate" and connections[queryset.db].vendor == "postgresql":
+            self.count = estimate_count(queryset)
+            self.count_tipo = "estimado"
+        elif count in ("true", "estimate"):
+            self.count = queryset.order_by()[: self.count_limit + 1].count()
+            self.count_tipo = "exato"
+            if self.count > self.count_limit:
+                self.count = self.count_limit
+                self.count_tipo = "mais_de"
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data["count"] = self.count
+            response.data["count_tipo"] = self.count_tipo
+        return response
+
+
 class ImovelViewSet(viewsets.ModelViewSet):
     permission_classes = [
         permissions.IsAuthenticated,
@@ -91,6 +148,24 @@ class ImovelViewSet(viewsets.ModelViewSet):
     serializer_class = ImovelSerializer
     queryset = Imovel.objects.all()
     pagination_class = LimitedResultsSetPagination
+    # resultados da busca ordenada por endereço (?address=)
+    ranked_limit = 100
+
+    @property
+    def paginator(self):
+        # ?pagination=cursor na lista, exceto nas buscas ordenadas por
+        # relevância (?search=, ?address=), que têm a ordem delas
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params
+            if (
+                params.get("pagination", None) == "cursor"
+                and not params.get("search", None)
+                and not params.get("address", None)
+            ):
+                self._paginator = ImovelCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def create(self, request, *args, **kwargs):
         return Response(status=status.HTTP_501_NOT_IMPLEMENTED)
@@ -98,9 +173,76 @@ class ImovelViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         return Response(status=status.HTTP_501_NOT_IMPLEMENTED)
 
+    # campos do Imovel.busca
+    search_fields = [
+        "codigo",
+        "inscricao_imobiliaria",
+        "razao_social",
+        "logradouro",
+        "numero",
+        "bairro",
+        "complemento",
+    ]
+
+    def search_fallback(self, queryset, search):
+        # sem o tsvector (fora do Postgres): cada termo em algum dos campos
+        for term in search.split():
+            query = Q()
+            for name in self.search_fields:
+                query |= Q(**{f"{name}__icontains": term})
+            queryset = queryset.filter(query)
+        return queryset.order_by("codigo", "id")
+
     def get_queryset(self):
 
-        queryset = Imovel.objects
+        # o tsvector do busca só é usado nos filtros
+        queryset = Imovel.objects.defer("busca")
+
+        # imóveis que saíram do cadastro só aparecem na lista com inativos=true
+        inativos = self.request.query_params.get("inativos", None)
+        if self.action == "list" and inativos != "true":
+            queryset = queryset.filter(ativo=True)
+
+        # gravado só com os dígitos e zeros à esquerda, pelo índice
+        # imovel_cnpj_cpf_idx
+        cnpj_cpf = self.request.query_params.get("cnpj_cpf", None)
+        if cnpj_cpf:
+            cnpj_cpf = Imovel.clean_cnpj_cpf(cnpj_cpf)
+            if not cnpj_cpf:
+                raise ValidationError({"cnpj_cpf": "CNPJ ou CPF inválido."})
+            queryset = queryset.filter(cnpj_cpf=cnpj_cpf)
+
+        # busca textual no Imovel.busca (código, inscrição, razão social e
+        # endereço), do mais relevante (ts_rank) ao menos relevante
+        search = self.request.query_params.get("search", None)
+        if search and self.action == "list":
+            if connections[queryset.db].vendor != "postgresql":
+                return self.search_fallback(queryset, search)
+            search_query = SearchQuery(
+                search, config=SEARCH_CONFIG, search_type="websearch"
+            )
+            return (
+                queryset.annotate(relevancia=SearchRank(F("busca"), search_query))
+                .filter(busca=search_query)
+                .order_by("-relevancia", "id")
+            )
+
+        # busca pelo endereço inteiro, do imóvel mais parecido ao menos
+        # parecido: a distância de trigramas (<->) sai em ordem do índice
+        # GiST imovel_endereco_gist_idx, que para no ranked_limit
+        address = self.request.query_params.get("address", None)
+        if address and self.action == "list":
+            return (
+                queryset.annotate(
+                    endereco=ImovelAddress(),
+                    distancia=TrigramDistance(
+                        ImmutableUnaccent(ImovelAddress()),
+                        ImmutableUnaccent(Value(address)),
+                    ),
+                )
+                .filter(endereco__iunaccent__trigram_similar=address)
+                .order_by("distancia", "id")[: self.ranked_limit]
+            )
 
         query = None
 
@@ -111,28 +253,28 @@ class ImovelViewSet(viewsets.ModelViewSet):
         query_logradouro = None
         street = self.request.query_params.get("street", None)
         if street:
-            query_logradouro = Q(logradouro__trigram_similar=street)
+            query_logradouro = Q(logradouro__iunaccent__trigram_similar=street)
 
         query_number = Q()
         number = self.request.query_params.get("number", None)
         if number:
-            query_number = Q(numero__unaccent__icontains=number)
+            query_number = Q(numero__iunaccent__icontains=number)
 
         query_complemento = Q()
         complemento = self.request.query_params.get("complemento", None)
         if complemento:
-            query_complemento = Q(complemento__unaccent__icontains=complemento)
+            query_complemento = Q(complemento__iunaccent__icontains=complemento)
 
         query_bairro = Q()
         bairro = self.request.query_params.get("bairro", None)
         if bairro:
-            query_bairro = Q(bairro__unaccent__icontains=bairro)
+            query_bairro = Q(bairro__iunaccent__icontains=bairro)
 
         query_codigo = None
         codigo = self.request.query_params.get("codigo", None)
 
         if codigo:
-            query_codigo = Q(codigo__unaccent__icontains=codigo)
+            query_codigo = Q(codigo__iunaccent__icontains=codigo)
 
         query_inscricao_imobiliaria = None
         inscricao_imobiliaria = self.request.query_params.get(
@@ -189,6 +331,44 @@ class ImovelViewSet(viewsets.ModelViewSet):
         )
 
 
+class ImovelConflictViewSet(viewsets.ReadOnlyModelViewSet):
+    permission_classes = [
+        permissions.IsAdminUser,
+    ]
+    serializer_class = ImovelConflictSerializer
+    pagination_class = LimitedResultsSetPagination
+
+    def get_queryset(self):
+        queryset = ImovelConflict.objects.all()
+        log_id = self.request.query_params.get("log", None)
+        if log_id:
+            queryset = queryset.filter(log_id=log_id)
+        resolucao = self.request.query_params.get("resolucao", None)
+        if resolucao:
+            queryset = queryset.filter(resolucao=resolucao)
+        return queryset.order_by("log", "id")
+
+
+class ImovelChangeViewSet(viewsets.ReadOnlyModelViewSet):
+    """Histórico de alterações feitas pelas importações, ?imovel=<id>"""
+
+    permission_classes = [
+        permissions.IsAuthenticated,
+    ]
+    serializer_class = ImovelChangeSerializer
+    pagination_class = LimitedResultsSetPagination
+
+    def get_queryset(self):
+        queryset = ImovelChange.objects.all()
+        imovel_id = self.request.query_params.get("imovel", None)
+        if imovel_id:
+            queryset = queryset.filter(imovel_id=imovel_id)
+        log_id = self.request.query_params.get("log", None)
+        if log_id:
+            queryset = queryset.filter(log_id=log_id)
+        return queryset.order_by("-id")
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [
         permissions.IsAuthenticated,
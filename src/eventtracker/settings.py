@@ -170,3 +170,37 @@ MEDIA_ROOT = "/static/media/"
 # MEDIA_ROOT = "static/media/"
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+
+
+# Processos usados na importação dos imóveis, 1 => sem paralelismo
+
+IMPORT_WORKERS = env.int('IMPORT_WORKERS', default=1)
+# no Postgres, importa por COPY numa tabela temporária (ignora IMPORT_WORKERS)
+IMPORT_COPY = env.bool('IMPORT_COPY', default=False)
+# pico de memória de cada etapa em ImovelUpdateLog.etapas, pelo tracemalloc
+# (deixa a importação de 2 a 4 vezes mais lenta)
+IMPORT_TRACE_MEMORY = env.bool('IMPORT_TRACE_MEMORY', default=False)
+
+
+# Busca de CEP dos imóveis, feita depois da importação
+
+CEP_BACKEND = env('CEP_BACKEND', default='eventapp.cep.CorreiosBackend')
+CEP_STUB_FILE = env('CEP_STUB_FILE', default='')
+CEP_WORKERS = env.int('CEP_WORKERS', default=4)
+CEP_RATE_LIMIT = env.float('CEP_RATE_LIMIT', default=5)
+CEP_TIMEOUT = env.float('CEP_TIMEOUT', default=10)
+CEP_RETRIES = env.int('CEP_RETRIES', default=2)
+# validade em dias do cache de CEP, e das buscas sem resultado
+CEP_CACHE_TTL = env.int('CEP_CACHE_TTL', default=180)
+CEP_CACHE_NEGATIVE_TTL = env.int('CEP_CACHE_NEGATIVE_TTL', default=7)
+
+
+# validade em segundos das sugestões do imovel/autocomplete/, no cache padrão
+# (sem CACHES, o LocMemCache de cada processo)
+
+AUTOCOMPLETE_CACHE_TTL = env.int('AUTOCOMPLETE_CACHE_TTL', default=30)
+
+# duração máxima em segundos de cada conexão do imovelupdatelog/stream/, o
+# tempo que ela ocupa um worker, e validade do ticket para abri-la
+IMPORT_STREAM_LIFETIME = env.int('IMPORT_STREAM_LIFETIME', default=120)
+IMPORT_STREAM_TICKET_TTL = env.int('IMPORT_STREAM_TICKET_TTL', default=30)